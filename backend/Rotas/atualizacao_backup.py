@@ -1,6 +1,7 @@
 # backend/Rotas/atualizacao_backup.py
 from flask import Blueprint, jsonify, request
 from ..db import get_db_connection, DATABASE_PATH
+from ..importacao import MODO_COMPLETO, MODOS_IMPORTACAO
 import sqlite3
 import os
 from datetime import datetime
@@ -71,7 +72,7 @@ def get_status_tabelas():
 def get_import_settings():
     conn = get_db_connection()
     try:
-        settings = conn.execute("SELECT tabela, caminho, arquivo FROM importacoes_bd ORDER BY tabela").fetchall()
+        settings = conn.execute("SELECT tabela, caminho, arquivo, modo_importacao, chaves_naturais, coluna_marca FROM importacoes_bd ORDER BY tabela").fetchall()
         return jsonify([dict(row) for row in settings])
     except sqlite3.Error as e:
         return jsonify({"message": f"Erro no banco de dados: {e}"}), 500
@@ -83,6 +84,12 @@ def update_import_settings():
     data = request.get_json()
     if not isinstance(data, list):
         return jsonify({"message": "Dados inválidos."}), 400
+    for item in data:
+        modo = item.get('modo_importacao') or MODO_COMPLETO
+        if modo not in MODOS_IMPORTACAO:
+            return jsonify({"message": f"Modo de importação inválido: '{modo}'."}), 400
+        if modo != MODO_COMPLETO and not (item.get('chaves_naturais') or '').strip():
+            return jsonify({"message": f"Informe as colunas da chave natural da tabela '{item.get('tabela')}' para a importação incremental."}), 400
 
     conn = get_db_connection()
     try:
@@ -100,10 +107,13 @@ def update_import_settings():
                     arquivo,
                     dates['dataatualizacao'],
                     dates['ultimobackup'],
-                    dates['dataatualizacaodados']
+                    dates['dataatualizacaodados'],
+                    item.get('modo_importacao') or MODO_COMPLETO,
+                    item.get('chaves_naturais') or None,
+                    item.get('coluna_marca') or None
                 ))
             conn.executemany(
-                'INSERT INTO importacoes_bd (tabela, caminho, arquivo, dataatualizacao, ultimobackup, dataatualizacaodados) VALUES (?, ?, ?, ?, ?, ?)',
+                'INSERT INTO importacoes_bd (tabela, caminho, arquivo, dataatualizacao, ultimobackup, dataatualizacaodados, modo_importacao, chaves_naturais, coluna_marca) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
                 rows_to_insert
             )
         conn.commit()
@@ -123,7 +133,8 @@ def executar_atualizacao():
     tabelas = data.get('tabelas')
     
     lista_para_atualizar = None if tabelas == 'all' else tabelas
-    sucesso, detalhes = atualizacaodb.atualizar_tabelas(lista_para_atualizar)
+    # Arquivos sem alteração são ignorados, a menos que a importação seja forçada.
+    sucesso, detalhes = atualizacaodb.atualizar_tabelas(lista_para_atualizar, forcar=bool(data.get('forcar')))
     
     end_time = time.time()
     tempo_execucao = f"{end_time - start_time:.2f}s"
@@ -132,6 +143,7 @@ def executar_atualizacao():
     response = {
         "tempo_execucao": tempo_execucao,
         "erros": erros,
+        "ignoradas": sum(1 for d in detalhes if d.get('ignorada')),
         "detalhes": detalhes
     }
     
@@ -1,9 +1,16 @@
 # backend/Rotas/atualizacaodb.py
 import sqlite3
-import pandas as pd
 import os
+import time
 from datetime import datetime
 from ..db import get_db_connection
+from ..indices import garantir_indices
+from ..derivados import tabelas_alteradas
+from ..importacao import (
+    importar_varios, colunas_da_chave, MODO_INCREMENTAL,
+    arquivo_inalterado, registrar_arquivo, configuracao_importacao
+)
+from ..dicionario_valores import atualizar_dicionarios
 
 def count_rows(conn, table_name):
     try:
@@ -11,13 +18,15 @@ def count_rows(conn, table_name):
     except sqlite3.Error:
         return 0
 
-def atualizar_tabelas(lista_tabelas=None):
+def atualizar_tabelas(lista_tabelas=None, forcar=False):
     """
     Atualiza tabelas no banco de dados a partir de arquivos de origem.
     
     Args:
         lista_tabelas (list, optional): Uma lista de nomes de tabelas para atualizar.
                                         Se None, atualiza todas as tabelas configuradas.
+        forcar (bool): Importa também os arquivos sem alteração desde a última importação
+                       (por padrão eles são ignorados).
                                         
     Returns:
         tuple: (bool, str) indicando sucesso/falha e uma mensagem de resultado.
@@ -29,7 +38,7 @@ def atualizar_tabelas(lista_tabelas=None):
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        query = "SELECT tabela, caminho, arquivo FROM importacoes_bd"
+        query = "SELECT tabela, caminho, arquivo, modo_importacao, chaves_naturais, coluna_marca FROM importacoes_bd"
         params = ()
         if lista_tabelas:
             placeholders = ','.join('?' for _ in lista_tabelas)
@@ -42,42 +51,77 @@ def atualizar_tabelas(lista_tabelas=None):
             return True, [{"tabela": "N/A", "status": "warning", "mensagem_atualizacao": "Nenhuma configuração encontrada.", "detalhamento": "-"}]
 
         results = []
+        tarefas = [] # Arquivos a importar, lidos em paralelo por `importar_varios`
+        tabelas_com_alteracao = []
+        arquivos_importados = [] # (tabela, caminho, impressão), registrados no fim
         for config in configuracoes:
-            tabela_destino, caminho_pasta, nome_arquivo = config
+            tabela_destino, caminho_pasta, nome_arquivo, modo_importacao, chaves_naturais, coluna_marca = config
             caminho_completo = os.path.join(caminho_pasta, nome_arquivo)
             
             result_item = {"tabela": tabela_destino, "status": "error", "mensagem_atualizacao": "", "detalhamento": ""}
-            
-            linhas_antes = count_rows(conn, tabela_destino)
+            results.append(result_item)
 
             if not os.path.exists(caminho_completo):
                 # CORREÇÃO: Trata "arquivo não encontrado" como um erro.
                 result_item['status'] = 'error'
                 result_item['mensagem_atualizacao'] = '❌ Arquivo de origem não encontrado.'
                 result_item['detalhamento'] = 'Dados não atualizados.'
-                results.append(result_item)
                 continue
 
             try:
                 mod_time = os.path.getmtime(caminho_completo)
                 data_modificacao_arquivo = datetime.fromtimestamp(mod_time).strftime('%d/%m/%Y %H:%M:%S')
 
-                _, ext = os.path.splitext(caminho_completo)
-                df = pd.read_excel(caminho_completo) if ext.lower() in ['.xlsx', '.xls'] else pd.read_csv(caminho_completo, sep=';', encoding='utf-8')
-                
-                df.dropna(axis=1, how='all', inplace=True)
-                df.to_sql(tabela_destino, conn, if_exists='replace', index=False)
-                
-                linhas_depois = len(df)
-                diferenca = linhas_depois - linhas_antes
-                
-                data_hora_execucao = datetime.now().strftime('%d/%m/%Y %H:%M:%S')
-                cursor.execute(
-                    "UPDATE importacoes_bd SET dataatualizacao = ?, dataatualizacaodados = ? WHERE tabela = ?",
-                    (data_hora_execucao, data_modificacao_arquivo, tabela_destino)
+                # Arquivo, tabela e configuração iguais aos da última importação: nada a fazer.
+                inalterado, impressao = arquivo_inalterado(
+                    conn, tabela_destino, caminho_completo,
+                    configuracao_importacao(modo_importacao, chaves_naturais, coluna_marca)
                 )
-                conn.commit()
+                if inalterado and not forcar:
+                    result_item['status'] = 'success'
+                    result_item['ignorada'] = True
+                    result_item['mensagem_atualizacao'] = '✅ Arquivo sem alterações desde a última importação.'
+                    result_item['detalhamento'] = 'Importação ignorada; os dados da tabela já estão atualizados.'
+                    continue
+
+                chaves = None
+                if modo_importacao == MODO_INCREMENTAL:
+                    # Só as linhas novas, alteradas ou removidas (pela chave natural) são gravadas.
+                    chaves = colunas_da_chave(chaves_naturais)
+                    if not chaves:
+                        raise ValueError("a importação incremental precisa das colunas da chave natural")
+
+                tarefas.append({
+                    'tabela': tabela_destino, 'caminho': caminho_completo, 'chaves': chaves, 'coluna_marca': coluna_marca,
+                    'hash': impressao['hash'], # Já calculado por arquivo_inalterado: a leitura não refaz o hash
+                    'resultado': result_item, 'impressao': impressao, 'data_modificacao': data_modificacao_arquivo,
+                    'linhas_antes': count_rows(conn, tabela_destino)
+                })
+
+            except Exception as e:
+                result_item['mensagem_atualizacao'] = f'❌ Erro: {e}.'
+                result_item['detalhamento'] = 'A operação falhou. Os dados anteriores da tabela foram mantidos.'
+
+        # Leitura em lotes numa carga por arquivo (vários arquivos ao mesmo tempo, em processos
+        # separados); cada carga é aplicada aqui, uma tabela de cada vez, na ordem das dependências.
+        # As colunas de data ganham a versão ISO (`<coluna>_iso`) a cada lote.
+        for tarefa, importacao, tempos in importar_varios(conn, tarefas):
+            tabela_destino = tarefa['tabela']
+            result_item = tarefa['resultado']
+            if isinstance(importacao, Exception):
+                # A carga não chegou à tabela.
+                result_item['mensagem_atualizacao'] = f'❌ Erro: {importacao}.'
+                result_item['detalhamento'] = 'A operação falhou. Os dados anteriores da tabela foram mantidos.'
+            else:
+                # A carga já foi gravada (commit): a tabela conta como alterada (versão, resumos,
+                # dicionários, registro do arquivo) mesmo que um dos passos seguintes falhe.
+                arquivos_importados.append((tabela_destino, tarefa['caminho'], tarefa['impressao']))
+                alteradas = importacao['inseridas'] + importacao['atualizadas'] + importacao['removidas']
+                if importacao['modo'] != MODO_INCREMENTAL or alteradas:
+                    tabelas_com_alteracao.append(tabela_destino)
 
+                linhas_depois = importacao['linhas']
+                diferenca = linhas_depois - tarefa['linhas_antes']
                 result_item['status'] = 'success'
                 result_item['mensagem_atualizacao'] = f'✅ Dados atualizados com sucesso ({linhas_depois} linhas).'
                 if diferenca > 0:
@@ -86,12 +130,59 @@ def atualizar_tabelas(lista_tabelas=None):
                     result_item['detalhamento'] = f'{abs(diferenca)} linhas a menos que a versão anterior.'
                 else:
                     result_item['detalhamento'] = 'Mesmo número de linhas que a versão anterior.'
+                if tarefa['chaves'] is not None and importacao['modo'] == MODO_INCREMENTAL:
+                    result_item['detalhamento'] = (
+                        f"Importação incremental: {importacao['inseridas']} inseridas, "
+                        f"{importacao['atualizadas']} atualizadas, {importacao['removidas']} removidas."
+                    )
+                elif tarefa['chaves'] is not None:
+                    result_item['detalhamento'] += f" Importação completa ({importacao['motivo']})."
 
-            except Exception as e:
-                result_item['mensagem_atualizacao'] = f'❌ Erro: {e}.'
-                result_item['detalhamento'] = 'A operação falhou. A tabela pode estar em um estado inconsistente.'
-            
-            results.append(result_item)
+                pendencias = []
+                # Se a tabela foi recriada, os índices também precisam ser.
+                inicio = time.perf_counter()
+                try:
+                    garantir_indices(conn, [tabela_destino])
+                except sqlite3.Error as e:
+                    if conn.in_transaction:
+                        conn.rollback()
+                    pendencias.append(f'os índices não foram recriados ({e})')
+                tempos['gravacao'] += time.perf_counter() - inicio
+
+                try:
+                    data_hora_execucao = datetime.now().strftime('%d/%m/%Y %H:%M:%S')
+                    cursor.execute(
+                        "UPDATE importacoes_bd SET dataatualizacao = ?, dataatualizacaodados = ? WHERE tabela = ?",
+                        (data_hora_execucao, tarefa['data_modificacao'], tabela_destino)
+                    )
+                    conn.commit()
+                except sqlite3.Error as e:
+                    if conn.in_transaction:
+                        conn.rollback()
+                    pendencias.append(f'a data da importação não foi registrada ({e})')
+
+                if pendencias:
+                    result_item['status'] = 'warning'
+                    result_item['mensagem_atualizacao'] = (
+                        f"⚠️ Dados atualizados ({linhas_depois} linhas), mas {' e '.join(pendencias)}."
+                    )
+
+            # Leitura do arquivo (no processo de leitura), espera por ela e gravação no banco, em segundos.
+            # Com 'leitura_em_cache', o arquivo não foi lido: a carga veio do cache das cargas.
+            result_item['tempos'] = {
+                'leitura_s': round(tempos['leitura'], 2) if tempos['leitura'] is not None else None,
+                'espera_s': round(tempos['espera'], 2),
+                'gravacao_s': round(tempos['gravacao'], 2),
+                'leitura_em_cache': tempos['cache'],
+            }
+
+        # Reconstrói as estruturas derivadas das tabelas importadas (resumos, hierarquias).
+        # Tabelas incrementais sem nenhuma diferença mantêm a versão (e o cache das rotas).
+        tabelas_alteradas(conn, tabelas_com_alteracao, normalizar_datas=False)
+        atualizar_dicionarios(conn, tabelas_com_alteracao) # Valores dos filtros do BI
+        # Depois da troca de versão: o registro guarda a versão que a tabela ficou.
+        for tabela, caminho, impressao in arquivos_importados:
+            registrar_arquivo(conn, tabela, caminho, impressao)
         
         return True, results
 
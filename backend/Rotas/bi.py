@@ -1,24 +1,32 @@
 # backend/Rotas/bi.py
-from flask import Blueprint, jsonify, request
-from ..db import get_db_connection
+from flask import Blueprint, jsonify, request, Response, stream_with_context, current_app
+from ..db import get_db_connection, get_db_read_connection, conexao_do_pool, PAPEL_LEITURA
 import sqlite3
 import json
+import base64
+import hashlib
+import sys
 import traceback
-from collections import deque # Import deque for a more efficient queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque, OrderedDict # Import deque for a more efficient queue
+from ..derivados import tabelas_alteradas
+from ..versoes_dados import versoes, versoes_por_tabela
+from ..catalogo_esquema import colunas_por_tabela, colunas_da_tabela
+from ..datas import coluna_sombra
+from ..dicionario_valores import obter_dicionario, termo_suportado, LIMITE_RESULTADOS
+from ..governador_consultas import (
+    ConsultaRejeitada, OrcamentoTempo, verificar_plano, executar_consulta, registrar_consulta,
+    consultas_registradas, TEMPO_CONSULTA_LENTA
+)
 
 bp = Blueprint('bi', __name__, url_prefix='/api/bi')
 
 # --- Funções de Validação e Utilitários ---
 
 def get_valid_tables_and_columns(conn):
-    """Busca e retorna um dicionário com todas as tabelas e suas colunas válidas no banco."""
-    tables_and_columns = {}
-    tables = conn.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()
-    for table in tables:
-        table_name = table['name']
-        columns_info = conn.execute(f"PRAGMA table_info('{table_name}')").fetchall()
-        tables_and_columns[table_name] = {col['name'] for col in columns_info}
-    return tables_and_columns
+    """Retorna um dicionário com todas as tabelas e suas colunas válidas no banco (do catálogo em memória)."""
+    return colunas_por_tabela(conn)
 
 # --- NOVA E MELHORADA FUNÇÃO find_join_path ---
 def find_join_path(start_table, required_tables, relationships):
@@ -322,6 +330,7 @@ def update_bi_tables():
         conn.execute('DELETE FROM bi_tables')
         if tabelas: conn.executemany("INSERT INTO bi_tables (tabela) VALUES (?)", [(t['name'],) for t in tabelas])
         conn.commit()
+        tabelas_alteradas(conn, ['bi_tables']) # Descarta os planos dos visuais em cache
         return jsonify({"message": "Modelo de dados do BI atualizado com sucesso!"}), 200
     except sqlite3.Error as e:
         conn.rollback(); return jsonify({"message": f"Erro no banco de dados: {e}"}), 500
@@ -329,34 +338,41 @@ def update_bi_tables():
 
 @bp.route('/table-schema/<string:table_name>', methods=['GET'])
 def get_table_schema(table_name):
-    conn = get_db_connection()
+    conn = get_db_read_connection()
     try:
-        valid_tables = get_valid_tables_and_columns(conn)
-        if table_name not in valid_tables:
+        columns = colunas_da_tabela(conn, table_name)
+        if columns is None:
             return jsonify({"message": f"Tabela '{table_name}' não encontrada ou inválida."}), 404
-        
-        cursor = conn.cursor()
-        cursor.execute(f"PRAGMA table_info('{table_name}')")
-        columns = [{'name': row['name'], 'type': row['type']} for row in cursor.fetchall()]
-        return jsonify({"columns": columns})
+        # As colunas de data `_iso` são internas; o usuário escolhe a coluna original.
+        return jsonify({"columns": [col for col in columns if not coluna_sombra(table_name, col['name'])]})
     finally: conn.close()
 
 @bp.route('/column-distinct-values/<string:table_name>/<string:column_name>', methods=['GET'])
 def get_column_distinct_values(table_name, column_name):
     search_term = request.args.get('search', None)
-    conn = get_db_connection()
+    conn = get_db_read_connection()
     try:
         valid_tables_and_columns = get_valid_tables_and_columns(conn)
         if table_name not in valid_tables_and_columns or column_name not in valid_tables_and_columns[table_name]:
             return jsonify({"message": "Nome de tabela ou coluna inválido."}), 400
 
+        # Responde pelo dicionário de valores em memória; a consulta abaixo fica para colunas
+        # com valores distintos demais e buscas com os curingas do LIKE.
+        dicionario = obter_dicionario(conn, table_name, column_name) if termo_suportado(search_term) else None
+        if dicionario is not None:
+            indices = dicionario.buscar(search_term)
+            resposta = {"values": [dicionario.valores[i] for i in indices]}
+            if request.args.get('com_contagem'):
+                resposta["counts"] = [dicionario.contagens[i] for i in indices]
+            return jsonify(resposta)
+
         params = []
         where_clause = ""
         if search_term:
             where_clause = f'WHERE "{column_name}" LIKE ?'
             params.append(f"%{search_term}%")
 
-        query = f'SELECT DISTINCT "{column_name}" FROM "{table_name}" {where_clause} ORDER BY 1 ASC LIMIT 200'
+        query = f'SELECT DISTINCT "{column_name}" FROM "{table_name}" {where_clause} ORDER BY 1 ASC LIMIT {LIMITE_RESULTADOS}'
         
         values = [row[0] for row in conn.execute(query, params).fetchall()]
         return jsonify({"values": values})
@@ -392,165 +408,635 @@ def save_relationships():
             rows = [(r['fromTable'], r['fromColumn'], r['toTable'], r['toColumn']) for r in rels]
             conn.executemany("INSERT INTO bi_relacionamentos (tabela_origem, coluna_origem, tabela_destino, coluna_destino) VALUES (?, ?, ?, ?)", rows)
         conn.commit()
+        tabelas_alteradas(conn, ['bi_relacionamentos']) # Descarta os planos dos visuais em cache
         return jsonify({"message": "Relacionamentos salvos com sucesso!"}), 200
     except sqlite3.Error as e:
         conn.rollback(); return jsonify({"message": f"Erro no banco de dados: {e}"}), 500
     finally: conn.close()
 
 # --- ROTA DE DADOS DO VISUAL ---
-def build_filter_clause(filters, params):
-    if not filters: return "", []
-    conditions = []
-    for f in filters:
+AGG_MAP = {'sum': 'SUM', 'average': 'AVG', 'count': 'COUNT', 'countd': 'COUNT(DISTINCT', 'min': 'MIN', 'max': 'MAX'}
+DATA_FIELD_KEYS = ['value', 'values', 'xAxis', 'yAxis', 'legend', 'minValue', 'maxValue', 'columns', 'rows', 'columnValues']
+
+# Operadores da filtragem avançada que recebem um valor (e como o valor vira parâmetro).
+NUMERIC_OPS = ['>', '<', '>=', '<=', 'igual', 'diferente']
+ADVANCED_OPS_SQL = {
+    'contem': '{col} LIKE ?',
+    'nao_contem': '({col} NOT LIKE ? OR {col} IS NULL)',
+    'igual': '{col} = ?',
+    'diferente': '({col} != ? OR {col} IS NULL)',
+    'nulo': '{col} IS NULL',
+    'nao_nulo': '{col} IS NOT NULL',
+    '>': '{col} > ?',
+    '<': '{col} < ?',
+    '>=': '{col} >= ?',
+    '<=': '{col} <= ?',
+}
+
+def _advanced_param(op, val):
+    if op in NUMERIC_OPS:
+        try:
+            return float(val)
+        except (ValueError, TypeError):
+            return val
+    if op in ('contem', 'nao_contem'):
+        return f"%{val}%"
+    return val
+
+def compile_filter_clause(filters):
+    """
+    Monta as condições dos filtros sem os valores.
+    Retorna (condições, slots): cada slot indica de onde vem o parâmetro na requisição:
+    (índice do filtro, None, 'valores') para os valores selecionados ou
+    (índice do filtro, índice do filtro avançado, operador).
+    """
+    conditions, slots = [], []
+    for i, f in enumerate(filters):
         if f.get('isAggregated'):
-            agg_map = {'sum': 'SUM', 'average': 'AVG', 'count': 'COUNT', 'countd': 'COUNT(DISTINCT', 'min': 'MIN', 'max': 'MAX'}
-            agg_func = agg_map.get(f.get('aggregation'), 'COUNT')
+            agg_func = AGG_MAP.get(f.get('aggregation'), 'COUNT')
             col_ref = f'{agg_func}("{f["tableName"]}"."{f["originalColumn"]}"{")" if f.get("aggregation") == "countd" else ""})'
         else:
             col_ref = f'"{f["tableName"]}"."{f["columnName"]}"'
-        
+
         cfg = f.get('filterConfig', {})
 
         if cfg.get('type') == 'basica' and cfg.get('selectedValues'):
             placeholders = ', '.join(['?'] * len(cfg['selectedValues']))
             conditions.append(f"{col_ref} IN ({placeholders})")
-            params.extend(cfg['selectedValues'])
+            slots.append((i, None, 'valores'))
         elif cfg.get('type') == 'avancada' and cfg.get('advancedFilters'):
-            for adv_filter in cfg['advancedFilters']:
-                op, val = adv_filter.get('condition'), adv_filter.get('value')
-                
-                numeric_ops = ['>', '<', '>=', '<=', 'igual', 'diferente']
-                if op in numeric_ops:
-                    try:
-                        val = float(val)
-                    except (ValueError, TypeError):
-                        pass
-
-                if op == 'contem': conditions.append(f"{col_ref} LIKE ?"); params.append(f"%{val}%")
-                elif op == 'nao_contem': conditions.append(f"({col_ref} NOT LIKE ? OR {col_ref} IS NULL)"); params.append(f"%{val}%")
-                elif op == 'igual': conditions.append(f"{col_ref} = ?"); params.append(val)
-                elif op == 'diferente': conditions.append(f"({col_ref} != ? OR {col_ref} IS NULL)"); params.append(val)
-                elif op == 'nulo': conditions.append(f"{col_ref} IS NULL")
-                elif op == 'nao_nulo': conditions.append(f"{col_ref} IS NOT NULL")
-                elif op == '>': conditions.append(f"{col_ref} > ?"); params.append(val)
-                elif op == '<': conditions.append(f"{col_ref} < ?"); params.append(val)
-                elif op == '>=': conditions.append(f"{col_ref} >= ?"); params.append(val)
-                elif op == '<=': conditions.append(f"{col_ref} <= ?"); params.append(val)
-    return " AND ".join(conditions), params
+            for j, adv_filter in enumerate(cfg['advancedFilters']):
+                op = adv_filter.get('condition')
+                if op not in ADVANCED_OPS_SQL:
+                    continue
+                conditions.append(ADVANCED_OPS_SQL[op].format(col=col_ref))
+                if '?' in ADVANCED_OPS_SQL[op]:
+                    slots.append((i, j, op))
+    return " AND ".join(conditions), slots
+
+def bind_filter_params(filters, slots):
+    """Preenche, na ordem dos slots, os parâmetros dos filtros da requisição."""
+    params = []
+    for i, j, op in slots:
+        cfg = filters[i].get('filterConfig', {})
+        if op == 'valores':
+            params.extend(cfg['selectedValues'])
+        else:
+            params.append(_advanced_param(op, cfg['advancedFilters'][j].get('value')))
+    return params
+
+def _fields_of_visual(visual_config):
+    fields_to_select = []
+    for key, field_value in visual_config.items():
+        if key in DATA_FIELD_KEYS:
+            items = field_value if isinstance(field_value, list) else ([field_value] if isinstance(field_value, dict) and 'tableName' in field_value else [])
+            for item in items:
+                if item and 'tableName' in item:
+                    fields_to_select.append(item)
+    return fields_to_select
+
+def _split_filters(all_filters):
+    where_filters = [f for f in all_filters if not f.get('isAggregated') and f.get('filterConfig', {}).get('type') != 'top_n']
+    having_filters = [f for f in all_filters if f.get('isAggregated') and f.get('filterConfig', {}).get('type') != 'top_n']
+    top_n_filter = next((f for f in all_filters if f.get('filterConfig', {}).get('type') == 'top_n'), None)
+    return where_filters, having_filters, top_n_filter
+
+# --- CACHE DE PLANOS DOS VISUAIS ---
+# O SQL de um visual depende só da "forma" dele (campos, agregações, tipos e operadores
+# dos filtros, quantidade de valores selecionados), não dos valores dos filtros. O plano
+# compilado (caminho de JOINs, texto do SQL e slots dos parâmetros) fica em memória e, por
+# requisição, só os parâmetros são preenchidos. Os planos são descartados quando muda a
+# versão de bi_relacionamentos ou bi_tables (ver versoes_dados.py).
+PLANOS_MAX = 512
+TABELAS_DO_MODELO = ('bi_relacionamentos', 'bi_tables')
+_planos = OrderedDict()
+_planos_versao = None
+_planos_lock = threading.Lock()
+
+def _filter_shape(f):
+    cfg = f.get('filterConfig', {})
+    shape = [f.get('tableName'), f.get('columnName'), f.get('originalColumn'), bool(f.get('isAggregated')), f.get('aggregation'), cfg.get('type')]
+    if cfg.get('type') == 'basica':
+        shape.append(len(cfg.get('selectedValues') or []))
+    elif cfg.get('type') == 'avancada':
+        shape.append([a.get('condition') for a in cfg.get('advancedFilters') or []])
+    elif cfg.get('type') == 'top_n':
+        shape.append(cfg.get('topN', {}).get('direction'))
+    return shape
+
+def _visual_shape(fields_to_select, all_filters):
+    fields = [[f['tableName'], f.get('columnName'), f.get('displayName'), f.get('aggregation')] for f in fields_to_select]
+    return json.dumps([fields, [_filter_shape(f) for f in all_filters]], sort_keys=True, default=str)
+
+def compile_visual_plan(conn, fields_to_select, page_filters, visual_filters, relationships=None):
+    """
+    Compila o plano de um visual: caminho de JOINs, texto do SQL e slots dos parâmetros.
+    Quando não há o que consultar, o plano tem 'query' None e a 'mensagem' da resposta vazia.
+    `relationships` pode vir já lido (lote de visuais); senão é lido de bi_relacionamentos.
+    """
+    tables_in_visual = set()
+    for item in fields_to_select:
+        tables_in_visual.add(item['tableName'])
+    for f in page_filters + visual_filters:
+        if f and 'tableName' in f:
+            tables_in_visual.add(f['tableName'])
+
+    if not tables_in_visual:
+        return {"query": None, "mensagem": "Nenhuma tabela necessária."}
+
+    main_table = list(tables_in_visual)[0]
+
+    if relationships is None:
+        relationships = conn.execute("SELECT * FROM bi_relacionamentos").fetchall()
+    join_clauses = find_join_path(main_table, tables_in_visual, relationships)
+    # Tabelas lidas pela consulta, inclusive as intermediárias do caminho (cada cláusula é 'LEFT JOIN "tabela" ON ...').
+    tabelas_lidas = tuple(sorted({main_table, *(clause.split('"')[1] for clause in join_clauses)}))
+    from_clause = f'FROM "{main_table}" ' + " ".join(join_clauses)
+
+    agg_map = {**AGG_MAP, 'first': 'MIN', 'last': 'MAX'}
+    select_expressions, group_by_expressions = [], []
+    has_aggregation = False
+
+    for field in fields_to_select:
+        col_name = f'"{field["tableName"]}"."{field["columnName"]}"'
+        alias = f'"{field.get("displayName") or field["columnName"]}"'
+        agg = field.get('aggregation')
+
+        if agg and agg != 'none' and agg in agg_map:
+            select_expressions.append(f'{agg_map[agg]}({col_name}{")" if agg == "countd" else ""}) AS {alias}')
+            has_aggregation = True
+        else:
+            select_expressions.append(f'{col_name} AS {alias}')
+            group_by_expressions.append(col_name)
+
+    if not select_expressions:
+        return {"query": None, "mensagem": "Nenhuma coluna selecionada."}
+
+    select_clause = "SELECT " + ", ".join(select_expressions)
+
+    group_by_clause = ""
+    if has_aggregation and group_by_expressions:
+        group_by_clause = "GROUP BY " + ", ".join(group_by_expressions)
+
+    where_filters, having_filters, top_n_filter = _split_filters(page_filters + visual_filters)
+
+    where_conditions_str, where_slots = compile_filter_clause(where_filters)
+    where_clause = f"WHERE {where_conditions_str}" if where_conditions_str else ""
+
+    having_conditions_str, having_slots = compile_filter_clause(having_filters)
+    having_clause = f"HAVING {having_conditions_str}" if having_conditions_str else ""
+
+    # Chaves da paginação por cursor (keyset): identificam cada linha do resultado e definem a
+    # ordem das páginas. Com agregação são as colunas do GROUP BY (sem elas o resultado tem
+    # uma linha só); sem agregação, o rowid de cada tabela do caminho de JOINs.
+    chaves = []
+    if not top_n_filter:
+        if has_aggregation:
+            chaves = group_by_expressions
+        else:
+            chaves = [f'"{tabela}".rowid' for tabela in [main_table] + [clause.split('"')[1] for clause in join_clauses]]
+    if chaves:
+        select_clause += ", " + ", ".join(f'{expr} AS "{COLUNA_CHAVE}{i}"' for i, expr in enumerate(chaves))
+
+    base_query = f"{select_clause} {from_clause} {where_clause} {group_by_clause} {having_clause}"
+
+    if top_n_filter:
+        config = top_n_filter.get('filterConfig', {})
+        top_n_config = config.get('topN', {})
+        direction = 'DESC' if top_n_config.get('direction') == 'superior' else 'ASC'
+
+        # Para ordenar pelo valor da agregação, precisamos reconstruir a expressão de agregação
+        # usada no SELECT, em vez de usar o alias (que pode ser tratado como texto).
+        agg_func_order = AGG_MAP.get(top_n_filter.get('aggregation'), 'COUNT')
+        order_by_expression = f'{agg_func_order}("{top_n_filter["tableName"]}"."{top_n_filter["originalColumn"]}"{")" if top_n_filter.get("aggregation") == "countd" else ""})'
+
+        final_query = f"{base_query} ORDER BY {order_by_expression} {direction} LIMIT ?"
+    else:
+        final_query = base_query
+
+    return {"query": final_query, "where_slots": where_slots, "having_slots": having_slots, "top_n": bool(top_n_filter),
+            "tabelas": tabelas_lidas, "chaves": len(chaves)}
+
+def bind_visual_params(plan, page_filters, visual_filters):
+    """Parâmetros da requisição, na ordem dos slots do plano."""
+    where_filters, having_filters, top_n_filter = _split_filters(page_filters + visual_filters)
+    params = bind_filter_params(where_filters, plan['where_slots']) + bind_filter_params(having_filters, plan['having_slots'])
+    if plan['top_n']:
+        params.append(int(top_n_filter.get('filterConfig', {}).get('topN', {}).get('value', 10)))
+    return params
+
+# --- PAGINAÇÃO DOS VISUAIS ---
+# Cada página é lida a partir das chaves da última linha da página anterior, que vão no
+# cursor devolvido ao cliente; assim a página N custa o mesmo que a primeira, sem OFFSET.
+COLUNA_CHAVE = '__chave'
+PAGINA_PADRAO = 1000
+PAGINA_MAX = 10000
+NDJSON_LOTE = 500 # Linhas lidas do banco por vez na resposta em NDJSON
+
+def _assinatura_consulta(plan, params):
+    return hashlib.sha1(json.dumps([plan['query'], params], default=str).encode('utf-8')).hexdigest()[:16]
+
+def codificar_cursor(plan, params, valores):
+    conteudo = json.dumps({"c": valores, "a": _assinatura_consulta(plan, params)}, default=str)
+    return base64.urlsafe_b64encode(conteudo.encode('utf-8')).decode('ascii')
+
+def decodificar_cursor(plan, params, token):
+    """Valores das chaves guardados no cursor. ValueError se o cursor não for desta consulta."""
+    try:
+        conteudo = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+    except (ValueError, TypeError, AttributeError):
+        raise ValueError("Cursor inválido.")
+    if not isinstance(conteudo, dict) or conteudo.get('a') != _assinatura_consulta(plan, params) \
+            or not isinstance(conteudo.get('c'), list) or len(conteudo['c']) != plan['chaves']:
+        raise ValueError("Cursor não corresponde à consulta do visual (o visual ou os filtros mudaram).")
+    return conteudo['c']
+
+def consulta_da_pagina(plan, params, cursor=None, tamanho=PAGINA_PADRAO):
+    """
+    Retorna (sql, parâmetros) da página que começa depois do cursor (None = primeira página).
+    Com tamanho None, lê todas as linhas restantes. A consulta lê uma linha a mais que o
+    tamanho, para saber se existe uma próxima página.
+    """
+    if not plan['chaves']:
+        return plan['query'], list(params)
+
+    colunas = [f'"{COLUNA_CHAVE}{i}"' for i in range(plan['chaves'])]
+    condicao, extras = "", []
+    if cursor is not None:
+        valores = decodificar_cursor(plan, params, cursor)
+        # Comparação lexicográfica das chaves. NULL vem antes de qualquer valor na ordenação do SQLite.
+        termos = []
+        for i, valor in enumerate(valores):
+            iguais = [f"{colunas[j]} IS ?" for j in range(i)]
+            maior = f"{colunas[i]} IS NOT NULL" if valor is None else f"{colunas[i]} > ?"
+            termos.append("(" + " AND ".join(iguais + [maior]) + ")")
+            extras += valores[:i] + ([] if valor is None else [valor])
+        condicao = "WHERE (" + " OR ".join(termos) + ")"
+        if valores[0] is not None:
+            # Redundante, mas permite ao SQLite começar a leitura direto na primeira chave (ex: pelo rowid).
+            condicao += f" AND {colunas[0]} >= ?"
+            extras.append(valores[0])
+
+    sql = f"SELECT * FROM ({plan['query']}) {condicao} ORDER BY {', '.join(colunas)}"
+    if tamanho is None:
+        return sql, list(params) + extras
+    return sql + " LIMIT ?", list(params) + extras + [tamanho + 1]
+
+def _sem_chaves(plan, linha):
+    for i in range(plan['chaves']):
+        linha.pop(f"{COLUNA_CHAVE}{i}", None)
+    return linha
+
+def separar_pagina(plan, params, linhas, tamanho=PAGINA_PADRAO):
+    """Retorna (linhas da página sem as colunas de chave, cursor da próxima página ou None)."""
+    if not plan['chaves']:
+        # Top N e agregações sem GROUP BY: resultado inteiro, sem cursor.
+        return [dict(linha) for linha in linhas], None
+    proximo_cursor = None
+    if len(linhas) > tamanho:
+        linhas = linhas[:tamanho]
+        ultima = linhas[-1]
+        proximo_cursor = codificar_cursor(plan, params, [ultima[f"{COLUNA_CHAVE}{i}"] for i in range(plan['chaves'])])
+    return [_sem_chaves(plan, dict(linha)) for linha in linhas], proximo_cursor
+
+def _tamanho_pagina(config):
+    try:
+        tamanho = int(config.get('tamanhoPagina') or PAGINA_PADRAO)
+    except (TypeError, ValueError):
+        raise ValueError("tamanhoPagina deve ser um número inteiro.")
+    return max(1, min(tamanho, PAGINA_MAX))
+
+def get_visual_plan(conn, fields_to_select, page_filters, visual_filters, relationships=None, versao=None):
+    """Retorna o plano do visual, compilando-o só se a forma ainda não estiver em cache."""
+    global _planos_versao
+    shape = _visual_shape(fields_to_select, page_filters + visual_filters)
+    if versao is None:
+        versao = versoes(conn, TABELAS_DO_MODELO)
+    with _planos_lock:
+        if versao != _planos_versao:
+            _planos.clear()
+            _planos_versao = versao
+        plan = _planos.get(shape)
+        if plan is not None:
+            _planos.move_to_end(shape)
+            return plan
+
+    plan = compile_visual_plan(conn, fields_to_select, page_filters, visual_filters, relationships)
+    with _planos_lock:
+        if versao == _planos_versao:
+            _planos[shape] = plan
+            while len(_planos) > PLANOS_MAX:
+                _planos.popitem(last=False)
+    return plan
+
+# --- CACHE DE RESULTADOS DOS VISUAIS ---
+# O resultado de um visual depende só do SQL, dos parâmetros e do conteúdo das tabelas
+# lidas (as do caminho de JOINs). Cada resultado fica em memória, indexado pelas tabelas
+# que leu; quando a versão de uma tabela muda (qualquer escrita confirmada pelo pool de
+# conexões, ver versoes_dados.py), só os resultados que leram aquela tabela são descartados. Um dashboard sem alterações é redesenhado sem consultar
+# as tabelas de dados (apenas o registro de versões).
+RESULTADOS_MAX = 256
+# Memória total aproximada dos resultados, em bytes. Acima dela os usados há mais tempo são
+# descartados (uma página de tabela ou um top N largo passa facilmente de alguns MB).
+MEMORIA_RESULTADOS_MAX = 128 * 1024 * 1024
+_resultados = OrderedDict()     # (query, params) -> (tabelas, (linhas, cursor), tamanho)
+_resultados_por_tabela = {}     # tabela -> chaves dos resultados que a leram
+_versoes_vistas = {}            # tabela -> versão dos resultados guardados
+_memoria_resultados = 0         # Soma do `tamanho` dos resultados em memória
+_resultados_lock = threading.Lock()
+
+def _tamanho_resultado(chave, resultado):
+    """Memória aproximada, em bytes: SQL e parâmetros da chave, linhas e seus valores."""
+    query, params = chave
+    linhas, cursor = resultado
+    return (
+        sys.getsizeof(query) + sys.getsizeof(params) + sum(sys.getsizeof(valor) for valor in params)
+        + sys.getsizeof(linhas) + sys.getsizeof(cursor)
+        + sum(sys.getsizeof(linha) + sum(sys.getsizeof(valor) for valor in linha.values()) for linha in linhas)
+    )
+
+def _remover_resultado(chave):
+    """Chamar com o lock."""
+    global _memoria_resultados
+    item = _resultados.pop(chave, None)
+    if item is not None:
+        _memoria_resultados -= item[2]
+        for tabela in item[0]:
+            _resultados_por_tabela.get(tabela, set()).discard(chave)
+
+def _sincronizar_versoes(versoes_atuais):
+    """Descarta os resultados que leram tabelas cuja versão mudou. Chamar com o lock."""
+    for tabela, versao in versoes_atuais.items():
+        if _versoes_vistas.get(tabela) != versao:
+            for chave in _resultados_por_tabela.pop(tabela, set()):
+                _remover_resultado(chave)
+            _versoes_vistas[tabela] = versao
+
+def buscar_resultado(conn, plan, query, params):
+    """
+    Procura o resultado da consulta no cache.
+    Retorna (chave, versões das tabelas lidas, resultado); resultado é None quando não está em cache.
+    """
+    chave = (query, tuple(params))
+    versoes_atuais = versoes_por_tabela(conn, plan['tabelas'])
+    with _resultados_lock:
+        _sincronizar_versoes(versoes_atuais)
+        item = _resultados.get(chave)
+        if item is None:
+            return chave, versoes_atuais, None
+        _resultados.move_to_end(chave)
+        return chave, versoes_atuais, item[1]
+
+def guardar_resultado(chave, versoes_lidas, resultado):
+    """Guarda o resultado, a menos que alguma tabela lida tenha mudado durante a consulta."""
+    global _memoria_resultados
+    tamanho = _tamanho_resultado(chave, resultado)
+    with _resultados_lock:
+        if any(_versoes_vistas.get(tabela) != versao for tabela, versao in versoes_lidas.items()):
+            return
+        _remover_resultado(chave)
+        _resultados[chave] = (tuple(versoes_lidas), resultado, tamanho)
+        _memoria_resultados += tamanho
+        for tabela in versoes_lidas:
+            _resultados_por_tabela.setdefault(tabela, set()).add(chave)
+        # O resultado recém-guardado fica mesmo que sozinho passe do limite de memória.
+        while len(_resultados) > RESULTADOS_MAX or (_memoria_resultados > MEMORIA_RESULTADOS_MAX and len(_resultados) > 1):
+            _remover_resultado(next(iter(_resultados)))
 
 @bp.route('/visual-data', methods=['POST'])
 def get_visual_data():
+    """
+    Dados de um visual, paginados. Além de "visual" e "pageFilters", o corpo aceita:
+      - "cursor": o "proximo_cursor" da página anterior;
+      - "tamanhoPagina": linhas por página (padrão PAGINA_PADRAO, máximo PAGINA_MAX);
+      - "formato": "ndjson" para receber todas as linhas (a partir do cursor) em streaming, uma por linha.
+    """
     config = request.get_json()
     visual_config = config.get('visual')
     page_filters = config.get('pageFilters', [])
-    visual_filters = visual_config.get('filters', [])
     final_query = 'Query não gerada'
 
     if not visual_config:
         return jsonify({"message": "Configuração do visual é obrigatória."}), 400
+    visual_filters = visual_config.get('filters', [])
+    try:
+        tamanho = _tamanho_pagina(config)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
 
-    conn = get_db_connection()
+    conn = get_db_read_connection()
     try:
-        tables_in_visual, fields_to_select = set(), []
-        agg_map = {'sum': 'SUM', 'average': 'AVG', 'count': 'COUNT', 'countd': 'COUNT(DISTINCT', 'min': 'MIN', 'max': 'MAX', 'first': 'MIN', 'last': 'MAX'}
-
-        data_field_keys = ['value', 'values', 'xAxis', 'yAxis', 'legend', 'minValue', 'maxValue', 'columns', 'rows', 'columnValues']
-
-        for key, field_value in visual_config.items():
-            if key in data_field_keys:
-                items = field_value if isinstance(field_value, list) else ([field_value] if isinstance(field_value, dict) and 'tableName' in field_value else [])
-                for item in items:
-                    if item and 'tableName' in item:
-                        tables_in_visual.add(item['tableName'])
-                        fields_to_select.append(item)
-        
-        for f in page_filters + visual_filters:
-            if f and 'tableName' in f:
-                tables_in_visual.add(f['tableName'])
+        fields_to_select = _fields_of_visual(visual_config)
+        plan = get_visual_plan(conn, fields_to_select, page_filters, visual_filters)
+        if plan['query'] is None:
+            return jsonify({"data": [], "query": plan['mensagem'], "proximo_cursor": None})
 
+        final_query = plan['query']
+        params = bind_visual_params(plan, page_filters, visual_filters)
 
-        if not tables_in_visual:
-            return jsonify({"data": [], "query": "Nenhuma tabela necessária."})
+        if config.get('formato') == 'ndjson':
+            final_query, query_params = consulta_da_pagina(plan, params, config.get('cursor'), tamanho=None)
+            return _resposta_ndjson(conn, plan, final_query, query_params)
 
-        main_table = list(tables_in_visual)[0]
-        
-        relationships = conn.execute("SELECT * FROM bi_relacionamentos").fetchall()
-        join_clauses = find_join_path(main_table, tables_in_visual, relationships)
-        from_clause = f'FROM "{main_table}" ' + " ".join(join_clauses)
+        final_query, query_params = consulta_da_pagina(plan, params, config.get('cursor'), tamanho)
+        chave, versoes_lidas, resultado = buscar_resultado(conn, plan, final_query, query_params)
+        if resultado is None:
+            current_app.logger.debug("BI Query: %s | Params: %s", final_query, query_params)
 
-        select_expressions, group_by_expressions = [], []
-        has_aggregation = False
+            results = executar_consulta(conn, final_query, query_params)
 
-        for field in fields_to_select:
-            col_name = f'"{field["tableName"]}"."{field["columnName"]}"'
-            alias = f'"{field.get("displayName") or field["columnName"]}"'
-            agg = field.get('aggregation')
-            
-            if agg and agg != 'none' and agg in agg_map:
-                select_expressions.append(f'{agg_map[agg]}({col_name}{")" if agg == "countd" else ""}) AS {alias}')
-                has_aggregation = True
-            else:
-                select_expressions.append(f'{col_name} AS {alias}')
-                group_by_expressions.append(col_name)
-        
-        if not select_expressions:
-            return jsonify({"data": [], "query": "Nenhuma coluna selecionada."})
+            resultado = separar_pagina(plan, params, results, tamanho)
+            guardar_resultado(chave, versoes_lidas, resultado)
+        data, proximo_cursor = resultado
+        return jsonify({"data": data, "query": final_query, "proximo_cursor": proximo_cursor})
 
-        select_clause = "SELECT " + ", ".join(select_expressions)
-        
-        group_by_clause = ""
-        if has_aggregation and group_by_expressions:
-            group_by_clause = "GROUP BY " + ", ".join(group_by_expressions)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    except ConsultaRejeitada as e:
+        return jsonify({"message": str(e), "query": final_query}), e.status
+    except sqlite3.Error as e:
+        traceback.print_exc()
+        return jsonify({"message": f"Erro de banco de dados ao executar a consulta.", "query": final_query}), 500
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"message": f"Erro inesperado no servidor: {e}"}), 500
+    finally:
+        if conn: conn.close()
 
-        all_filters = page_filters + visual_filters
-        
-        where_filters = [f for f in all_filters if not f.get('isAggregated') and f.get('filterConfig', {}).get('type') != 'top_n']
-        having_filters = [f for f in all_filters if f.get('isAggregated') and f.get('filterConfig', {}).get('type') != 'top_n']
-        top_n_filter = next((f for f in all_filters if f.get('filterConfig', {}).get('type') == 'top_n'), None)
+def _resposta_ndjson(conn, plan, query, params):
+    """Envia as linhas conforme são lidas do banco, sem montar o resultado inteiro em memória."""
+    current_app.logger.debug("BI Query (NDJSON): %s | Params: %s", query, params)
+    detalhes, estimativa, aviso = verificar_plano(conn, query, params, 'bi/ndjson') # ConsultaRejeitada vai para a rota
 
-        where_conditions_str, where_params = build_filter_clause(where_filters, [])
-        where_clause = f"WHERE {where_conditions_str}" if where_conditions_str else ""
-        
-        having_conditions_str, having_params = build_filter_clause(having_filters, [])
-        having_clause = f"HAVING {having_conditions_str}" if having_conditions_str else ""
-        
-        params = where_params + having_params
-        
-        base_query = f"{select_clause} {from_clause} {where_clause} {group_by_clause} {having_clause}"
+    def gerar():
+        # O orçamento de tempo conta só o tempo do SQLite, não o do cliente lendo a resposta.
+        orcamento = OrcamentoTempo(conn)
+        total = 0
+        try:
+            with orcamento:
+                cursor = conn.execute(query, params)
+            while True:
+                with orcamento:
+                    linhas = cursor.fetchmany(NDJSON_LOTE)
+                if not linhas:
+                    break
+                total += len(linhas)
+                yield ''.join(json.dumps(_sem_chaves(plan, dict(linha)), ensure_ascii=False, default=str) + '\n' for linha in linhas)
+        except ConsultaRejeitada as e:
+            registrar_consulta('bi/ndjson', 'interrompida', query, params, orcamento.usado, total, estimativa, detalhes, str(e))
+            yield json.dumps({"message": str(e)}, ensure_ascii=False) + '\n'
+            return
+        except sqlite3.Error:
+            traceback.print_exc()
+            yield json.dumps({"message": "Erro de banco de dados ao executar a consulta."}, ensure_ascii=False) + '\n'
+            return
+        if aviso or orcamento.usado >= TEMPO_CONSULTA_LENTA:
+            registrar_consulta('bi/ndjson', 'aviso' if aviso else 'lenta', query, params, orcamento.usado, total, estimativa, detalhes, aviso)
 
-        if top_n_filter:
-            config = top_n_filter.get('filterConfig', {})
-            top_n_config = config.get('topN', {})
-            direction = 'DESC' if top_n_config.get('direction') == 'superior' else 'ASC'
-            limit = int(top_n_config.get('value', 10))
-            
-            # --- INÍCIO DA CORREÇÃO ---
-            # Para ordenar pelo valor da agregação, precisamos reconstruir a expressão de agregação
-            # usada no SELECT, em vez de usar o alias (que pode ser tratado como texto).
-            agg_map_order = {'sum': 'SUM', 'average': 'AVG', 'count': 'COUNT', 'countd': 'COUNT(DISTINCT', 'min': 'MIN', 'max': 'MAX'}
-            agg_func_order = agg_map_order.get(top_n_filter.get('aggregation'), 'COUNT')
-            order_by_expression = f'{agg_func_order}("{top_n_filter["tableName"]}"."{top_n_filter["originalColumn"]}"{")" if top_n_filter.get("aggregation") == "countd" else ""})'
-            # --- FIM DA CORREÇÃO ---
-            
-            final_query = f"{base_query} ORDER BY {order_by_expression} {direction} LIMIT ?"
-            params.append(limit)
+    # stream_with_context mantém a requisição (e a conexão dela) aberta até o fim do envio.
+    return Response(stream_with_context(gerar()), mimetype='application/x-ndjson')
+
+# --- LOTE DE VISUAIS (DASHBOARD INTEIRO) ---
+# Um dashboard com N visuais fazia N requisições a /visual-data, cada uma lendo de novo
+# a versão do modelo e, a cada plano novo, bi_relacionamentos. Aqui o dashboard inteiro
+# vem numa requisição: modelo, relacionamentos e esquema validado são lidos uma vez e
+# os planos são montados na mesma conexão. Com "paralelo", as consultas são executadas
+# num pool limitado de threads, cada uma com a sua conexão somente leitura do pool.
+LOTE_MAX_THREADS = 4
+_executor_lote = ThreadPoolExecutor(max_workers=LOTE_MAX_THREADS, thread_name_prefix='bi-lote')
+
+def _visuais_do_layout(layout):
+    """Visuais de um layout de dashboard, identificados por "<linha>-<coluna>" (como na tela)."""
+    visuais = {}
+    for row_index, row in enumerate((layout or {}).get('rows', [])):
+        for col_index, col in enumerate(row.get('columns', [])):
+            visual = (col or {}).get('visual')
+            if visual:
+                visuais[f"{row_index}-{col_index}"] = visual
+    return visuais
+
+def _campos_invalidos(valid_tables, fields_to_select, all_filters):
+    """Lista de "tabela.coluna" usados pelo visual que não existem no banco."""
+    invalidos = []
+    for f in fields_to_select + all_filters:
+        if not f or 'tableName' not in f:
+            continue
+        # Filtros agregados (e o Top N) têm como columnName o rótulo da agregação; a coluna real é a originalColumn.
+        agregado = f.get('isAggregated') or f.get('filterConfig', {}).get('type') == 'top_n'
+        col = f.get('originalColumn') if agregado else f.get('columnName')
+        if col not in valid_tables.get(f['tableName'], ()):
+            invalidos.append(f"{f['tableName']}.{col}")
+    return invalidos
+
+def _executar_plano(conn, query, params):
+    return [dict(row) for row in executar_consulta(conn, query, params, origem='bi/lote')]
+
+def _executar_plano_em_thread(query, params):
+    with conexao_do_pool(PAPEL_LEITURA) as conn:
+        return _executar_plano(conn, query, params)
+
+def _resultado_do_lote(plan, params, query, linhas, chave, versoes_lidas):
+    resultado = separar_pagina(plan, params, linhas)
+    guardar_resultado(chave, versoes_lidas, resultado)
+    return {"data": resultado[0], "query": query, "proximo_cursor": resultado[1]}
+
+@bp.route('/visual-data/lote', methods=['POST'])
+def get_visual_data_batch():
+    """
+    Executa todos os visuais de um dashboard. Corpo:
+      - "layout": layout do dashboard (rows/columns), ou "visuals": {id: configuração do visual};
+      - "pageFilters": filtros da página, aplicados a todos os visuais;
+      - "paralelo" (opcional): executa as consultas em paralelo.
+    Retorna {"resultados": {id: {"data", "query", "proximo_cursor"} ou {"message", "query"}}}, com a primeira
+    página de cada visual; as seguintes são lidas em /visual-data, com o "proximo_cursor".
+    """
+    config = request.get_json() or {}
+    page_filters = config.get('pageFilters', [])
+    visuais = config.get('visuals') or _visuais_do_layout(config.get('layout'))
+    paralelo = bool(config.get('paralelo'))
+
+    if not visuais:
+        return jsonify({"message": "Layout ou lista de visuais é obrigatório."}), 400
+
+    resultados = {}
+    consultas = {} # id -> (plano, params, query da 1ª página, params da página, chave do cache, versões lidas)
+    conn = get_db_read_connection()
+    try:
+        versao = versoes(conn, TABELAS_DO_MODELO)
+        relationships = conn.execute("SELECT * FROM bi_relacionamentos").fetchall()
+        valid_tables = get_valid_tables_and_columns(conn)
+
+        for visual_id, visual_config in visuais.items():
+            if not visual_config.get('hasData', True):
+                resultados[visual_id] = {"data": None, "query": None}
+                continue
+            visual_filters = visual_config.get('filters', [])
+            fields_to_select = _fields_of_visual(visual_config)
+
+            invalidos = _campos_invalidos(valid_tables, fields_to_select, page_filters + visual_filters)
+            if invalidos:
+                resultados[visual_id] = {"message": f"Tabela ou coluna inválida: {', '.join(invalidos)}", "query": None}
+                continue
+
+            plan = get_visual_plan(conn, fields_to_select, page_filters, visual_filters, relationships, versao)
+            if plan['query'] is None:
+                resultados[visual_id] = {"data": [], "query": plan['mensagem']}
+                continue
+            params = bind_visual_params(plan, page_filters, visual_filters)
+            query, query_params = consulta_da_pagina(plan, params)
+            chave, versoes_lidas, resultado = buscar_resultado(conn, plan, query, query_params)
+            if resultado is not None:
+                resultados[visual_id] = {"data": resultado[0], "query": query, "proximo_cursor": resultado[1]}
+                continue
+            consultas[visual_id] = (plan, params, query, query_params, chave, versoes_lidas)
+
+        current_app.logger.debug("BI Lote: %d consultas (%s)", len(consultas), 'paralelo' if paralelo else 'sequencial')
+
+        if paralelo and len(consultas) > 1:
+            futuros = {visual_id: _executor_lote.submit(_executar_plano_em_thread, query, query_params)
+                       for visual_id, (_, _, query, query_params, _, _) in consultas.items()}
+            for visual_id, futuro in futuros.items():
+                plan, params, query, _, chave, versoes_lidas = consultas[visual_id]
+                try:
+                    resultados[visual_id] = _resultado_do_lote(plan, params, query, futuro.result(), chave, versoes_lidas)
+                except ConsultaRejeitada as e:
+                    resultados[visual_id] = {"message": str(e), "query": query}
+                except sqlite3.Error:
+                    traceback.print_exc()
+                    resultados[visual_id] = {"message": "Erro de banco de dados ao executar a consulta.", "query": query}
         else:
-            final_query = f"{base_query} LIMIT 1000"
-        
-        print(f"--- BI Query ---\n{final_query}\nParams: {params}\n----------------")
-        
-        cursor = conn.cursor()
-        results = cursor.execute(final_query, params).fetchall()
-        
-        data = [dict(row) for row in results]
-        return jsonify({"data": data, "query": final_query})
+            for visual_id, (plan, params, query, query_params, chave, versoes_lidas) in consultas.items():
+                try:
+                    linhas = _executar_plano(conn, query, query_params)
+                    resultados[visual_id] = _resultado_do_lote(plan, params, query, linhas, chave, versoes_lidas)
+                except ConsultaRejeitada as e:
+                    resultados[visual_id] = {"message": str(e), "query": query}
+                except sqlite3.Error:
+                    traceback.print_exc()
+                    resultados[visual_id] = {"message": "Erro de banco de dados ao executar a consulta.", "query": query}
+
+        return jsonify({"resultados": resultados})
 
     except sqlite3.Error as e:
         traceback.print_exc()
-        return jsonify({"message": f"Erro de banco de dados ao executar a consulta.", "query": final_query}), 500
+        return jsonify({"message": "Erro de banco de dados ao executar o lote de visuais."}), 500
     except Exception as e:
         traceback.print_exc()
         return jsonify({"message": f"Erro inesperado no servidor: {e}"}), 500
     finally:
         if conn: conn.close()
 
+@bp.route('/consultas-lentas', methods=['GET'])
+def get_consultas_lentas():
+    """Registro das consultas do BI lentas, pesadas, recusadas ou interrompidas (mais recentes primeiro)."""
+    try:
+        limite = max(1, min(int(request.args.get('limite', 100)), 1000))
+    except ValueError:
+        return jsonify({"message": "limite deve ser um número inteiro."}), 400
+    conn = get_db_read_connection()
+    try:
+        return jsonify(consultas_registradas(conn, limite, request.args.get('situacao')))
+    except sqlite3.Error as e:
+        return jsonify({"message": f"Erro de banco de dados: {e}"}), 500
+    finally:
+        conn.close()
@@ -1,11 +1,45 @@
 from flask import Blueprint, jsonify, request
 from ..db import get_db_connection
+from ..derivados import ao_alterar, tabelas_alteradas
 import sqlite3
 # Importa a função de criar notificação
 from ..Rotas.notificacoes import criar_notificacao
 
 bp = Blueprint('centros_custo', __name__, url_prefix='/api/centros_custo')
 
+# --- Hierarquia pré-calculada (contrato -> núcleo -> superintendência) ---
+# Uma linha por centro de custo com os dados do próprio CC, do pai (núcleo) e do avô
+# (superintendência). Substitui os três JOINs em 'centros_custo' e as consultas
+# encadeadas por pai_id: qualquer filtro da hierarquia vira uma busca indexada.
+# - pai_id / pai_nucleo: códigos informados no cadastro (filtros por núcleo / superintendência);
+# - cod_nucleo / cod_super: preenchidos apenas se o CC pai / avô existir.
+HIERARQUIA_TABELA = 'centros_custo_hierarquia'
+
+@ao_alterar('centros_custo')
+def reconstruir_hierarquia(conn):
+    """Recria HIERARQUIA_TABELA a partir de 'centros_custo' numa única transação."""
+    if not conn.in_transaction:
+        conn.execute('BEGIN')
+    try:
+        conn.execute(f'DROP TABLE IF EXISTS {HIERARQUIA_TABELA}')
+        conn.execute(f"""
+            CREATE TABLE {HIERARQUIA_TABELA} AS
+            SELECT
+                contrato.id, contrato.cod_cc, contrato.nome_cc, contrato.tipo, contrato.pai_id,
+                contrato.estado, contrato.gestor, contrato.controlador, contrato.status,
+                nucleo.cod_cc AS cod_nucleo, nucleo.nome_cc AS nome_nucleo, nucleo.pai_id AS pai_nucleo,
+                super.cod_cc AS cod_super, super.nome_cc AS nome_super
+            FROM centros_custo contrato
+            LEFT JOIN centros_custo nucleo ON contrato.pai_id = nucleo.cod_cc
+            LEFT JOIN centros_custo super ON nucleo.pai_id = super.cod_cc
+        """)
+        for coluna in ('cod_cc', 'id', 'pai_id', 'pai_nucleo'):
+            conn.execute(f'CREATE INDEX idx_{HIERARQUIA_TABELA}_{coluna} ON {HIERARQUIA_TABELA} ({coluna})')
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+
 @bp.route('', methods=['GET'])
 def get_centros_custo():
     conn = get_db_connection()
@@ -39,6 +73,7 @@ def create_centro_custo():
         criar_notificacao(conn, 'bi-building-add', texto_notificacao, 'cadastros', None, None, tipo_notificacao_estrategica='cadastro_cc')
         
         conn.commit()
+        tabelas_alteradas(conn, ['centros_custo'])
         message = {"message": f"Centro de Custo '{data['nome_cc']}' criado com sucesso!"}
     except sqlite3.IntegrityError:
         conn.rollback()
@@ -75,6 +110,7 @@ def update_centro_custo(id):
         criar_notificacao(conn, 'bi-building-gear', texto_notificacao, 'cadastros', None, None, tipo_notificacao_estrategica='edicao_cc')
         
         conn.commit()
+        tabelas_alteradas(conn, ['centros_custo'])
         message = {"message": "Centro de Custo atualizado com sucesso!"}
     except Exception as e:
         conn.rollback()
@@ -107,6 +143,7 @@ def delete_centro_custo(id):
         criar_notificacao(conn, 'bi-building-dash', texto_notificacao, 'cadastros', None, None, tipo_notificacao_estrategica='exclusao_cc')
 
         conn.commit()
+        tabelas_alteradas(conn, ['centros_custo'])
     except Exception as e:
         conn.rollback()
         return jsonify({"message": f"Erro ao excluir Centro de Custo: {e}"}), 500
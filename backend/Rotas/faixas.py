@@ -2,6 +2,7 @@ from flask import Blueprint, jsonify, request
 from ..db import get_db_connection
 import sqlite3
 from ..Rotas.notificacoes import criar_notificacao
+from ..derivados import tabelas_alteradas
 
 bp = Blueprint('faixas', __name__, url_prefix='/api')
 
@@ -84,6 +85,7 @@ def create_faixa():
         criar_notificacao(conn, 'bi-reception-4', texto_notificacao, 'cadastros', None, None, tipo_notificacao_estrategica='alteracao_faixas')
         
         conn.commit()
+        tabelas_alteradas(conn, ['faixas_definicoes'])
     except Exception as e:
         conn.rollback()
         return jsonify({"message": f"Erro inesperado: {e}"}), 500
@@ -119,6 +121,7 @@ def update_faixa(id):
         criar_notificacao(conn, 'bi-pencil-square', texto_notificacao, 'cadastros', None, None, tipo_notificacao_estrategica='alteracao_faixas')
         
         conn.commit()
+        tabelas_alteradas(conn, ['faixas_definicoes'])
     except Exception as e:
         conn.rollback()
         return jsonify({"message": f"Erro inesperado: {e}"}), 500
@@ -152,6 +155,7 @@ def delete_faixa(id):
         criar_notificacao(conn, 'bi-trash3-fill', texto_notificacao, 'cadastros', None, None, tipo_notificacao_estrategica='alteracao_faixas')
 
         conn.commit()
+        tabelas_alteradas(conn, ['faixas_definicoes'])
     except Exception as e:
         conn.rollback()
         return jsonify({"message": f"Erro ao excluir faixa: {e}"}), 500
@@ -1,5 +1,6 @@
 from flask import Blueprint, jsonify, request
-from ..db import get_db_connection
+from ..db import get_db_read_connection
+from .centros_custo import HIERARQUIA_TABELA
 
 bp = Blueprint('filtros', __name__, url_prefix='/api/filtros')
 
@@ -12,7 +13,7 @@ def get_opcoes_filtros():
     """
     conn = None
     try:
-        conn = get_db_connection()
+        conn = get_db_read_connection()
         user_contracts_ids_str = request.args.get('user_contracts')
 
         all_ccs_rows = conn.execute("SELECT id, cod_cc, nome_cc, tipo, pai_id, estado, gestor, controlador, status FROM centros_custo").fetchall()
@@ -22,32 +23,18 @@ def get_opcoes_filtros():
 
         if user_contracts_ids_str is not None:
             user_contracts_ids = user_contracts_ids_str.split(',') if user_contracts_ids_str else []
-            
-            # --- CORREÇÃO PRINCIPAL: Traduz IDs para cod_cc ---
-            # 1. Cria um mapa de ID para cod_cc
-            id_to_cod_cc_map = {str(cc['id']): cc['cod_cc'] for cc in all_ccs}
-            
-            # 2. Converte a lista de IDs permitidos para uma lista de cod_cc permitidos
-            user_contracts_cod_cc_list = [id_to_cod_cc_map[id_str] for id_str in user_contracts_ids if id_str in id_to_cod_cc_map]
 
-            cc_map = {cc['cod_cc']: cc for cc in all_ccs}
-            
-            allowed_ccs_codes = set(user_contracts_cod_cc_list)
-            allowed_nucleos_codes = set()
-            allowed_supers_codes = set()
-
-            for cc_code in user_contracts_cod_cc_list:
-                contrato = cc_map.get(cc_code)
-                if contrato and contrato.get('pai_id'):
-                    nucleo = cc_map.get(contrato['pai_id'])
-                    if nucleo:
-                        allowed_nucleos_codes.add(nucleo['cod_cc'])
-                        if nucleo.get('pai_id'):
-                            superintendencia = cc_map.get(nucleo['pai_id'])
-                            if superintendencia:
-                                allowed_supers_codes.add(superintendencia['cod_cc'])
-            
-            all_allowed_codes = allowed_ccs_codes.union(allowed_nucleos_codes).union(allowed_supers_codes)
+            # Os contratos do usuário, seus núcleos e superintendências saem da hierarquia
+            # pré-calculada numa única consulta (cod_nucleo/cod_super só existem se o CC existir).
+            all_allowed_codes = set()
+            if user_contracts_ids:
+                placeholders = ','.join('?' for _ in user_contracts_ids)
+                hierarquia_rows = conn.execute(
+                    f"SELECT cod_cc, cod_nucleo, cod_super FROM {HIERARQUIA_TABELA} WHERE id IN ({placeholders})",
+                    user_contracts_ids
+                ).fetchall()
+                for row in hierarquia_rows:
+                    all_allowed_codes.update(code for code in (row['cod_cc'], row['cod_nucleo'], row['cod_super']) if code is not None)
             
             ccs_para_analise = [cc for cc in all_ccs if cc['cod_cc'] in all_allowed_codes]
 
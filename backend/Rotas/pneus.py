@@ -1,5 +1,5 @@
 from flask import Blueprint, jsonify, request
-from ..db import get_db_connection
+from ..db import get_db_connection, get_db_read_connection
 import json
 import pandas as pd
 import numpy as np
@@ -9,19 +9,20 @@ from datetime import datetime, timedelta
 # --- 1. IMPORTAR O CACHE ---
 # Importa o objeto 'cache' que criamos no __init__.py
 from .. import cache
+from ..datas import FORMATO_ISO
+from ..classificacao_faixas import obter_classificador
+from ..derivados import tabelas_alteradas
+from ..versoes_dados import prefixo_versionado
 
 bp = Blueprint('pneus', __name__, url_prefix='/api/pneus')
 
+# Tabelas lidas pelas rotas de inspeção; fazem parte da chave do cache (ver versoes_dados.py).
+TABELAS_INSPECAO = ('equipamentos', 'tipo_obj', 'layouts_pneus', 'controle_pneus', 'faixas_definicoes')
+
 # --- ROTAS PARA GERENCIAMENTO DE LAYOUTS ---
 
 @bp.route('/layouts', methods=['POST'])
 def criar_layout():
-    # --- LIMPEZA DE CACHE ---
-    # Como esta rota cria um novo layout,
-    # limpamos o cache da rota que lista os layouts.
-    cache.delete_memoized(listar_layouts)
-    # -------------------------
-    
     dados = request.get_json()
     if not dados or 'cod_tipo_obj' not in dados or 'configuracao' not in dados:
         return jsonify({"error": "Dados incompletos"}), 400
@@ -35,6 +36,7 @@ def criar_layout():
             (dados['cod_tipo_obj'], configuracao_json)
         )
         conn.commit()
+        tabelas_alteradas(conn, ['layouts_pneus']) # Invalida o cache das rotas que leem a tabela
         return jsonify({"id": cursor.lastrowid}), 201
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -43,11 +45,11 @@ def criar_layout():
             conn.close()
 
 @bp.route('/layouts', methods=['GET'])
-@cache.cached(timeout=0, query_string=True) # Cache infinito, seguro por filtros
+@cache.cached(timeout=0, query_string=True, key_prefix=prefixo_versionado('layouts_pneus', 'tipo_obj')) # Cache infinito, invalidado pela versão das tabelas
 def listar_layouts():
     conn = None
     try:
-        conn = get_db_connection()
+        conn = get_db_read_connection()
         layouts_db = conn.execute("""
             SELECT l.id, l.cod_tipo_obj, l.configuracao, t.tipo_obj
             FROM layouts_pneus l
@@ -68,10 +70,6 @@ def listar_layouts():
 
 @bp.route('/layouts/<int:layout_id>', methods=['PUT'])
 def atualizar_layout(layout_id):
-    # --- LIMPEZA DE CACHE ---
-    cache.delete_memoized(listar_layouts)
-    # -------------------------
-
     dados = request.get_json()
     if not dados or 'configuracao' not in dados:
         return jsonify({"error": "Dados incompletos"}), 400
@@ -84,6 +82,7 @@ def atualizar_layout(layout_id):
             (configuracao_json, layout_id)
         )
         conn.commit()
+        tabelas_alteradas(conn, ['layouts_pneus']) # Invalida o cache das rotas que leem a tabela
         return jsonify({"message": "Layout atualizado com sucesso"}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -93,15 +92,12 @@ def atualizar_layout(layout_id):
 
 @bp.route('/layouts/<int:layout_id>', methods=['DELETE'])
 def deletar_layout(layout_id):
-    # --- LIMPEZA DE CACHE ---
-    cache.delete_memoized(listar_layouts)
-    # -------------------------
-
     conn = None
     try:
         conn = get_db_connection()
         conn.execute("DELETE FROM layouts_pneus WHERE id = ?", (layout_id,))
         conn.commit()
+        tabelas_alteradas(conn, ['layouts_pneus']) # Invalida o cache das rotas que leem a tabela
         return jsonify({"message": "Layout deletado com sucesso"}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -110,11 +106,11 @@ def deletar_layout(layout_id):
             conn.close()
 
 @bp.route('/tipos-equipamento', methods=['GET'])
-@cache.cached(timeout=0, query_string=True) # Cache infinito
+@cache.cached(timeout=0, query_string=True, key_prefix=prefixo_versionado('tipo_obj')) # Cache infinito, invalidado pela versão das tabelas
 def get_tipos_equipamento():
     conn = None
     try:
-        conn = get_db_connection()
+        conn = get_db_read_connection()
         tipos = conn.execute("SELECT cod_tipo_obj, tipo_obj FROM tipo_obj ORDER BY tipo_obj").fetchall()
         return jsonify([dict(row) for row in tipos])
     except Exception as e:
@@ -124,31 +120,18 @@ def get_tipos_equipamento():
             conn.close()
 
 # --- ROTAS PARA DADOS DE INSPEÇÃO E ANÁLISE ---
-def get_faixas_pneus(conn):
+def get_classificador_pneus(conn):
     # Esta função é chamada por outras rotas cacheadas,
     # então ela mesma não precisa de um decorator.
-    faixas_db = conn.execute("SELECT nome_faixa, valor_inicio, valor_fim, status, cor FROM faixas_definicoes WHERE grupo_id = 'estado_pneus'").fetchall()
-    return [dict(row) for row in faixas_db]
-
-def classificar_medicao(medicao, faixas):
-    if medicao is None or pd.isna(medicao):
-        return None
-    for faixa in faixas:
-        # Garante que os limites são numéricos antes da comparação
-        valor_inicio = pd.to_numeric(faixa['valor_inicio'], errors='coerce')
-        valor_fim = pd.to_numeric(faixa['valor_fim'], errors='coerce')
-        medicao_num = pd.to_numeric(medicao, errors='coerce')
-        if pd.notna(valor_inicio) and pd.notna(valor_fim) and pd.notna(medicao_num):
-             if valor_inicio <= medicao_num <= valor_fim:
-                return faixa
-    return None
+    # As faixas ficam compiladas em memória até faixas_definicoes ser alterada.
+    return obter_classificador(conn, 'estado_pneus')
 
 @bp.route('/inspecoes/<prefixo_equipamento>', methods=['GET'])
-@cache.cached(timeout=0) # Cache infinito. (query_string=True não é necessário aqui, pois o filtro já faz parte da URL)
+@cache.cached(timeout=0, key_prefix=prefixo_versionado(*TABELAS_INSPECAO)) # Cache infinito. (query_string=True não é necessário aqui, pois o filtro já faz parte da URL)
 def get_inspecoes_por_equipamento(prefixo_equipamento):
     conn = None
     try:
-        conn = get_db_connection()
+        conn = get_db_read_connection()
         layout_query = """
             SELECT l.configuracao, t.tipo_obj
             FROM equipamentos e
@@ -166,23 +149,24 @@ def get_inspecoes_por_equipamento(prefixo_equipamento):
         layout_config = json.loads(layout_row['configuracao'])
         tipo_obj_equipamento = layout_row['tipo_obj']
 
-        inspecao_query = "SELECT posicao_agregado, data_medicao, medicao, num_fogo, estado_conservacao, modelo_pneu, medida_pneu FROM controle_pneus WHERE equipamento = ? ORDER BY data_medicao DESC"
+        inspecao_query = "SELECT posicao_agregado, data_medicao_iso AS data_medicao, medicao, num_fogo, estado_conservacao, modelo_pneu, medida_pneu FROM controle_pneus WHERE equipamento = ? ORDER BY data_medicao_iso DESC"
         df = pd.read_sql_query(inspecao_query, conn, params=(prefixo_equipamento,))
 
-        faixas = get_faixas_pneus(conn)
+        classificador = get_classificador_pneus(conn)
 
         if df.empty:
             return jsonify({ "layout": layout_config, "ultima_inspecao": {}, "tipo_obj": tipo_obj_equipamento })
 
-        df['data_medicao'] = pd.to_datetime(df['data_medicao'], errors='coerce')
+        df['data_medicao'] = pd.to_datetime(df['data_medicao'], format=FORMATO_ISO, errors='coerce')
         df.sort_values('data_medicao', ascending=False, na_position='last', inplace=True)
         ultima_inspecao_df = df.drop_duplicates('posicao_agregado')
+        faixas_info = classificador.classificar(ultima_inspecao_df['medicao'])
 
         ultima_inspecao = {}
-        for _, row in ultima_inspecao_df.iterrows():
+        for idx, row in ultima_inspecao_df.iterrows():
             pos_num = row['posicao_agregado'][:2] # Pega apenas os 2 primeiros dígitos
             medicao_val = row['medicao'] if pd.notna(row['medicao']) else None
-            faixa_info = classificar_medicao(medicao_val, faixas)
+            faixa_info = faixas_info[idx]
 
             ultima_inspecao[pos_num] = {
                 'medicao': medicao_val,
@@ -213,12 +197,99 @@ def get_inspecoes_por_equipamento(prefixo_equipamento):
         if conn:
             conn.close()
 
+def resumir_medicoes_por_equipamento(medicoes_df, classificador):
+    """
+    Calcula de uma só vez, para todos os equipamentos, o que a análise geral precisa
+    (em vez de filtrar `medicoes_df` por equipamento dentro de cada função).
+
+    Retorna:
+        - DataFrame indexado por equipamento com as colunas pneus_agregados,
+          posicoes_medidas, ultima_data, tem_critico e desatualizado.
+        - dict equipamento -> {posicao: {'faixa_info': ...}} com a última inspeção.
+    """
+    medicoes_df = medicoes_df.assign(
+        faixa_info=classificador.classificar(medicoes_df['medicao']),
+        critico=classificador.campo(medicoes_df['medicao'], 'status') == 'Crítico',
+    )
+
+    # Ordenado por equipamento e da medição mais recente para a mais antiga:
+    # a primeira linha de cada (equipamento, posição) é a última medição do pneu.
+    ordenado = medicoes_df.sort_values(['equipamento', 'data_medicao'], ascending=[True, False], na_position='last', kind='mergesort')
+    ultima_por_pneu = ordenado.drop_duplicates(['equipamento', 'posicao_agregado'])
+
+    validas = ordenado.dropna(subset=['medicao', 'data_medicao'])
+    ultima_valida = validas.drop_duplicates(['equipamento', 'posicao_agregado'])
+    sete_dias_atras = datetime.now() - timedelta(days=7)
+
+    por_equipamento = medicoes_df.groupby('equipamento')
+    resumo_df = pd.DataFrame({
+        'pneus_agregados': por_equipamento['posicao_agregado'].nunique(),
+        'ultima_data': por_equipamento['data_medicao'].max(),
+        'posicoes_medidas': validas.groupby('equipamento')['posicao_agregado'].nunique(),
+        'tem_critico': ultima_valida.groupby('equipamento')['critico'].any(),
+        'desatualizado': (ultima_valida['data_medicao'] < sete_dias_atras).groupby(ultima_valida['equipamento']).any(),
+    })
+
+    # Chave pelos 2 primeiros dígitos da posição; se duas posições coincidirem, vale a
+    # medição mais antiga (mesmo comportamento do dicionário montado em ordem decrescente).
+    ultima_inspecao = {}
+    ultima_por_pneu = ultima_por_pneu.dropna(subset=['posicao_agregado'])
+    for equip, posicao, faixa_info in zip(ultima_por_pneu['equipamento'], ultima_por_pneu['posicao_agregado'].str[:2], ultima_por_pneu['faixa_info']):
+        ultima_inspecao.setdefault(equip, {})[posicao] = {'faixa_info': faixa_info}
+
+    return resumo_df, ultima_inspecao
+
+def montar_status_equipamento(row):
+    """Monta o status da análise geral a partir de uma linha de `equip_df` já unida ao resumo das medições."""
+    if not row['configuracao'] or pd.isna(row['configuracao']):
+        return "Sem layout cadastrado"
+
+    if pd.isna(row['pneus_agregados']):
+        return "Faltando agregação | Faltando medição"
+
+    config = json.loads(row['configuracao'])
+    total_pneus_layout = sum(n['pneus_por_lado'] * 2 for n in config if n['tipo'] == 'eixo')
+
+    statuses = []
+    if row['pneus_agregados'] < total_pneus_layout:
+        statuses.append("Faltando agregação")
+
+    posicoes_medidas = 0 if pd.isna(row['posicoes_medidas']) else row['posicoes_medidas']
+    if posicoes_medidas < row['pneus_agregados']:
+        statuses.append("Faltando medição")
+
+    if row['tem_critico']:
+        statuses.append("Pneus com alto desgaste")
+
+    if row['desatualizado'] and "Faltando medição" not in statuses:
+        statuses.append("Sem medições recentes")
+
+    if not statuses:
+        return "OK"
+
+    return " | ".join(statuses)
+
+def analisar_equipamentos(equip_df, medicoes_df, classificador):
+    """
+    Acrescenta a `equip_df` as colunas status, ultima_inspecao, pneus_agregados e
+    ultima_medicao da análise geral (ver backend/benchmarks/pneus_analise_geral.py).
+    """
+    resumo_df, ultima_inspecao = resumir_medicoes_por_equipamento(medicoes_df, classificador)
+    equip_df = equip_df.merge(resumo_df, left_on='equipamento', right_index=True, how='left')
+    equip_df[['tem_critico', 'desatualizado']] = equip_df[['tem_critico', 'desatualizado']].fillna(False).astype(bool)
+
+    equip_df['status'] = equip_df.apply(montar_status_equipamento, axis=1)
+    equip_df['ultima_inspecao'] = equip_df['equipamento'].map(lambda equip: ultima_inspecao.get(equip, {}))
+    equip_df['pneus_agregados'] = equip_df['pneus_agregados'].fillna(0).astype(int)
+    equip_df['ultima_medicao'] = equip_df['ultima_data'].dt.strftime('%d/%m/%Y').fillna('Sem medições')
+    return equip_df
+
 @bp.route('/analise-geral', methods=['GET'])
-@cache.cached(timeout=0, query_string=True) # Cache infinito, seguro por filtros
+@cache.cached(timeout=0, query_string=True, key_prefix=prefixo_versionado('centros_custo', *TABELAS_INSPECAO)) # Cache infinito, seguro por filtros e versões
 def get_analise_geral():
     conn = None
     try:
-        conn = get_db_connection()
+        conn = get_db_read_connection()
 
         equipamentos_query = """
             SELECT e.equipamento, cc.nome_cc, t.tipo_obj, l.configuracao
@@ -232,94 +303,14 @@ def get_analise_geral():
         if equip_df.empty:
             return jsonify([])
 
-        faixas = get_faixas_pneus(conn)
+        classificador = get_classificador_pneus(conn)
 
         placeholders = ','.join('?' for _ in equip_df['equipamento'])
-        medicoes_query = f"SELECT equipamento, posicao_agregado, data_medicao, medicao, num_fogo FROM controle_pneus WHERE equipamento IN ({placeholders})"
+        medicoes_query = f"SELECT equipamento, posicao_agregado, data_medicao_iso AS data_medicao, medicao, num_fogo FROM controle_pneus WHERE equipamento IN ({placeholders})"
         medicoes_df = pd.read_sql_query(medicoes_query, conn, params=tuple(equip_df['equipamento'].tolist()))
-        medicoes_df['data_medicao'] = pd.to_datetime(medicoes_df['data_medicao'], errors='coerce')
-
-        def analyze_status(row):
-            statuses = []
-            equip_nome = row['equipamento']
-
-            if not row['configuracao'] or pd.isna(row['configuracao']):
-                statuses.append("Sem layout cadastrado")
-                return " | ".join(statuses)
-
-            config = json.loads(row['configuracao'])
-            total_pneus_layout = sum(n['pneus_por_lado'] * 2 for n in config if n['tipo'] == 'eixo')
-
-            medicoes_equip = medicoes_df[medicoes_df['equipamento'] == equip_nome]
-
-            if medicoes_equip.empty:
-                statuses.append("Faltando agregação")
-                statuses.append("Faltando medição")
-                return " | ".join(statuses)
-
-            agregados_unicos = medicoes_equip['posicao_agregado'].nunique()
-            if agregados_unicos < total_pneus_layout:
-                statuses.append("Faltando agregação")
-
-            medicoes_validas = medicoes_equip.dropna(subset=['medicao', 'data_medicao'])
-
-            if medicoes_validas['posicao_agregado'].nunique() < agregados_unicos:
-                statuses.append("Faltando medição")
-
-            pneus_criticos = 0
-            sem_medicoes_recentes = False
-            sete_dias_atras = datetime.now() - timedelta(days=7)
-
-            ultima_medicao_por_pneu = medicoes_validas.sort_values('data_medicao', ascending=False).drop_duplicates('posicao_agregado')
-
-            for _, med in ultima_medicao_por_pneu.iterrows():
-                faixa = classificar_medicao(med['medicao'], faixas)
-                if faixa and faixa['status'] == 'Crítico':
-                    pneus_criticos += 1
-                if med['data_medicao'] < sete_dias_atras:
-                    sem_medicoes_recentes = True
-
-            if pneus_criticos > 0:
-                statuses.append("Pneus com alto desgaste")
-
-            if sem_medicoes_recentes and "Faltando medição" not in statuses:
-                 statuses.append("Sem medições recentes")
+        medicoes_df['data_medicao'] = pd.to_datetime(medicoes_df['data_medicao'], format=FORMATO_ISO, errors='coerce')
 
-            if not statuses:
-                return "OK"
-
-            return " | ".join(statuses)
-
-        equip_df['status'] = equip_df.apply(analyze_status, axis=1)
-
-        def get_ultima_inspecao(equip_nome):
-            medicoes_equip = medicoes_df[medicoes_df['equipamento'] == equip_nome]
-            if medicoes_equip.empty:
-                return {}
-
-            medicoes_equip.sort_values('data_medicao', ascending=False, na_position='last', inplace=True)
-            ultima_inspecao_df = medicoes_equip.drop_duplicates('posicao_agregado')
-
-            ultima_inspecao = {}
-            for _, row in ultima_inspecao_df.iterrows():
-                pos_num = row['posicao_agregado'][:2]
-                medicao_val = row['medicao'] if pd.notna(row['medicao']) else None
-                faixa_info = classificar_medicao(medicao_val, faixas)
-                ultima_inspecao[pos_num] = { 'faixa_info': faixa_info }
-            return ultima_inspecao
-
-        equip_df['ultima_inspecao'] = equip_df['equipamento'].apply(get_ultima_inspecao)
-
-        def get_pneus_agregados_count(equip_nome):
-            return medicoes_df[medicoes_df['equipamento'] == equip_nome]['posicao_agregado'].nunique()
-
-        equip_df['pneus_agregados'] = equip_df['equipamento'].apply(get_pneus_agregados_count)
-
-        def get_ultima_medicao_data(equip_nome):
-            data = medicoes_df[medicoes_df['equipamento'] == equip_nome]['data_medicao'].max()
-            return data.strftime('%d/%m/%Y') if pd.notna(data) else 'Sem medições'
-
-        equip_df['ultima_medicao'] = equip_df['equipamento'].apply(get_ultima_medicao_data)
+        equip_df = analisar_equipamentos(equip_df, medicoes_df, classificador)
 
         equip_df['configuracao'] = equip_df['configuracao'].apply(lambda x: json.loads(x) if pd.notna(x) else None)
 
@@ -340,12 +331,12 @@ def get_analise_geral():
 # --- ROTAS PARA GERENCIAMENTO DE POSIÇÕES ---
 
 @bp.route('/posicoes', methods=['GET'])
-@cache.cached(timeout=0, query_string=True) # Cache infinito
+@cache.cached(timeout=0, query_string=True, key_prefix=prefixo_versionado('pneus_posicoes', 'controle_pneus')) # Cache infinito, invalidado pela versão das tabelas
 def listar_posicoes():
     """Lista posições classificadas e pendentes."""
     conn = None
     try:
-        conn = get_db_connection()
+        conn = get_db_read_connection()
 
         classificadas_db = conn.execute("SELECT id, nome_posicao, classificacao FROM pneus_posicoes ORDER BY nome_posicao").fetchall()
         classificadas = [dict(row) for row in classificadas_db]
@@ -369,10 +360,6 @@ def listar_posicoes():
 
 @bp.route('/posicoes', methods=['POST'])
 def adicionar_posicao():
-    # --- LIMPEZA DE CACHE ---
-    cache.delete_memoized(listar_posicoes)
-    # -------------------------
-
     dados = request.get_json()
     if not dados or 'nome_posicao' not in dados or 'classificacao' not in dados:
         return jsonify({"error": "Dados incompletos"}), 400
@@ -386,6 +373,7 @@ def adicionar_posicao():
             (dados['nome_posicao'], dados['classificacao'])
         )
         conn.commit()
+        tabelas_alteradas(conn, ['pneus_posicoes']) # Invalida o cache das rotas que leem a tabela
         return jsonify({"id": cursor.lastrowid, **dados}), 201
     except Exception as e:
         return jsonify({"error": str(e), "details": traceback.format_exc()}), 500
@@ -395,10 +383,6 @@ def adicionar_posicao():
 
 @bp.route('/posicoes/<int:posicao_id>', methods=['PUT'])
 def atualizar_posicao(posicao_id):
-    # --- LIMPEZA DE CACHE ---
-    cache.delete_memoized(listar_posicoes)
-    # -------------------------
-
     dados = request.get_json()
     if not dados or 'classificacao' not in dados:
         return jsonify({"error": "Dados incompletos"}), 400
@@ -411,6 +395,7 @@ def atualizar_posicao(posicao_id):
             (dados['classificacao'], posicao_id)
         )
         conn.commit()
+        tabelas_alteradas(conn, ['pneus_posicoes']) # Invalida o cache das rotas que leem a tabela
         return jsonify({"message": "Classificação atualizada com sucesso."})
     except Exception as e:
         return jsonify({"error": str(e), "details": traceback.format_exc()}), 500
@@ -420,15 +405,12 @@ def atualizar_posicao(posicao_id):
 
 @bp.route('/posicoes/<int:posicao_id>', methods=['DELETE'])
 def deletar_posicao(posicao_id):
-    # --- LIMPEZA DE CACHE ---
-    cache.delete_memoized(listar_posicoes)
-    # -------------------------
-
     conn = None
     try:
         conn = get_db_connection()
         conn.execute("DELETE FROM pneus_posicoes WHERE id = ?", (posicao_id,))
         conn.commit()
+        tabelas_alteradas(conn, ['pneus_posicoes']) # Invalida o cache das rotas que leem a tabela
         return jsonify({"message": "Classificação deletada com sucesso."})
     except Exception as e:
         return jsonify({"error": str(e), "details": traceback.format_exc()}), 500
@@ -438,12 +420,13 @@ def deletar_posicao(posicao_id):
 
 # ROTA PARA ANÁLISE DE ESTADOS DE PNEUS
 @bp.route('/analise-estados', methods=['GET'])
-@cache.cached(timeout=0, query_string=True) # Cache infinito, seguro por filtros
+@cache.cached(timeout=0, query_string=True, key_prefix=prefixo_versionado('controle_pneus', 'pneus_posicoes', 'faixas_definicoes')) # Cache infinito, seguro por filtros e versões
 def get_analise_estados():
     conn = None
     try:
-        conn = get_db_connection()
-        faixas = get_faixas_pneus(conn)
+        conn = get_db_read_connection()
+        classificador = get_classificador_pneus(conn)
+        faixas = classificador.faixas
 
         # Query principal para buscar as últimas medições de cada pneu
         query = """
@@ -452,7 +435,7 @@ def get_analise_estados():
                     cp.num_fogo,
                     cp.equipamento,
                     pp.classificacao,
-                    MAX(cp.data_medicao) as ultima_data
+                    MAX(cp.data_medicao_iso) as ultima_data
                 FROM controle_pneus cp
                 LEFT JOIN pneus_posicoes pp ON cp.posicao_agregado = pp.nome_posicao
                 WHERE cp.num_fogo IS NOT NULL AND cp.medicao IS NOT NULL
@@ -465,18 +448,15 @@ def get_analise_estados():
                 cp.medicao,
                 cp.posicao_agregado
             FROM UltimaMedicao um
-            JOIN controle_pneus cp ON um.num_fogo = cp.num_fogo AND um.ultima_data = cp.data_medicao
+            JOIN controle_pneus cp ON um.num_fogo = cp.num_fogo AND um.ultima_data = cp.data_medicao_iso
         """
         df = pd.read_sql_query(query, conn)
 
         if df.empty:
             return jsonify({"graficos": [], "tabela_detalhes": []})
 
-        # Classifica cada medição
-        def get_faixa_info(medicao):
-            return classificar_medicao(medicao, faixas)
-
-        df['faixa_info'] = df['medicao'].apply(get_faixa_info)
+        # Classifica todas as medições de uma vez
+        df['faixa_info'] = classificador.classificar(df['medicao'])
         df.dropna(subset=['faixa_info'], inplace=True) # Remove pneus sem faixa correspondente
 
         # Prepara dados para os gráficos
@@ -515,11 +495,11 @@ def get_analise_estados():
 
 # --- ROTA PARA HISTÓRICO DE MEDIÇÕES (GERAL) ---
 @bp.route('/historico-medicoes', methods=['GET'])
-@cache.cached(timeout=0, query_string=True) # Cache infinito, seguro por filtros
+@cache.cached(timeout=0, query_string=True, key_prefix=prefixo_versionado('controle_pneus', 'calendario')) # Cache infinito, seguro por filtros e versões
 def get_historico_medicoes():
     conn = None
     try:
-        conn = get_db_connection()
+        conn = get_db_read_connection()
         query = """
             SELECT
                 cp.equipamento,
@@ -530,8 +510,8 @@ def get_historico_medicoes():
                 c.semanames,
                 COUNT(cp.medicao) as contagem
             FROM controle_pneus cp
-            JOIN calendario c ON DATE(cp.data_medicao) = c.data
-            WHERE cp.num_fogo IS NOT NULL AND cp.data_medicao IS NOT NULL AND cp.medicao IS NOT NULL
+            JOIN calendario c ON DATE(cp.data_medicao_iso) = c.data
+            WHERE cp.num_fogo IS NOT NULL AND cp.data_medicao_iso IS NOT NULL AND cp.medicao IS NOT NULL
             GROUP BY cp.equipamento, cp.num_fogo, c.ano, c.mes, c.mesext, c.semanames
             ORDER BY cp.equipamento, cp.num_fogo
         """
@@ -583,20 +563,16 @@ def get_historico_medicoes():
 
 # ROTA PARA HISTÓRICO DE AGREGAÇÃO DE UM PNEU
 @bp.route('/historico-agregacao/<num_fogo>', methods=['GET'])
-@cache.cached(timeout=0) # Cache infinito
+@cache.cached(timeout=0, key_prefix=prefixo_versionado('agregacao_pneus')) # Cache infinito, invalidado pela versão da tabela
 def get_historico_agregacao(num_fogo):
     conn = None
     try:
-        conn = get_db_connection()
+        conn = get_db_read_connection()
         query = """
             SELECT equipamento, data_entrada, horim_entrada, data_saida, horim_saida, posicao, motivo_desag
             FROM agregacao_pneus
             WHERE num_fogo = ?
-            ORDER BY
-                SUBSTR(data_entrada, 7, 4) DESC,
-                SUBSTR(data_entrada, 4, 2) DESC,
-                SUBSTR(data_entrada, 1, 2) DESC,
-                horim_entrada DESC
+            ORDER BY data_entrada_iso DESC, horim_entrada DESC
         """
         df = pd.read_sql_query(query, conn, params=(num_fogo,))
 
@@ -619,16 +595,16 @@ def get_historico_agregacao(num_fogo):
 
 # ROTA PARA HISTÓRICO DE MEDIÇÕES DE UM PNEU
 @bp.route('/historico-medicoes-pneu/<num_fogo>', methods=['GET'])
-@cache.cached(timeout=0) # Cache infinito
+@cache.cached(timeout=0, key_prefix=prefixo_versionado('controle_pneus')) # Cache infinito, invalidado pela versão da tabela
 def get_historico_medicoes_pneu(num_fogo):
     conn = None
     try:
-        conn = get_db_connection()
+        conn = get_db_read_connection()
         query = """
-            SELECT data_medicao, medicao
+            SELECT data_medicao_iso AS data_medicao, medicao
             FROM controle_pneus
-            WHERE num_fogo = ? AND medicao IS NOT NULL AND data_medicao IS NOT NULL
-            ORDER BY data_medicao DESC
+            WHERE num_fogo = ? AND medicao IS NOT NULL AND data_medicao_iso IS NOT NULL
+            ORDER BY data_medicao_iso DESC
         """
         df = pd.read_sql_query(query, conn, params=(num_fogo,))
 
@@ -639,7 +615,7 @@ def get_historico_medicoes_pneu(num_fogo):
         df['medicao_anterior'] = df['medicao'].shift(-1)
         df['desgaste'] = df['medicao_anterior'] - df['medicao']
         df['desgaste'] = df['desgaste'].apply(lambda x: round(x, 2) if (pd.notna(x) and x >= 0) else None)
-        df['data_medicao'] = pd.to_datetime(df['data_medicao']).dt.strftime('%d/%m/%Y %H:%M')
+        df['data_medicao'] = pd.to_datetime(df['data_medicao'], format=FORMATO_ISO).dt.strftime('%d/%m/%Y %H:%M')
         df = df.replace({pd.NaT: None, np.nan: None})
         df = df.drop(columns=['medicao_anterior'])
         records = df.to_dict('records')
@@ -655,16 +631,16 @@ def get_historico_medicoes_pneu(num_fogo):
 
 # NOVO: ROTA PARA BUSCAR DETALHES DA ÚLTIMA MEDIÇÃO DE UM PNEU
 @bp.route('/pneu-detalhes/<num_fogo>', methods=['GET'])
-@cache.cached(timeout=0) # Cache infinito
+@cache.cached(timeout=0, key_prefix=prefixo_versionado('controle_pneus', 'faixas_definicoes')) # Cache infinito, invalidado pela versão das tabelas
 def get_pneu_detalhes(num_fogo):
     conn = None
     try:
-        conn = get_db_connection()
+        conn = get_db_read_connection()
         query = """
-            SELECT data_medicao, medicao, posicao_agregado
+            SELECT data_medicao_iso AS data_medicao, medicao, posicao_agregado
             FROM controle_pneus
-            WHERE num_fogo = ? AND medicao IS NOT NULL AND data_medicao IS NOT NULL
-            ORDER BY data_medicao DESC
+            WHERE num_fogo = ? AND medicao IS NOT NULL AND data_medicao_iso IS NOT NULL
+            ORDER BY data_medicao_iso DESC
             LIMIT 1
         """
         pneu_row = conn.execute(query, (num_fogo,)).fetchone()
@@ -674,7 +650,7 @@ def get_pneu_detalhes(num_fogo):
                 SELECT posicao_agregado
                 FROM controle_pneus
                 WHERE num_fogo = ? AND posicao_agregado IS NOT NULL
-                ORDER BY data_medicao DESC
+                ORDER BY data_medicao_iso DESC
                 LIMIT 1
             """
             last_pos_row = conn.execute(last_pos_query, (num_fogo,)).fetchone()
@@ -682,13 +658,12 @@ def get_pneu_detalhes(num_fogo):
             return jsonify({"num_fogo": num_fogo, "posicao_agregado": posicao})
 
 
-        faixas = get_faixas_pneus(conn)
-        faixa_info = classificar_medicao(pneu_row['medicao'], faixas)
+        faixa_info = get_classificador_pneus(conn).classificar_valor(pneu_row['medicao'])
 
         detalhes = {
             "num_fogo": num_fogo,
             "medicao": pneu_row['medicao'],
-            "data_medicao": pd.to_datetime(pneu_row['data_medicao']).strftime('%d/%m/%Y %H:%M'),
+            "data_medicao": datetime.strptime(pneu_row['data_medicao'], FORMATO_ISO).strftime('%d/%m/%Y %H:%M'),
             "faixa_info": faixa_info,
             "posicao_agregado": pneu_row['posicao_agregado']
         }
@@ -1,5 +1,13 @@
 from flask import Blueprint, jsonify, request
-from ..db import get_db_connection
+from ..db import get_db_read_connection
+from ..derivados import ao_alterar, estrutura_atualizada
+from .centros_custo import HIERARQUIA_TABELA
+from ..datas import FORMATO_ISO
+from ..versoes_dados import versoes
+from .. import cache
+import sqlite3
+import calendar
+import hashlib
 import pandas as pd
 import numpy as np
 import re
@@ -15,11 +23,348 @@ def get_mes_num(mes_abreviado):
              "Jul": 7, "Ago": 8, "Set": 9, "Out": 10, "Nov": 11, "Dez": 12}
     return meses.get(mes_abreviado)
 
+# --- Classificação vetorizada das OS (atrasada / antecipada / status pendente) ---
+# Regras compartilhadas por todas as rotas de aderência e pendências. Cada regra é
+# calculada com máscaras do pandas sobre a coluna inteira, sem apply linha a linha.
+
+def _tipo_contem(tipos, termo):
+    """Equivalente vetorizado de `termo in str(tipo).lower()`."""
+    return tipos.astype(str).str.lower().str.contains(termo, regex=False).fillna(False).astype(bool)
+
+def _ambos_preenchidos(a, b):
+    return a.notna() & b.notna()
+
+def _maior_que(a, b):
+    """Compara `a > b` apenas nas linhas em que os dois valores existem; as demais ficam False."""
+    validos = _ambos_preenchidos(a, b)
+    resultado = pd.Series(False, index=a.index)
+    if validos.any():
+        resultado[validos] = (a[validos] > b[validos]).to_numpy(dtype=bool)
+    return resultado
+
+def classificar_realizadas(df):
+    """
+    Adiciona ao DataFrame de OS realizadas as colunas datatermino_dt, datavencimento_dt,
+    'atrasada' e 'antecipada' (0/1). Espera as colunas normalizadas datatermino_iso e datavencimento_iso.
+    - Atrasada: tipo 'tempo' terminado após o vencimento, ou tipo 'marco' com
+      horímetro de término acima do horímetro de vencimento.
+    - Antecipada: tipo 'marco' terminado mais de 90 horas antes do vencimento.
+    """
+    df['datatermino_dt'] = pd.to_datetime(df['datatermino_iso'], format=FORMATO_ISO, errors='coerce')
+    df['datavencimento_dt'] = pd.to_datetime(df['datavencimento_iso'], format=FORMATO_ISO, errors='coerce')
+
+    tipo_tempo = _tipo_contem(df['tipo'], 'tempo')
+    tipo_marco = _tipo_contem(df['tipo'], 'marco')
+
+    atrasada = (tipo_tempo & _maior_que(df['datatermino_dt'], df['datavencimento_dt'])) | \
+               (tipo_marco & _maior_que(df['hor_termino'], df['hor_vencimento']))
+
+    horas_validas = tipo_marco & _ambos_preenchidos(df['hor_termino'], df['hor_vencimento'])
+    antecipada = pd.Series(False, index=df.index)
+    if horas_validas.any():
+        folga = df.loc[horas_validas, 'hor_vencimento'] - df.loc[horas_validas, 'hor_termino']
+        antecipada[horas_validas] = (folga > 90).to_numpy(dtype=bool)
+
+    df['atrasada'] = atrasada.astype(int)
+    df['antecipada'] = antecipada.astype(int)
+    return df
+
+def classificar_pendentes(df, data_atual):
+    """
+    Adiciona ao DataFrame de OS pendentes as colunas datavencimento_dt e
+    'status_pendente' ('Em Atraso' / 'Em Dia') em relação a `data_atual`.
+    Espera a coluna normalizada datavencimento_iso.
+    """
+    df['datavencimento_dt'] = pd.to_datetime(df['datavencimento_iso'], format=FORMATO_ISO, errors='coerce')
+
+    tipo_tempo = _tipo_contem(df['tipo'], 'tempo')
+    tipo_marco = _tipo_contem(df['tipo'], 'marco')
+
+    vencida_por_data = tipo_tempo & df['datavencimento_dt'].notna() & (df['datavencimento_dt'] < data_atual)
+    vencida_por_horimetro = tipo_marco & _maior_que(df['hor_atual'], df['hor_vencimento'])
+
+    df['status_pendente'] = np.where(vencida_por_data | vencida_por_horimetro, 'Em Atraso', 'Em Dia')
+    return df
+
+# --- Agregação das OS realizadas ---
+# Com AGREGACAO_NO_SQL ativo, as contagens de realizadas/atrasadas/antecipadas são
+# calculadas pelo próprio SQLite (CASE/SUM/GROUP BY) e só as linhas agregadas chegam
+# ao pandas. Com False, volta ao cálculo linha a linha em pandas (classificar_realizadas).
+AGREGACAO_NO_SQL = True
+
+_COLUNAS_GRUPO = {
+    'nome_cc': 'contrato.nome_cc',
+    'nome_nucleo': 'contrato.nome_nucleo',
+    'nome_superintendencia': 'contrato.nome_super',
+}
+
+_SQL_TIPO_TEMPO = "instr(lower(p.tipo), 'tempo') > 0"
+_SQL_TIPO_MARCO = "instr(lower(p.tipo), 'marco') > 0"
+# Mesmas regras de classificar_realizadas; comparações com NULL resultam em 0.
+_SQL_ATRASADA = (
+    f"CASE WHEN ({_SQL_TIPO_TEMPO} AND p.datatermino_iso > p.datavencimento_iso) "
+    f"OR ({_SQL_TIPO_MARCO} AND p.hor_termino > p.hor_vencimento) THEN 1 ELSE 0 END"
+)
+_SQL_ANTECIPADA = (
+    f"CASE WHEN {_SQL_TIPO_MARCO} AND (p.hor_vencimento - p.hor_termino) > 90 THEN 1 ELSE 0 END"
+)
+# Parte da regra de classificar_pendentes que não depende da data atual.
+_SQL_PENDENTE_ATRASO_HORIMETRO = f"CASE WHEN {_SQL_TIPO_MARCO} AND p.hor_atual > p.hor_vencimento THEN 1 ELSE 0 END"
+
+def _coluna_de_agrupamento(visao):
+    if visao.lower() == 'núcleo': return "nome_nucleo"
+    if visao.lower() == 'superintendência': return "nome_superintendencia"
+    return "nome_cc"
+
+def _chaves_de_agrupamento(agrupamento):
+    return ['ano', 'mes'] if agrupamento == 'mes' else [agrupamento]
+
+def _agregar_realizadas_sql(conn, from_where, params, agrupamento):
+    if agrupamento == 'mes':
+        chaves = ("CAST(strftime('%Y', p.datatermino_iso) AS INTEGER) AS ano, "
+                  "CAST(strftime('%m', p.datatermino_iso) AS INTEGER) AS mes")
+        filtro = "p.datatermino_iso IS NOT NULL"
+        grupo = "1, 2"
+    else:
+        coluna = _COLUNAS_GRUPO[agrupamento]
+        chaves = f"{coluna} AS {agrupamento}"
+        filtro = f"{coluna} IS NOT NULL"
+        grupo = "1"
+
+    query = f"""
+        SELECT
+            {chaves},
+            COUNT(*) AS total_realizadas,
+            SUM({_SQL_ATRASADA}) AS total_atrasadas,
+            SUM({_SQL_ANTECIPADA}) AS total_antecipadas
+        {from_where} AND {filtro}
+        GROUP BY {grupo}
+        ORDER BY {grupo}
+    """
+    return pd.read_sql_query(query, conn, params=params)
+
+def _agregar_realizadas_pandas(conn, from_where, params, agrupamento):
+    colunas = "p.datatermino_iso, p.datavencimento_iso, p.hor_termino, p.hor_vencimento, p.tipo"
+    if agrupamento != 'mes':
+        colunas += f", {_COLUNAS_GRUPO[agrupamento]} AS {agrupamento}"
+    chaves = _chaves_de_agrupamento(agrupamento)
+
+    df = pd.read_sql_query(f"SELECT {colunas} {from_where}", conn, params=params)
+    if df.empty:
+        return pd.DataFrame(columns=chaves + ['total_realizadas', 'total_atrasadas', 'total_antecipadas'])
+
+    classificar_realizadas(df)
+    if agrupamento == 'mes':
+        df.dropna(subset=['datatermino_dt'], inplace=True)
+        df['ano'] = df['datatermino_dt'].dt.year
+        df['mes'] = df['datatermino_dt'].dt.month
+    else:
+        df.dropna(subset=[agrupamento], inplace=True)
+
+    return df.groupby(chaves).agg(
+        total_realizadas=('atrasada', 'size'),
+        total_atrasadas=('atrasada', 'sum'),
+        total_antecipadas=('antecipada', 'sum')
+    ).reset_index()
+
+def _agregar_realizadas_resumo(conn, from_where, params, agrupamento):
+    if agrupamento == 'mes':
+        chaves = "p.ano AS ano, p.mes AS mes"
+        filtro = "p.ano IS NOT NULL"
+        grupo = "1, 2"
+    else:
+        coluna = _COLUNAS_GRUPO[agrupamento]
+        chaves = f"{coluna} AS {agrupamento}"
+        filtro = f"{coluna} IS NOT NULL"
+        grupo = "1"
+
+    query = f"""
+        SELECT
+            {chaves},
+            SUM(p.realizadas) AS total_realizadas,
+            SUM(p.atrasadas) AS total_atrasadas,
+            SUM(p.antecipadas) AS total_antecipadas
+        {from_where} AND {filtro}
+        GROUP BY {grupo}
+        ORDER BY {grupo}
+    """
+    return pd.read_sql_query(query, conn, params=params)
+
+def agregar_realizadas(conn, from_where, params, agrupamento, fonte='preventivas'):
+    """
+    Conta as OS realizadas, atrasadas e antecipadas por grupo.
+    Args:
+        from_where (str): trecho "FROM ... WHERE ..." montado por _consulta_realizadas (alias 'p').
+        agrupamento (str): 'nome_cc', 'nome_nucleo', 'nome_superintendencia' ou 'mes' (ano/mês de término).
+        fonte (str): 'preventivas' (tabela base) ou 'resumo' (RESUMO_TABELA).
+    Returns:
+        DataFrame com as chaves do agrupamento e as colunas total_realizadas,
+        total_atrasadas e total_antecipadas, ordenado pelas chaves.
+    """
+    if fonte == 'resumo':
+        return _agregar_realizadas_resumo(conn, from_where, params, agrupamento)
+    if AGREGACAO_NO_SQL:
+        return _agregar_realizadas_sql(conn, from_where, params, agrupamento)
+    return _agregar_realizadas_pandas(conn, from_where, params, agrupamento)
+
+
+# --- Resumo materializado (ano × mês × centro de custo × tipo × classificação) ---
+# Contagens pré-calculadas de realizadas/atrasadas/antecipadas/pendentes, reconstruídas
+# sempre que a tabela 'preventivas' é reimportada ou alterada (ver derivados.py).
+# O mês de referência é o do término para as realizadas e o do vencimento para as
+# pendentes; OS com data inválida ficam com ano/mês NULL. As pendentes também são separadas
+# pela data de vencimento ('vencimento', NULL nas realizadas): o atraso pela data depende
+# do dia da consulta e é calculado na rota; o atraso pelo horímetro já vem contado.
+# As rotas de KPI consultam o resumo quando todos os filtros da requisição podem ser
+# aplicados a ele e voltam à tabela base caso contrário.
+USAR_RESUMO = True
+RESUMO_TABELA = 'preventivas_resumo'
+
+# Colunas do resumo usadas pelas rotas: um resumo gravado por uma versão anterior, sem elas, é reconstruído.
+_COLUNAS_RESUMO = ('vencimento', 'realizadas', 'atrasadas', 'antecipadas', 'pendentes', 'pendentes_atraso_horimetro')
+
+def resumo_atualizado(conn):
+    """True se o resumo tem as colunas atuais e foi construído a partir da versão atual de 'preventivas' (ver versoes_dados.py)."""
+    try:
+        colunas = {row[1] for row in conn.execute(f"PRAGMA table_info({RESUMO_TABELA})").fetchall()}
+        return set(_COLUNAS_RESUMO) <= colunas and estrutura_atualizada(conn, reconstruir_resumo)
+    except sqlite3.Error:
+        return False
+
+@ao_alterar('preventivas', atualizado=resumo_atualizado)
+def reconstruir_resumo(conn):
+    """Recria RESUMO_TABELA a partir de 'preventivas' numa única transação. Retorna o número de linhas do resumo."""
+    realizada = "(p.datatermino IS NOT NULL AND p.datatermino != '')"
+    data_referencia = f"(CASE WHEN {realizada} THEN p.datatermino_iso ELSE p.datavencimento_iso END)"
+
+    if not conn.in_transaction:
+        conn.execute('BEGIN')
+    try:
+        conn.execute(f'DROP TABLE IF EXISTS {RESUMO_TABELA}')
+        # CREATE TABLE AS preserva a afinidade de cod_cc/tipo/classificacao da tabela base,
+        # então os JOINs e filtros comparam os valores exatamente como na consulta original.
+        conn.execute(f"""
+            CREATE TABLE {RESUMO_TABELA} AS
+            SELECT
+                CAST(strftime('%Y', {data_referencia}) AS INTEGER) AS ano,
+                CAST(strftime('%m', {data_referencia}) AS INTEGER) AS mes,
+                CASE WHEN {realizada} THEN NULL ELSE DATE(p.datavencimento_iso) END AS vencimento,
+                p.cod_cc AS cod_cc,
+                p.tipo AS tipo,
+                p.classificacao AS classificacao,
+                SUM(CASE WHEN {realizada} THEN 1 ELSE 0 END) AS realizadas,
+                SUM(CASE WHEN {realizada} THEN {_SQL_ATRASADA} ELSE 0 END) AS atrasadas,
+                SUM(CASE WHEN {realizada} THEN {_SQL_ANTECIPADA} ELSE 0 END) AS antecipadas,
+                SUM(CASE WHEN {realizada} THEN 0 ELSE 1 END) AS pendentes,
+                SUM(CASE WHEN {realizada} THEN 0 ELSE {_SQL_PENDENTE_ATRASO_HORIMETRO} END) AS pendentes_atraso_horimetro
+            FROM preventivas p
+            GROUP BY 1, 2, 3, 4, 5, 6
+        """)
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    linhas = conn.execute(f'SELECT COUNT(*) FROM {RESUMO_TABELA}').fetchone()[0]
+    print(f"Resumo de preventivas reconstruído ({linhas} linhas).")
+    return linhas
+
+def _periodo_em_dias(args):
+    """
+    data_inicio/data_fim como (datetime inicial, datetime final). Retorna None sem período e
+    False se alguma das datas não estiver exatamente no formato 'AAAA-MM-DD' (a tabela base
+    compara o texto recebido com as colunas `_iso`, o resumo não).
+    """
+    data_inicio, data_fim = args.get('data_inicio'), args.get('data_fim')
+    if not (data_inicio and data_fim):
+        return None
+    try:
+        inicio = datetime.strptime(data_inicio, '%Y-%m-%d')
+        fim = datetime.strptime(data_fim, '%Y-%m-%d')
+    except ValueError:
+        return False
+    if inicio.strftime('%Y-%m-%d') != data_inicio or fim.strftime('%Y-%m-%d') != data_fim:
+        return False
+    return inicio, fim
+
+def _periodo_em_meses(args):
+    """
+    Converte data_inicio/data_fim em (AAAAMM inicial, AAAAMM final) quando o período cobre
+    meses inteiros. Retorna None sem período e False se o período não puder ser expresso em meses.
+    """
+    periodo = _periodo_em_dias(args)
+    if not periodo:
+        return periodo
+    inicio, fim = periodo
+    ultimo_dia = calendar.monthrange(fim.year, fim.month)[1]
+    if inicio.day != 1 or fim.day != ultimo_dia:
+        return False
+    return inicio.year * 100 + inicio.month, fim.year * 100 + fim.month
+
+# --- Cache das rotas ---
+# As rotas são memorizadas por uma assinatura canônica dos filtros: listas ordenadas e
+# sem repetição, e os filtros de contratos/núcleos/superintendências trocados pelo conjunto
+# de cod_cc que eles selecionam. Assim `contratos=A,B`, `contratos=B,A` e o núcleo que
+# contém exatamente A e B usam a mesma entrada. A chave inclui a versão das tabelas lidas
+# (ver versoes_dados.py), então a importação de preventivas invalida o cache.
+# A taxa de acerto por rota aparece em /api/db/cache-estatisticas.
+
+TABELAS_LIDAS = ('preventivas', 'centros_custo', 'calendario')
+
+# Parâmetros com listas separadas por vírgula (a ordem dos itens não altera o resultado).
+_PARAMETROS_LISTA = (
+    'tipos', 'classificacoes', 'estados', 'controladores', 'gestores', 'mes_ano',
+    'contrato_nome', 'nucleo_nome', 'super_nome', 'contrato', 'núcleo', 'superintendência',
+)
+# Parâmetros substituídos pelos cod_cc que selecionam.
+_PARAMETROS_CONTRATOS = ('user_contracts', 'contratos', 'nucleos', 'superintendencias')
+# Valores padrão: omitir o parâmetro ou enviá-lo com o padrão dá o mesmo resultado.
+_PARAMETROS_PADRAO = {'exibicao': 'ativos', 'visao': 'Contrato'}
+
+def _assinatura_filtros(args, conn):
+    """Tupla canônica com os filtros da requisição (ver comentário acima)."""
+    assinatura = []
+    nomes = (set(args.keys()) | set(_PARAMETROS_PADRAO)) - set(_PARAMETROS_CONTRATOS)
+    for nome in sorted(nomes):
+        valor = args.get(nome, _PARAMETROS_PADRAO.get(nome))
+        if nome in _PARAMETROS_LISTA:
+            itens = valor.split(',')
+            if nome == 'classificacoes':
+                itens = [c.upper() for c in itens]
+            valor = tuple(sorted(set(itens)))
+        assinatura.append((nome, valor))
+
+    cod_ccs_usuario = _cod_ccs_do_usuario(args, conn)
+    assinatura.append(('cod_cc_usuario', None if cod_ccs_usuario is None else tuple(sorted(set(cod_ccs_usuario)))))
+    assinatura.append(('cod_cc', tuple(sorted(set(_cod_ccs_filtrados(args, conn))))))
+    return tuple(assinatura)
+
+def _chave_por_filtros(depende_do_dia):
+    def make_cache_key(*args, **kwargs):
+        conn = get_db_read_connection()
+        try:
+            partes = [request.path, versoes(conn, TABELAS_LIDAS), repr(_assinatura_filtros(request.args, conn))]
+        finally:
+            conn.close()
+        if depende_do_dia:
+            # Pendências são classificadas em relação à data atual.
+            partes.append(datetime.now().date().isoformat())
+        return 'preventivas/' + hashlib.sha256('|'.join(partes).encode('utf-8')).hexdigest()
+    return make_cache_key
+
+def _resposta_sem_erro(rv):
+    # As rotas retornam (resposta, status) apenas em caso de erro.
+    return not isinstance(rv, tuple)
+
+def cache_por_filtros(depende_do_dia=False):
+    """Decorador de cache das rotas de preventivas (cache infinito, invalidado pela versão das tabelas)."""
+    return cache.cached(timeout=0, make_cache_key=_chave_por_filtros(depende_do_dia), response_filter=_resposta_sem_erro)
+
 @bp.route('/preventivas/opcoes-filtro', methods=['GET'])
+@cache_por_filtros()
 def get_filtro_opcoes():
     conn = None
     try:
-        conn = get_db_connection()
+        conn = get_db_read_connection()
         classificacoes_db = conn.execute("SELECT DISTINCT classificacao FROM preventivas WHERE classificacao IS NOT NULL AND classificacao != '' ORDER BY classificacao").fetchall()
         classificacoes_formatadas = [row['classificacao'].capitalize() for row in classificacoes_db]
         
@@ -35,20 +380,43 @@ def get_filtro_opcoes():
     finally:
         if conn: conn.close()
 
+def _cod_ccs_do_usuario(args, conn):
+    """
+    cod_cc dos contratos do usuário (parâmetro user_contracts, com ids de centros_custo).
+    Retorna None quando não há restrição e uma lista vazia quando o usuário não tem contratos.
+    """
+    user_contracts_ids_str = args.get('user_contracts')
+    if user_contracts_ids_str is None:
+        return None
+    user_contracts_ids = user_contracts_ids_str.split(',') if user_contracts_ids_str else []
+    if not user_contracts_ids:
+        return []
+
+    placeholders = ','.join('?' for _ in user_contracts_ids)
+    cod_cc_rows = conn.execute(f"SELECT cod_cc FROM centros_custo WHERE id IN ({placeholders})", user_contracts_ids).fetchall()
+    return [row['cod_cc'] for row in cod_cc_rows]
+
+def _cod_ccs_filtrados(args, conn):
+    """cod_cc dos filtros globais (contratos, senão núcleos, senão superintendências). Lista vazia = sem filtro."""
+    if args.get('contratos'):
+        return args.get('contratos').split(',')
+    if args.get('nucleos'):
+        nucleos = tuple(args.get('nucleos').split(','))
+        contratos_de_nucleos = conn.execute(f"SELECT cod_cc FROM {HIERARQUIA_TABELA} WHERE pai_id IN ({','.join('?' for _ in nucleos)})", nucleos).fetchall()
+        return [row['cod_cc'] for row in contratos_de_nucleos]
+    if args.get('superintendencias'):
+        supers = tuple(args.get('superintendencias').split(','))
+        contratos_de_supers = conn.execute(f"SELECT cod_cc FROM {HIERARQUIA_TABELA} WHERE pai_nucleo IN ({','.join('?' for _ in supers)})", supers).fetchall()
+        return [row['cod_cc'] for row in contratos_de_supers]
+    return []
+
 def build_query_and_params(args, conn, initial_where_clause, date_column_name=None):
     """Constrói a cláusula WHERE e os parâmetros com base nos argumentos da requisição."""
     where_clauses = [initial_where_clause]
     params = []
     
-    user_contracts_ids_str = args.get('user_contracts')
-    if user_contracts_ids_str is not None:
-        user_contracts_ids = user_contracts_ids_str.split(',') if user_contracts_ids_str else []
-        if not user_contracts_ids: return None, None
-        
-        placeholders = ','.join('?' for _ in user_contracts_ids)
-        cod_cc_rows = conn.execute(f"SELECT cod_cc FROM centros_custo WHERE id IN ({placeholders})", user_contracts_ids).fetchall()
-        user_contracts_cod_cc_list = [row['cod_cc'] for row in cod_cc_rows]
-        
+    user_contracts_cod_cc_list = _cod_ccs_do_usuario(args, conn)
+    if user_contracts_cod_cc_list is not None:
         if not user_contracts_cod_cc_list: return None, None
 
         user_contracts_tuple = tuple(user_contracts_cod_cc_list)
@@ -56,21 +424,7 @@ def build_query_and_params(args, conn, initial_where_clause, date_column_name=No
         params.extend(user_contracts_tuple)
 
     # Lida com filtros GLOBAIS (que vêm com CÓDIGOS)
-    cod_ccs_filtrados = []
-    if args.get('contratos'):
-        cod_ccs_filtrados.extend(args.get('contratos').split(','))
-    elif args.get('nucleos'):
-        nucleos = tuple(args.get('nucleos').split(','))
-        contratos_de_nucleos = conn.execute(f"SELECT cod_cc FROM centros_custo WHERE pai_id IN ({','.join('?' for _ in nucleos)})", nucleos).fetchall()
-        cod_ccs_filtrados.extend([row['cod_cc'] for row in contratos_de_nucleos])
-    elif args.get('superintendencias'):
-        supers = tuple(args.get('superintendencias').split(','))
-        nucleos_de_supers = conn.execute(f"SELECT cod_cc FROM centros_custo WHERE pai_id IN ({','.join('?' for _ in supers)})", supers).fetchall()
-        if nucleos_de_supers:
-            nucleos_ids = tuple([row['cod_cc'] for row in nucleos_de_supers])
-            contratos_de_supers = conn.execute(f"SELECT cod_cc FROM centros_custo WHERE pai_id IN ({','.join('?' for _ in nucleos_ids)})", nucleos_ids).fetchall()
-            cod_ccs_filtrados.extend([row['cod_cc'] for row in contratos_de_supers])
-
+    cod_ccs_filtrados = _cod_ccs_filtrados(args, conn)
     if cod_ccs_filtrados:
         where_clauses.append(f"contrato.cod_cc IN ({','.join('?' for _ in cod_ccs_filtrados)})")
         params.extend(cod_ccs_filtrados)
@@ -82,11 +436,11 @@ def build_query_and_params(args, conn, initial_where_clause, date_column_name=No
         params.extend(values)
     if args.get('nucleo_nome'):
         values = tuple(args.get('nucleo_nome').split(','))
-        where_clauses.append(f"nucleo.nome_cc IN ({','.join('?' for _ in values)})")
+        where_clauses.append(f"contrato.nome_nucleo IN ({','.join('?' for _ in values)})")
         params.extend(values)
     if args.get('super_nome'):
         values = tuple(args.get('super_nome').split(','))
-        where_clauses.append(f"super.nome_cc IN ({','.join('?' for _ in values)})")
+        where_clauses.append(f"contrato.nome_super IN ({','.join('?' for _ in values)})")
         params.extend(values)
 
 
@@ -102,10 +456,8 @@ def build_query_and_params(args, conn, initial_where_clause, date_column_name=No
     data_inicio = args.get('data_inicio')
     data_fim = args.get('data_fim')
     if data_inicio and data_fim and date_column_name:
-        if date_column_name == 'datavencimento':
-            where_clauses.append(f"DATE(p.datavencimento) BETWEEN ? AND ?")
-        else: 
-            where_clauses.append(f"DATE(p.{date_column_name}) BETWEEN ? AND ?")
+        # Compara a coluna normalizada diretamente (usa o índice); o fim do período é inclusivo.
+        where_clauses.append(f"p.{date_column_name}_iso >= ? AND p.{date_column_name}_iso < date(?, '+1 day')")
         params.extend([data_inicio, data_fim])
 
     tipos = args.get('tipos')
@@ -123,73 +475,114 @@ def build_query_and_params(args, conn, initial_where_clause, date_column_name=No
     return " AND ".join(where_clauses), params
 
 
-@bp.route('/preventivas/realizadas', methods=['GET'])
-def get_preventivas_realizadas_data():
-    conn = None
-    try:
-        conn = get_db_connection()
-        args = request.args
-        visao = args.get('visao', 'Contrato')
-        mes_ano_filter = args.get('mes_ano')
-        
+def _consulta_realizadas(args, conn, filtrar_mes_ano=False, filtrar_visao=False):
+    """
+    Monta o trecho "FROM ... WHERE ..." das OS realizadas com os filtros da requisição.
+    Usa o resumo materializado quando possível.
+    Returns:
+        tuple: (from_where, params, fonte) ou (None, None, None) se o usuário não tem contratos.
+    """
+    periodo = _periodo_em_meses(args)
+    fonte = 'resumo' if USAR_RESUMO and periodo is not False and resumo_atualizado(conn) else 'preventivas'
+
+    if fonte == 'resumo':
+        where_string, params = build_query_and_params(args, conn, "p.realizadas > 0")
+        if where_string is None:
+            return None, None, None
+        if periodo:
+            where_string += " AND (p.ano * 100 + p.mes) BETWEEN ? AND ?"
+            params.extend(periodo)
+        tabela = f"{RESUMO_TABELA} p"
+    else:
         where_string, params = build_query_and_params(args, conn, "p.datatermino IS NOT NULL AND p.datatermino != ''", date_column_name='datatermino')
         if where_string is None:
-            return jsonify({'aderencia_por_grupo': []})
+            return None, None, None
+        tabela = "preventivas p"
+
+    mes_ano_filter = args.get('mes_ano') if filtrar_mes_ano else None
+    join_calendario = "JOIN calendario cal ON DATE(p.datatermino_iso) = cal.data" if mes_ano_filter and fonte == 'preventivas' else ""
+    if mes_ano_filter:
+        prefixo = 'p' if fonte == 'resumo' else 'cal'
+        mes_ano_conditions = []
+        for item in mes_ano_filter.split(','):
+            mes_str, ano_str = item.split('/')
+            ano_completo = f"20{ano_str}"
+            mes_num = get_mes_num(mes_str)
+            if mes_num:
+                mes_ano_conditions.append(f"({prefixo}.mes = ? AND {prefixo}.ano = ?)")
+                params.extend([mes_num, ano_completo])
+        if mes_ano_conditions:
+            where_string += f" AND ({ ' OR '.join(mes_ano_conditions) })"
+
+    if filtrar_visao:
+        visao_map = {'contrato': 'contrato.nome_cc', 'núcleo': 'contrato.nome_nucleo', 'superintendência': 'contrato.nome_super'}
+        for visao_key, db_col in visao_map.items():
+            if args.get(visao_key):
+                valores = tuple(args.get(visao_key).split(','))
+                where_string += f" AND {db_col} IN ({','.join('?' for _ in valores)})"
+                params.extend(valores)
 
-        join_calendario = "JOIN calendario cal ON DATE(p.datatermino) = cal.data" if mes_ano_filter else ""
-        
-        if mes_ano_filter:
-            mes_ano_list = mes_ano_filter.split(',')
-            mes_ano_conditions = []
-            for item in mes_ano_list:
-                mes_str, ano_str = item.split('/')
-                ano_completo = f"20{ano_str}"
-                mes_num = get_mes_num(mes_str)
-                if mes_num:
-                    mes_ano_conditions.append("(cal.mes = ? AND cal.ano = ?)")
-                    params.extend([mes_num, ano_completo])
-            if mes_ano_conditions:
-                where_string += f" AND ({ ' OR '.join(mes_ano_conditions) })"
-        
-        base_query = f"""
-            SELECT
-                p.datatermino, p.datavencimento, p.hor_termino, p.hor_vencimento, p.tipo,
-                contrato.nome_cc, nucleo.nome_cc as nome_nucleo, super.nome_cc as nome_superintendencia
-            FROM preventivas p
-            LEFT JOIN centros_custo contrato ON p.cod_cc = contrato.cod_cc
-            LEFT JOIN centros_custo nucleo ON contrato.pai_id = nucleo.cod_cc
-            LEFT JOIN centros_custo super ON nucleo.pai_id = super.cod_cc
+    from_where = f"""
+            FROM {tabela}
+            LEFT JOIN {HIERARQUIA_TABELA} contrato ON p.cod_cc = contrato.cod_cc
             {join_calendario}
             WHERE {where_string}
         """
-        
-        df = pd.read_sql_query(base_query, conn, params=params)
-        
-        if df.empty: return jsonify({'aderencia_por_grupo': []})
+    return from_where, params, fonte
+
+
+def _consulta_pendentes(args, conn):
+    """
+    Monta o trecho "FROM ... WHERE ..." das OS pendentes com os filtros da requisição.
+    Usa o resumo materializado quando possível: no resumo cada linha conta p.pendentes OS.
+    Returns:
+        tuple: (from_where, params, fonte) ou (None, None, None) se o usuário não tem contratos.
+    """
+    periodo = _periodo_em_dias(args)
+    fonte = 'resumo' if USAR_RESUMO and periodo is not False and resumo_atualizado(conn) else 'preventivas'
+
+    if fonte == 'resumo':
+        where_string, params = build_query_and_params(args, conn, "p.pendentes > 0")
+        if where_string is not None and periodo:
+            where_string += " AND p.vencimento >= ? AND p.vencimento <= ?"
+            params.extend(data.strftime('%Y-%m-%d') for data in periodo)
+        tabela = f"{RESUMO_TABELA} p"
+    else:
+        where_string, params = build_query_and_params(args, conn, "(p.datatermino IS NULL OR p.datatermino = '')", date_column_name='datavencimento')
+        tabela = "preventivas p"
+    if where_string is None:
+        return None, None, None
 
-        df['datatermino_dt'] = pd.to_datetime(df['datatermino'], errors='coerce')
-        df['datavencimento_dt'] = pd.to_datetime(df['datavencimento'], dayfirst=True, errors='coerce')
+    from_where = f"""
+            FROM {tabela}
+            LEFT JOIN {HIERARQUIA_TABELA} contrato ON p.cod_cc = contrato.cod_cc
+            WHERE {where_string}
+        """
+    return from_where, params, fonte
 
-        df['atrasada'] = df.apply(
-            lambda row: 1 if (
-                'tempo' in str(row['tipo']).lower() and pd.notna(row['datatermino_dt']) and pd.notna(row['datavencimento_dt']) and row['datatermino_dt'] > row['datavencimento_dt']
-            ) or (
-                'marco' in str(row['tipo']).lower() and pd.notna(row['hor_termino']) and pd.notna(row['hor_vencimento']) and row['hor_termino'] > row['hor_vencimento']
-            ) else 0,
-            axis=1
-        )
+def _sql_pendentes_em_atraso():
+    """Contagem de pendentes em atraso de cada linha do resumo (mesma regra de classificar_pendentes); recebe a data atual como parâmetro."""
+    return f"CASE WHEN {_SQL_TIPO_TEMPO} AND p.vencimento < ? THEN p.pendentes ELSE p.pendentes_atraso_horimetro END"
+
+
+@bp.route('/preventivas/realizadas', methods=['GET'])
+@cache_por_filtros()
+def get_preventivas_realizadas_data():
+    conn = None
+    try:
+        conn = get_db_read_connection()
+        args = request.args
+        visao = args.get('visao', 'Contrato')
 
-        if visao.lower() == 'núcleo': grouping_col_name = "nome_nucleo"
-        elif visao.lower() == 'superintendência': grouping_col_name = "nome_superintendencia"
-        else: grouping_col_name = "nome_cc"
+        from_where, params, fonte = _consulta_realizadas(args, conn, filtrar_mes_ano=True)
+        if from_where is None:
+            return jsonify({'aderencia_por_grupo': []})
+        grouping_col_name = _coluna_de_agrupamento(visao)
 
-        df.dropna(subset=[grouping_col_name], inplace=True)
-        if df.empty: return jsonify({'aderencia_por_grupo': []})
+        aderencia_grupo = agregar_realizadas(conn, from_where, params, grouping_col_name, fonte)
+        if aderencia_grupo.empty: return jsonify({'aderencia_por_grupo': []})
 
-        aderencia_grupo = df.groupby(grouping_col_name).agg(
-            total_realizadas=('atrasada', 'size'),
-            total_atrasadas=('atrasada', 'sum')
-        ).reset_index()
+        aderencia_grupo = aderencia_grupo[[grouping_col_name, 'total_realizadas', 'total_atrasadas']]
 
         aderencia_grupo['aderencia'] = aderencia_grupo.apply(
             lambda row: round(((row['total_realizadas'] - row['total_atrasadas']) / row['total_realizadas'] * 100), 1) if row['total_realizadas'] > 0 else 100,
@@ -207,59 +600,19 @@ def get_preventivas_realizadas_data():
         if conn: conn.close()
 
 @bp.route('/preventivas/aderencia-mensal', methods=['GET'])
+@cache_por_filtros()
 def get_aderencia_mensal_data():
     conn = None
     try:
-        conn = get_db_connection()
+        conn = get_db_read_connection()
         args = request.args
-        
-        where_string, params = build_query_and_params(args, conn, "p.datatermino IS NOT NULL AND p.datatermino != ''", date_column_name='datatermino')
-        if where_string is None:
-            return jsonify({'aderencia_mensal': []})
-
-        visao_map = {'contrato': 'contrato.nome_cc', 'núcleo': 'nucleo.nome_cc', 'superintendência': 'super.nome_cc'}
-        for visao_key, db_col in visao_map.items():
-            if args.get(visao_key):
-                valores = tuple(args.get(visao_key).split(','))
-                where_string += f" AND {db_col} IN ({','.join('?' for _ in valores)})"
-                params.extend(valores)
 
-        query = f"""
-            SELECT
-                p.datatermino, p.datavencimento, p.hor_termino, p.hor_vencimento, p.tipo
-            FROM preventivas p
-            LEFT JOIN centros_custo contrato ON p.cod_cc = contrato.cod_cc
-            LEFT JOIN centros_custo nucleo ON contrato.pai_id = nucleo.cod_cc
-            LEFT JOIN centros_custo super ON nucleo.pai_id = super.cod_cc
-            WHERE {where_string}
-        """
-        
-        df = pd.read_sql_query(query, conn, params=params)
-        
-        if df.empty: return jsonify({'aderencia_mensal': []})
-
-        df['datatermino_dt'] = pd.to_datetime(df['datatermino'], errors='coerce')
-        df['datavencimento_dt'] = pd.to_datetime(df['datavencimento'], dayfirst=True, errors='coerce')
+        from_where, params, fonte = _consulta_realizadas(args, conn, filtrar_visao=True)
+        if from_where is None:
+            return jsonify({'aderencia_mensal': []})
 
-        df.dropna(subset=['datatermino_dt'], inplace=True)
-        if df.empty: return jsonify({'aderencia_mensal': []})
-
-        df['atrasada'] = df.apply(
-            lambda row: 1 if (
-                'tempo' in str(row['tipo']).lower() and pd.notna(row['datatermino_dt']) and pd.notna(row['datavencimento_dt']) and row['datatermino_dt'] > row['datavencimento_dt']
-            ) or (
-                'marco' in str(row['tipo']).lower() and pd.notna(row['hor_termino']) and pd.notna(row['hor_vencimento']) and row['hor_termino'] > row['hor_vencimento']
-            ) else 0,
-            axis=1
-        )
-        
-        df['ano'] = df['datatermino_dt'].dt.year
-        df['mes'] = df['datatermino_dt'].dt.month
-        
-        df_grouped = df.groupby(['ano', 'mes']).agg(
-            total_realizadas=('atrasada', 'size'),
-            total_atrasadas=('atrasada', 'sum')
-        ).reset_index()
+        df_grouped = agregar_realizadas(conn, from_where, params, 'mes', fonte)
+        if df_grouped.empty: return jsonify({'aderencia_mensal': []})
 
         df_grouped['aderencia'] = round(
             (df_grouped['total_realizadas'] - df_grouped['total_atrasadas']) / df_grouped['total_realizadas'] * 100, 1
@@ -281,79 +634,28 @@ def get_aderencia_mensal_data():
         if conn: conn.close()
 
 @bp.route('/preventivas/kpis-grupo', methods=['GET'])
+@cache_por_filtros()
 def get_kpis_por_grupo():
     conn = None
     try:
-        conn = get_db_connection()
+        conn = get_db_read_connection()
         args = request.args
         visao = args.get('visao', 'Contrato')
-        mes_ano_filter = args.get('mes_ano')
 
-        where_string, params = build_query_and_params(args, conn, "p.datatermino IS NOT NULL AND p.datatermino != ''", date_column_name='datatermino')
-        if where_string is None:
+        from_where, params, fonte = _consulta_realizadas(args, conn, filtrar_mes_ano=True)
+        if from_where is None:
             return jsonify({"atrasadas": [], "antecipadas": []})
-        
-        join_calendario = "JOIN calendario cal ON DATE(p.datatermino) = cal.data" if mes_ano_filter else ""
-        
-        if mes_ano_filter:
-            mes_ano_list = mes_ano_filter.split(',')
-            mes_ano_conditions = []
-            for item in mes_ano_list:
-                mes_str, ano_str = item.split('/')
-                ano_completo = f"20{ano_str}"
-                mes_num = get_mes_num(mes_str)
-                if mes_num:
-                    mes_ano_conditions.append("(cal.mes = ? AND cal.ano = ?)")
-                    params.extend([mes_num, ano_completo])
-            if mes_ano_conditions:
-                where_string += f" AND ({ ' OR '.join(mes_ano_conditions) })"
-
-        query = f"""
-            SELECT
-                p.datatermino, p.datavencimento, p.hor_termino, p.hor_vencimento, p.tipo,
-                contrato.nome_cc, nucleo.nome_cc as nome_nucleo, super.nome_cc as nome_superintendencia
-            FROM preventivas p
-            LEFT JOIN centros_custo contrato ON p.cod_cc = contrato.cod_cc
-            LEFT JOIN centros_custo nucleo ON contrato.pai_id = nucleo.cod_cc
-            LEFT JOIN centros_custo super ON nucleo.pai_id = super.cod_cc
-            {join_calendario}
-            WHERE {where_string}
-        """
-        df = pd.read_sql_query(query, conn, params=params)
-
-        if df.empty:
-            return jsonify({"atrasadas": [], "antecipadas": []})
-        
-        df['datatermino_dt'] = pd.to_datetime(df['datatermino'], errors='coerce')
-        df['datavencimento_dt'] = pd.to_datetime(df['datavencimento'], dayfirst=True, errors='coerce')
-
-        df['atrasada'] = df.apply(
-            lambda row: 1 if (
-                'tempo' in str(row['tipo']).lower() and pd.notna(row['datatermino_dt']) and pd.notna(row['datavencimento_dt']) and row['datatermino_dt'] > row['datavencimento_dt']
-            ) or (
-                'marco' in str(row['tipo']).lower() and pd.notna(row['hor_termino']) and pd.notna(row['hor_vencimento']) and row['hor_termino'] > row['hor_vencimento']
-            ) else 0,
-            axis=1
-        )
-        df['antecipada'] = df.apply(
-            lambda row: 1 if 'marco' in str(row['tipo']).lower() and pd.notna(row['hor_termino']) and pd.notna(row['hor_vencimento']) and (row['hor_vencimento'] - row['hor_termino']) > 90 else 0,
-            axis=1
-        )
-
-        if visao.lower() == 'núcleo': grouping_col_name = "nome_nucleo"
-        elif visao.lower() == 'superintendência': grouping_col_name = "nome_superintendencia"
-        else: grouping_col_name = "nome_cc"
+        grouping_col_name = _coluna_de_agrupamento(visao)
 
-        df.dropna(subset=[grouping_col_name], inplace=True)
-        if df.empty:
+        df_grouped = agregar_realizadas(conn, from_where, params, grouping_col_name, fonte)
+        if df_grouped.empty:
             return jsonify({"atrasadas": [], "antecipadas": []})
 
-        df_grouped = df.groupby(grouping_col_name).agg(
-            atrasadas_count=('atrasada', 'sum'),
-            antecipadas_count=('antecipada', 'sum')
-        ).reset_index()
-        
-        df_grouped.rename(columns={grouping_col_name: 'nome_grupo'}, inplace=True)
+        df_grouped = df_grouped.rename(columns={
+            grouping_col_name: 'nome_grupo',
+            'total_atrasadas': 'atrasadas_count',
+            'total_antecipadas': 'antecipadas_count'
+        })[['nome_grupo', 'atrasadas_count', 'antecipadas_count']]
 
         atrasadas_df = df_grouped[df_grouped['atrasadas_count'] > 0].sort_values('atrasadas_count', ascending=False)
         antecipadas_df = df_grouped[df_grouped['antecipadas_count'] > 0].sort_values('antecipadas_count', ascending=False)
@@ -369,89 +671,38 @@ def get_kpis_por_grupo():
         if conn: conn.close()
 
 @bp.route('/preventivas/kpis-gerais', methods=['GET'])
+@cache_por_filtros()
 def get_kpis_gerais():
     conn = None
     try:
-        conn = get_db_connection()
+        conn = get_db_read_connection()
         args = request.args
-        
-        where_string, params = build_query_and_params(args, conn, "p.datatermino IS NOT NULL AND p.datatermino != ''", date_column_name='datatermino')
-        if where_string is None:
-            return jsonify({})
 
-        mes_ano_filter = args.get('mes_ano')
-        join_calendario = "JOIN calendario cal ON DATE(p.datatermino) = cal.data" if mes_ano_filter else ""
-        if mes_ano_filter:
-            mes_ano_list = mes_ano_filter.split(',')
-            mes_ano_conditions = []
-            for item in mes_ano_list:
-                mes_str, ano_str = item.split('/')
-                ano_completo = f"20{ano_str}"
-                mes_num = get_mes_num(mes_str)
-                if mes_num:
-                    mes_ano_conditions.append("(cal.mes = ? AND cal.ano = ?)")
-                    params.extend([mes_num, ano_completo])
-            if mes_ano_conditions:
-                where_string += f" AND ({ ' OR '.join(mes_ano_conditions) })"
-        
-        visao_map = {'contrato': 'contrato.nome_cc', 'núcleo': 'nucleo.nome_cc', 'superintendência': 'super.nome_cc'}
-        for visao_key, db_col in visao_map.items():
-            if args.get(visao_key):
-                valores = tuple(args.get(visao_key).split(','))
-                where_string += f" AND {db_col} IN ({','.join('?' for _ in valores)})"
-                params.extend(valores)
+        from_where, params, fonte = _consulta_realizadas(args, conn, filtrar_mes_ano=True, filtrar_visao=True)
+        if from_where is None:
+            return jsonify({})
 
-        base_query = f"""
-            SELECT
-                p.datatermino, p.datavencimento, p.hor_termino, p.hor_vencimento, p.tipo
-            FROM preventivas p
-            LEFT JOIN centros_custo contrato ON p.cod_cc = contrato.cod_cc
-            LEFT JOIN centros_custo nucleo ON contrato.pai_id = nucleo.cod_cc
-            LEFT JOIN centros_custo super ON nucleo.pai_id = super.cod_cc
-            {join_calendario}
-            WHERE {where_string}
-        """
-        
-        df = pd.read_sql_query(base_query, conn, params=params)
-        
-        if df.empty:
+        # Agregado mensal: os totais gerais são a soma dos meses (OS com data de término válida).
+        df_grouped = agregar_realizadas(conn, from_where, params, 'mes', fonte)
+        if df_grouped.empty:
             return jsonify({
                 "aderencia_geral": 0, "total_geral_realizadas": 0, "total_geral_atrasadas": 0,
                 "aderencia_media": 0, "total_atrasadas": 0, "total_antecipadas": 0
             })
 
-        df['datatermino_dt'] = pd.to_datetime(df['datatermino'], errors='coerce')
-        df['datavencimento_dt'] = pd.to_datetime(df['datavencimento'], dayfirst=True, errors='coerce')
-        df.dropna(subset=['datatermino_dt'], inplace=True)
-
-        df['atrasada'] = df.apply(
-            lambda row: 1 if (
-                'tempo' in str(row['tipo']).lower() and pd.notna(row['datatermino_dt']) and pd.notna(row['datavencimento_dt']) and row['datatermino_dt'] > row['datavencimento_dt']
-            ) or (
-                'marco' in str(row['tipo']).lower() and pd.notna(row['hor_termino']) and pd.notna(row['hor_vencimento']) and row['hor_termino'] > row['hor_vencimento']
-            ) else 0,
-            axis=1
-        )
-        df['antecipada'] = df.apply(
-            lambda row: 1 if 'marco' in str(row['tipo']).lower() and pd.notna(row['hor_termino']) and pd.notna(row['hor_vencimento']) and (row['hor_vencimento'] - row['hor_termino']) > 90 else 0,
-            axis=1
-        )
-
-        total_geral_realizadas = int(df.shape[0])
-        total_geral_atrasadas = int(df['atrasada'].sum())
+        total_geral_realizadas = int(df_grouped['total_realizadas'].sum())
+        total_geral_atrasadas = int(df_grouped['total_atrasadas'].sum())
         aderencia_geral = round(((total_geral_realizadas - total_geral_atrasadas) / total_geral_realizadas * 100), 1) if total_geral_realizadas > 0 else 0
 
-        df['ano'] = df['datatermino_dt'].dt.year
-        df['mes'] = df['datatermino_dt'].dt.month
-        df_grouped = df.groupby(['ano', 'mes']).agg(
-            total_realizadas_mes=('atrasada', 'size'),
-            total_atrasadas_mes=('atrasada', 'sum')
-        ).reset_index()
+        df_grouped = df_grouped.rename(columns={
+            'total_realizadas': 'total_realizadas_mes',
+            'total_atrasadas': 'total_atrasadas_mes'
+        })
         df_grouped['aderencia'] = round((df_grouped['total_realizadas_mes'] - df_grouped['total_atrasadas_mes']) / df_grouped['total_realizadas_mes'] * 100, 1) if not df_grouped.empty and df_grouped['total_realizadas_mes'].iloc[0] > 0 else 100.0
         aderencia_media = round(df_grouped['aderencia'].mean(), 1) if not df_grouped.empty else 0
 
-        total_atrasadas = int(df['atrasada'].sum())
-        total_antecipadas = int(df['antecipada'].sum())
+        total_atrasadas = total_geral_atrasadas
+        total_antecipadas = int(df_grouped['total_antecipadas'].sum())
 
         return jsonify({
             "aderencia_geral": aderencia_geral,
@@ -469,59 +720,60 @@ def get_kpis_gerais():
 
 
 @bp.route('/preventivas/pendentes-status', methods=['GET'])
+@cache_por_filtros(depende_do_dia=True)
 def get_pendentes_status_data():
     conn = None
     try:
-        conn = get_db_connection()
+        conn = get_db_read_connection()
         args = request.args
         visao = args.get('visao', 'Contrato')
-        
-        where_string, params = build_query_and_params(args, conn, "(p.datatermino IS NULL OR p.datatermino = '')", date_column_name='datavencimento')
-        if where_string is None:
-            return jsonify({"em_atraso": [], "em_dia": []})
+        grouping_col_name = _coluna_de_agrupamento(visao)
 
-        query = f"""
-            SELECT
-                p.datavencimento, p.hor_atual, p.hor_vencimento, p.tipo,
-                contrato.nome_cc, nucleo.nome_cc as nome_nucleo, super.nome_cc as nome_superintendencia
-            FROM preventivas p
-            LEFT JOIN centros_custo contrato ON p.cod_cc = contrato.cod_cc
-            LEFT JOIN centros_custo nucleo ON contrato.pai_id = nucleo.cod_cc
-            LEFT JOIN centros_custo super ON nucleo.pai_id = super.cod_cc
-            WHERE {where_string}
-        """
-        
-        df = pd.read_sql_query(query, conn, params=params)
-        
-        if df.empty:
-            return jsonify({"em_atraso": [], "em_dia": []})
-
-        df['datavencimento_dt'] = pd.to_datetime(df['datavencimento'], dayfirst=True, errors='coerce')
-        data_atual = pd.to_datetime(datetime.now().date())
-
-        df['status_pendente'] = df.apply(
-            lambda row: 'Em Atraso' if (
-                'tempo' in str(row['tipo']).lower() and pd.notna(row['datavencimento_dt']) and data_atual > row['datavencimento_dt']
-            ) or (
-                'marco' in str(row['tipo']).lower() and pd.notna(row['hor_atual']) and pd.notna(row['hor_vencimento']) and row['hor_atual'] > row['hor_vencimento']
-            ) else 'Em Dia',
-            axis=1
-        )
-
-        if visao.lower() == 'núcleo': grouping_col_name = "nome_nucleo"
-        elif visao.lower() == 'superintendência': grouping_col_name = "nome_superintendencia"
-        else: grouping_col_name = "nome_cc"
-            
-        df.dropna(subset=[grouping_col_name], inplace=True)
-        if df.empty:
+        from_where, params, fonte = _consulta_pendentes(args, conn)
+        if from_where is None:
             return jsonify({"em_atraso": [], "em_dia": []})
 
-        counts = df.groupby([grouping_col_name, 'status_pendente']).size().unstack(fill_value=0)
-        
-        if 'Em Atraso' not in counts.columns: counts['Em Atraso'] = 0
-        if 'Em Dia' not in counts.columns: counts['Em Dia'] = 0
-        
-        counts.rename_axis('nome_grupo', inplace=True)
+        if fonte == 'resumo':
+            coluna = _COLUNAS_GRUPO[grouping_col_name]
+            query = f"""
+                SELECT
+                    {coluna} AS nome_grupo,
+                    SUM({_sql_pendentes_em_atraso()}) AS "Em Atraso",
+                    SUM(p.pendentes) - SUM({_sql_pendentes_em_atraso()}) AS "Em Dia"
+                {from_where} AND {coluna} IS NOT NULL
+                GROUP BY 1
+                ORDER BY 1
+            """
+            hoje = datetime.now().date().isoformat()
+            counts = pd.read_sql_query(query, conn, params=[hoje, hoje] + params, index_col='nome_grupo')
+            if counts.empty:
+                return jsonify({"em_atraso": [], "em_dia": []})
+        else:
+            query = f"""
+                SELECT
+                    p.datavencimento_iso, p.hor_atual, p.hor_vencimento, p.tipo,
+                    contrato.nome_cc, contrato.nome_nucleo as nome_nucleo, contrato.nome_super as nome_superintendencia
+                {from_where}
+            """
+
+            df = pd.read_sql_query(query, conn, params=params)
+
+            if df.empty:
+                return jsonify({"em_atraso": [], "em_dia": []})
+
+            data_atual = pd.to_datetime(datetime.now().date())
+            classificar_pendentes(df, data_atual)
+
+            df.dropna(subset=[grouping_col_name], inplace=True)
+            if df.empty:
+                return jsonify({"em_atraso": [], "em_dia": []})
+
+            counts = df.groupby([grouping_col_name, 'status_pendente']).size().unstack(fill_value=0)
+
+            if 'Em Atraso' not in counts.columns: counts['Em Atraso'] = 0
+            if 'Em Dia' not in counts.columns: counts['Em Dia'] = 0
+
+            counts.rename_axis('nome_grupo', inplace=True)
         
         em_atraso_df = counts[counts['Em Atraso'] > 0][['Em Atraso']].reset_index()
         em_atraso_df.rename(columns={'Em Atraso': 'count'}, inplace=True)
@@ -542,40 +794,40 @@ def get_pendentes_status_data():
         if conn: conn.close()
 
 @bp.route('/preventivas/kpis-pendentes', methods=['GET'])
+@cache_por_filtros(depende_do_dia=True)
 def get_kpis_pendentes():
     conn = None
     try:
-        conn = get_db_connection()
+        conn = get_db_read_connection()
         args = request.args
         
-        where_string, params = build_query_and_params(args, conn, "(p.datatermino IS NULL OR p.datatermino = '')", date_column_name='datavencimento')
-        if where_string is None:
+        from_where, params, fonte = _consulta_pendentes(args, conn)
+        if from_where is None:
             return jsonify({"total_pendentes": 0, "total_em_atraso": 0, "total_em_dia": 0})
 
+        if fonte == 'resumo':
+            query = f"""
+                SELECT COALESCE(SUM(p.pendentes), 0), COALESCE(SUM({_sql_pendentes_em_atraso()}), 0)
+                {from_where}
+            """
+            total_pendentes, total_em_atraso = conn.execute(query, [datetime.now().date().isoformat()] + params).fetchone()
+            return jsonify({
+                "total_pendentes": total_pendentes,
+                "total_em_atraso": total_em_atraso,
+                "total_em_dia": total_pendentes - total_em_atraso
+            })
+
         query = f"""
-            SELECT p.datavencimento, p.hor_atual, p.hor_vencimento, p.tipo
-            FROM preventivas p
-            LEFT JOIN centros_custo contrato ON p.cod_cc = contrato.cod_cc
-            LEFT JOIN centros_custo nucleo ON contrato.pai_id = nucleo.cod_cc
-            LEFT JOIN centros_custo super ON nucleo.pai_id = super.cod_cc
-            WHERE {where_string}
+            SELECT p.datavencimento_iso, p.hor_atual, p.hor_vencimento, p.tipo
+            {from_where}
         """
         df = pd.read_sql_query(query, conn, params=params)
         
         if df.empty:
             return jsonify({"total_pendentes": 0, "total_em_atraso": 0, "total_em_dia": 0})
 
-        df['datavencimento_dt'] = pd.to_datetime(df['datavencimento'], dayfirst=True, errors='coerce')
         data_atual = pd.to_datetime(datetime.now().date())
-
-        df['status_pendente'] = df.apply(
-            lambda row: 'Em Atraso' if (
-                'tempo' in str(row['tipo']).lower() and pd.notna(row['datavencimento_dt']) and data_atual > row['datavencimento_dt']
-            ) or (
-                'marco' in str(row['tipo']).lower() and pd.notna(row['hor_atual']) and pd.notna(row['hor_vencimento']) and row['hor_atual'] > row['hor_vencimento']
-            ) else 'Em Dia',
-            axis=1
-        )
+        classificar_pendentes(df, data_atual)
         
         total_pendentes = int(df.shape[0])
         total_em_atraso = int(df[df['status_pendente'] == 'Em Atraso'].shape[0])
@@ -594,17 +846,18 @@ def get_kpis_pendentes():
 
 
 @bp.route('/preventivas/pendentes-detalhes', methods=['GET'])
+@cache_por_filtros(depende_do_dia=True)
 def get_pendentes_detalhes_data():
     conn = None
     try:
-        conn = get_db_connection()
+        conn = get_db_read_connection()
         args = request.args
         
         where_string, params = build_query_and_params(args, conn, "(p.datatermino IS NULL OR p.datatermino = '')", date_column_name='datavencimento')
         if where_string is None:
             return jsonify([])
 
-        where_string += " AND ((LOWER(p.tipo) LIKE '%tempo%' AND DATE('now', 'localtime') > DATE(p.datavencimento)) OR (LOWER(p.tipo) LIKE '%marco%' AND p.hor_atual > p.hor_vencimento))"
+        where_string += " AND ((LOWER(p.tipo) LIKE '%tempo%' AND DATE('now', 'localtime') > DATE(p.datavencimento_iso)) OR (LOWER(p.tipo) LIKE '%marco%' AND p.hor_atual > p.hor_vencimento))"
 
         query = f"""
             SELECT
@@ -614,17 +867,15 @@ def get_pendentes_detalhes_data():
                 p.sl_fluig AS "SL Fluig",
                 CASE
                     WHEN p.datavencimento IS NOT NULL AND p.datavencimento != ''
-                    THEN strftime('%d/%m/%Y', p.datavencimento)
+                    THEN strftime('%d/%m/%Y', p.datavencimento_iso)
                     ELSE NULL
                 END AS "Data Vencimento",
                 p.hor_vencimento AS "Horimetro Vencimento",
                 p.hor_atual AS "Horimetro Atual"
             FROM preventivas p
-            LEFT JOIN centros_custo contrato ON p.cod_cc = contrato.cod_cc
-            LEFT JOIN centros_custo nucleo ON contrato.pai_id = nucleo.cod_cc
-            LEFT JOIN centros_custo super ON nucleo.pai_id = super.cod_cc
+            LEFT JOIN {HIERARQUIA_TABELA} contrato ON p.cod_cc = contrato.cod_cc
             WHERE {where_string}
-            ORDER BY DATE(p.datavencimento) ASC
+            ORDER BY p.datavencimento_iso ASC, p.numos ASC
         """
         
         detalhes = conn.execute(query, params).fetchall()
@@ -636,17 +887,18 @@ def get_pendentes_detalhes_data():
         if conn: conn.close()
 
 @bp.route('/preventivas/pendentes-em-dia-detalhes', methods=['GET'])
+@cache_por_filtros(depende_do_dia=True)
 def get_pendentes_em_dia_detalhes_data():
     conn = None
     try:
-        conn = get_db_connection()
+        conn = get_db_read_connection()
         args = request.args
         
         where_string, params = build_query_and_params(args, conn, "(p.datatermino IS NULL OR p.datatermino = '')", date_column_name='datavencimento')
         if where_string is None:
             return jsonify([])
 
-        where_string += " AND NOT ((LOWER(p.tipo) LIKE '%tempo%' AND DATE('now', 'localtime') > DATE(p.datavencimento)) OR (LOWER(p.tipo) LIKE '%marco%' AND p.hor_atual > p.hor_vencimento))"
+        where_string += " AND NOT ((LOWER(p.tipo) LIKE '%tempo%' AND DATE('now', 'localtime') > DATE(p.datavencimento_iso)) OR (LOWER(p.tipo) LIKE '%marco%' AND p.hor_atual > p.hor_vencimento))"
 
         query = f"""
             SELECT
@@ -656,17 +908,15 @@ def get_pendentes_em_dia_detalhes_data():
                 p.sl_fluig AS "SL Fluig",
                 CASE
                     WHEN p.datavencimento IS NOT NULL AND p.datavencimento != ''
-                    THEN strftime('%d/%m/%Y', p.datavencimento)
+                    THEN strftime('%d/%m/%Y', p.datavencimento_iso)
                     ELSE NULL
                 END AS "Data Vencimento",
                 p.hor_vencimento AS "Horimetro Vencimento",
                 p.hor_atual AS "Horimetro Atual"
             FROM preventivas p
-            LEFT JOIN centros_custo contrato ON p.cod_cc = contrato.cod_cc
-            LEFT JOIN centros_custo nucleo ON contrato.pai_id = nucleo.cod_cc
-            LEFT JOIN centros_custo super ON nucleo.pai_id = super.cod_cc
+            LEFT JOIN {HIERARQUIA_TABELA} contrato ON p.cod_cc = contrato.cod_cc
             WHERE {where_string}
-            ORDER BY DATE(p.datavencimento) ASC
+            ORDER BY p.datavencimento_iso ASC, p.numos ASC
         """
         
         detalhes = conn.execute(query, params).fetchall()
@@ -679,17 +929,18 @@ def get_pendentes_em_dia_detalhes_data():
 
 
 @bp.route('/preventivas/realizadas-detalhes', methods=['GET'])
+@cache_por_filtros()
 def get_realizadas_detalhes_data():
     conn = None
     try:
-        conn = get_db_connection()
+        conn = get_db_read_connection()
         args = request.args
         
         where_string, params = build_query_and_params(args, conn, "p.datatermino IS NOT NULL AND p.datatermino != ''", date_column_name='datatermino')
         if where_string is None:
             return jsonify([])
 
-        visao_map = {'contrato': 'contrato.nome_cc', 'núcleo': 'nucleo.nome_cc', 'superintendência': 'super.nome_cc'}
+        visao_map = {'contrato': 'contrato.nome_cc', 'núcleo': 'contrato.nome_nucleo', 'superintendência': 'contrato.nome_super'}
         for visao_key, db_col in visao_map.items():
             if args.get(visao_key):
                 valores = tuple(args.get(visao_key).split(','))
@@ -697,7 +948,7 @@ def get_realizadas_detalhes_data():
                 params.extend(valores)
 
         mes_ano_filter = args.get('mes_ano')
-        join_calendario = "JOIN calendario cal ON DATE(p.datatermino) = cal.data" if mes_ano_filter else ""
+        join_calendario = "JOIN calendario cal ON DATE(p.datatermino_iso) = cal.data" if mes_ano_filter else ""
         if mes_ano_filter:
             mes_ano_list = mes_ano_filter.split(',')
             mes_ano_conditions = []
@@ -714,7 +965,7 @@ def get_realizadas_detalhes_data():
         status_filter = args.get('status_filter')
         if status_filter:
             if status_filter == 'Atrasada':
-                where_string += " AND ((LOWER(p.tipo) LIKE '%tempo%' AND DATE(p.datatermino) > DATE(p.datavencimento)) OR (LOWER(p.tipo) LIKE '%marco%' AND p.hor_termino > p.hor_vencimento))"
+                where_string += " AND ((LOWER(p.tipo) LIKE '%tempo%' AND DATE(p.datatermino_iso) > DATE(p.datavencimento_iso)) OR (LOWER(p.tipo) LIKE '%marco%' AND p.hor_termino > p.hor_vencimento))"
             elif status_filter == 'Antecipada':
                 where_string += " AND (LOWER(p.tipo) LIKE '%marco%' AND p.hor_termino IS NOT NULL AND p.hor_vencimento IS NOT NULL AND (p.hor_vencimento - p.hor_termino) > 90)"
 
@@ -723,33 +974,31 @@ def get_realizadas_detalhes_data():
             SELECT
                 contrato.nome_cc AS "Centro de Custo",
                 p.equipamento AS "Equipamento",
-                strftime('%d/%m/%Y', p.datatermino) AS "Data",
+                strftime('%d/%m/%Y', p.datatermino_iso) AS "Data",
                 p.numos AS "Nº OS",
                 p.sl_fluig AS "SL Fluig",
                 CASE
                     WHEN LOWER(p.tipo) LIKE '%tempo%' THEN
                         CASE
-                            WHEN p.datavencimento IS NOT NULL AND p.datavencimento != '' THEN strftime('%d/%m/%Y', p.datavencimento)
+                            WHEN p.datavencimento IS NOT NULL AND p.datavencimento != '' THEN strftime('%d/%m/%Y', p.datavencimento_iso)
                             ELSE NULL
                         END
                     ELSE p.hor_vencimento
                 END AS "Vencimento",
                 CASE
-                    WHEN LOWER(p.tipo) LIKE '%tempo%' THEN strftime('%d/%m/%Y', p.datatermino)
+                    WHEN LOWER(p.tipo) LIKE '%tempo%' THEN strftime('%d/%m/%Y', p.datatermino_iso)
                     ELSE p.hor_termino
                 END AS "Término",
                 CASE
-                    WHEN (LOWER(p.tipo) LIKE '%tempo%' AND DATE(p.datatermino) > DATE(p.datavencimento)) OR (LOWER(p.tipo) LIKE '%marco%' AND p.hor_termino > p.hor_vencimento) THEN 'Atrasada'
+                    WHEN (LOWER(p.tipo) LIKE '%tempo%' AND DATE(p.datatermino_iso) > DATE(p.datavencimento_iso)) OR (LOWER(p.tipo) LIKE '%marco%' AND p.hor_termino > p.hor_vencimento) THEN 'Atrasada'
                     WHEN LOWER(p.tipo) LIKE '%marco%' AND p.hor_termino IS NOT NULL AND p.hor_vencimento IS NOT NULL AND (p.hor_vencimento - p.hor_termino) > 90 THEN 'Antecipada'
                     ELSE 'No Prazo'
                 END AS "Status"
             FROM preventivas p
-            LEFT JOIN centros_custo contrato ON p.cod_cc = contrato.cod_cc
-            LEFT JOIN centros_custo nucleo ON contrato.pai_id = nucleo.cod_cc
-            LEFT JOIN centros_custo super ON nucleo.pai_id = super.cod_cc
+            LEFT JOIN {HIERARQUIA_TABELA} contrato ON p.cod_cc = contrato.cod_cc
             {join_calendario}
             WHERE {where_string}
-            ORDER BY DATE(p.datatermino) DESC
+            ORDER BY p.datatermino_iso DESC, p.numos ASC
         """
         
         detalhes = conn.execute(query, params).fetchall()
@@ -3,6 +3,9 @@ import sqlite3
 import pandas as pd
 from datetime import datetime
 from ..db import get_db_connection
+from ..indices import garantir_indices
+from ..derivados import tabelas_alteradas
+from ..dicionario_valores import atualizar_dicionarios
 
 from ..db import DATABASE_PATH
 import os
@@ -42,6 +45,7 @@ def restaurar_backup(lista_tabelas=None):
             try:
                 df = pd.read_sql_query(f"SELECT * FROM {table_name}", conn_backup)
                 df.to_sql(table_name, conn_main, if_exists='replace', index=False)
+                garantir_indices(conn_main, [table_name])
                 
                 linhas_depois = len(df)
                 diferenca = linhas_depois - linhas_antes
@@ -73,6 +77,10 @@ def restaurar_backup(lista_tabelas=None):
                 result_item['detalhamento'] = 'A restauração pode ter falhado.'
 
             results.append(result_item)
+
+        tabelas_restauradas = [r['tabela'] for r in results if r['status'] == 'success']
+        tabelas_alteradas(conn_main, tabelas_restauradas)
+        atualizar_dicionarios(conn_main, tabelas_restauradas) # Valores dos filtros do BI
         
         return True, results
 
@@ -1,6 +1,11 @@
 # backend/Rotas/tabelas.py
 from flask import Blueprint, jsonify, request
 from ..db import get_db_connection, DATABASE_PATH
+from ..indices import garantir_indices
+from ..derivados import tabelas_alteradas
+from ..catalogo_esquema import invalidar_catalogo
+from ..datas import coluna_sombra
+from .. import cache
 import sqlite3
 import re
 from datetime import date, datetime, timedelta
@@ -76,6 +81,7 @@ def gerar_calendario():
             cursor = conn.cursor()
             cursor.executemany("INSERT INTO calendario VALUES (:data, :dia, :diasemana, :diaano, :mesext, :mes, :bimestre, :trimestre, :quadrimestre, :semestre, :ano, :semanames, :semanaano)", calendario_data)
         conn.commit()
+        tabelas_alteradas(conn, ['calendario'])
     except sqlite3.Error as e:
         conn.rollback()
         return jsonify({"message": f"Erro no banco de dados: {e}"}), 500
@@ -98,9 +104,11 @@ def get_tabela_data(table_name):
     try:
         cursor.execute(f'SELECT * FROM {table_name} LIMIT 0')
         column_names = [description[0] for description in cursor.description] if cursor.description else []
+        # As colunas de data `_iso` não são editáveis; são recalculadas ao salvar (tabelas_alteradas).
+        column_names = [col for col in column_names if not coluna_sombra(table_name, col)]
         order_by_clause = "ORDER BY data" if table_name == 'calendario' else ""
         data = conn.execute(f'SELECT * FROM {table_name} {order_by_clause}').fetchall()
-        rows = [dict(row) for row in data]
+        rows = [{col: row[col] for col in column_names} for row in data]
         pk_info = None
         table_info = conn.execute(f'PRAGMA table_info({table_name})').fetchall()
         for column in table_info:
@@ -129,6 +137,7 @@ def update_tabela_data(table_name):
             rows_to_insert = [tuple(item.get(col) for col in columns) for item in data]
             conn.executemany(f'INSERT INTO {table_name} ({cols_str}) VALUES ({placeholders})', rows_to_insert)
         conn.commit()
+        tabelas_alteradas(conn, [table_name])
     except sqlite3.Error as e:
         conn.rollback()
         return jsonify({"message": f"Erro no banco de dados: {e}"}), 500
@@ -141,6 +150,14 @@ def update_tabela_data(table_name):
 
 # --- ROTAS DE GERENCIAMENTO DE BANCO DE DADOS ---
 
+@bp.route('/db/cache-estatisticas', methods=['GET'])
+def get_cache_estatisticas():
+    # Acertos (memória/arquivo), faltas e descartes da camada de memória, por endpoint.
+    backend_cache = cache.cache
+    if not hasattr(backend_cache, 'estatisticas'):
+        return jsonify({"message": "O cache configurado não coleta estatísticas."}), 404
+    return jsonify(backend_cache.estatisticas())
+
 @bp.route('/db/all-tables', methods=['GET'])
 def get_all_db_tables():
     conn = get_db_connection()
@@ -218,6 +235,8 @@ def create_new_table():
         if is_editable:
             conn.execute("INSERT INTO tabelas (id, tabela) VALUES (?, ?)", (table_id, table_display_name))
         conn.commit()
+        invalidar_catalogo()
+        tabelas_alteradas(conn, [table_id])
         return jsonify({"message": f"Tabela '{table_id}' criada com sucesso!"}), 201
     except sqlite3.Error as e:
         conn.rollback()
@@ -250,6 +269,9 @@ def alter_table_Query_safely(table_name):
             conn.execute(f'INSERT INTO {table_name} ({common_cols_str}) SELECT {common_cols_str} FROM {temp_table_name}')
         conn.execute(f'DROP TABLE {temp_table_name}')
         conn.commit()
+        invalidar_catalogo()
+        garantir_indices(conn, [table_name])
+        tabelas_alteradas(conn, [table_name])
         return jsonify({"message": f"Query da tabela '{table_name}' atualizado com sucesso. Os dados foram preservados."}), 200
     except sqlite3.Error as e:
         conn.rollback()
@@ -273,6 +295,8 @@ def delete_table(table_name):
         conn.execute(f'DROP TABLE IF EXISTS {table_name}')
         conn.execute("DELETE FROM tabelas WHERE id = ?", (table_name,))
         conn.commit()
+        invalidar_catalogo()
+        tabelas_alteradas(conn, [table_name])
         return jsonify({"message": f"Tabela '{table_name}' foi excluída com sucesso."}), 200
     except sqlite3.Error as e:
         conn.rollback()
@@ -287,8 +311,9 @@ def get_table_preview(table_name):
     try:
         cursor.execute(f'SELECT * FROM {table_name} LIMIT 10')
         column_names = [description[0] for description in cursor.description] if cursor.description else []
+        column_names = [col for col in column_names if not coluna_sombra(table_name, col)]
         rows = cursor.fetchall()
-        return jsonify({ "columns": column_names, "rows": [dict(row) for row in rows] })
+        return jsonify({ "columns": column_names, "rows": [{col: row[col] for col in column_names} for row in rows] })
     except sqlite3.Error as e:
         return jsonify({"message": f"Erro ao buscar prévia: {e}"}), 500
     finally:
@@ -301,7 +326,7 @@ def get_table_details(table_name):
         table_info = conn.execute(f'PRAGMA table_info({table_name})').fetchall()
         if not table_info:
             return jsonify({"message": "Tabela não encontrada."}), 404
-        details = [ {"name": col['name'], "type": col['type'], "notnull": bool(col['notnull']), "pk": bool(col['pk'])} for col in table_info ]
+        details = [ {"name": col['name'], "type": col['type'], "notnull": bool(col['notnull']), "pk": bool(col['pk'])} for col in table_info if not coluna_sombra(table_name, col['name']) ]
         return jsonify(details)
     except sqlite3.Error as e:
         return jsonify({"message": f"Erro no banco de dados: {e}"}), 500
@@ -341,6 +366,7 @@ def insert_table_data_custom(table_name):
             else:
                 ignored_count += 1
         conn.commit()
+        tabelas_alteradas(conn, [table_name])
         message = f"Operação concluída. {inserted_count} novas linhas inseridas."
         if ignored_count > 0: message += f" {ignored_count} linhas foram ignoradas por já existirem."
         return jsonify({"message": message}), 200
@@ -474,6 +500,7 @@ def _execute_system_backup_restore(action, tables):
                 elif action == 'restore':
                     df = pd.read_sql_query(f"SELECT * FROM {table_name}", conn_backup)
                     df.to_sql(table_name, conn_main, if_exists='replace', index=False)
+                    garantir_indices(conn_main, [table_name])
                     result_item['status'] = 'success'
                     result_item['mensagem_backup'] = f'Tabela {table_name} restaurada com sucesso.'
                     result_item['detalhamento'] = f'{len(df)} linhas restauradas.'
@@ -483,6 +510,8 @@ def _execute_system_backup_restore(action, tables):
         
         conn_backup.commit()
         conn_main.commit()
+        if action == 'restore':
+            tabelas_alteradas(conn_main, [r['tabela'] for r in results if r['status'] == 'success'])
 
     except Exception as e:
         results.append({"tabela": "Geral", "status": "error", "mensagem_backup": f"Erro geral na operação: {e}", "detalhamento": "-"})
@@ -18,9 +18,11 @@ def create_app():
     app = Flask(__name__)
     CORS(app) # Habilita CORS para toda a aplicação
 
-    # --- 3. Configuração do Cache (Opção 2 - FileSystem) ---
-    # Define o tipo de cache que queremos
-    app.config['CACHE_TYPE'] = 'FileSystemCache'
+    # --- 3. Configuração do Cache (Opção 2 - FileSystem, com camada em memória) ---
+    # Define o tipo de cache que queremos: as respostas mais usadas ficam em memória
+    # (LRU limitado por bytes) e todas continuam gravadas em arquivo (ver cache_camadas.py).
+    app.config['CACHE_TYPE'] = 'backend.cache_camadas.CacheEmCamadas'
+    app.config['CACHE_MEMORIA_MAX_BYTES'] = 256 * 1024 * 1024
     
     # Define a pasta onde os arquivos de cache serão salvos
     # (Estamos criando uma pasta 'cache_storage' dentro da pasta 'backend')
@@ -35,6 +37,16 @@ def create_app():
     # Agora o objeto 'cache' está pronto para ser usado.
     cache.init_app(app)
 
+    # --- 5. Pool de Conexões do Banco de Dados ---
+    # Devolve a conexão da requisição ao pool no teardown da aplicação.
+    from . import db
+    db.init_app(app)
+
+    # --- 6. Migrações de Índices ---
+    # Aplica as migrações pendentes e recria os índices que as importações descartaram.
+    from . import indices
+    indices.init_app(app)
+
     # Importa todos os blueprints da pasta 'routes'
     from .Rotas import (
         centros_custo, natureza_financeira, faixas, comunidade, chamados,
@@ -67,5 +79,26 @@ def create_app():
     app.register_blueprint(bi.bp)
     app.register_blueprint(pneus.bp)
 
+    # --- 7. Estruturas Derivadas ---
+    # Com os blueprints importados, todas as estruturas derivadas (resumos, hierarquias)
+    # já estão registradas; reconstrói as que estiverem ausentes ou desatualizadas.
+    from . import derivados
+    derivados.init_app(app)
+
+    # --- 8. Versões dos Dados ---
+    # As chaves do cache das rotas incluem a versão das tabelas que elas leem.
+    from . import versoes_dados
+    versoes_dados.init_app(app)
+
+    # --- 9. Registro de Consultas Lentas ---
+    # Consultas do BI lentas, recusadas ou interrompidas pelo governador de consultas.
+    from . import governador_consultas
+    governador_consultas.init_app(app)
+
+    # --- 10. Configuração da Importação ---
+    # Colunas da importação incremental (modo, chave natural, coluna de marca) em importacoes_bd.
+    from . import importacao
+    importacao.init_app(app)
+
     return app
 
@@ -0,0 +1,119 @@
+# backend/benchmarks/classificacao_preventivas.py
+# Verificação de classificar_realizadas / classificar_pendentes (Rotas/preventivas.py).
+#
+# Compara as colunas 'atrasada', 'antecipada' e 'status_pendente' com as calculadas pelos
+# df.apply linha a linha que as rotas usavam antes da versão vetorizada, sobre OS
+# sintéticas (tipos, datas e horímetros vazios ou inválidos incluídos), com os horímetros
+# numéricos e como texto/objeto. Falha (AssertionError) se alguma linha divergir e
+# mostra o tempo de cada versão.
+#
+# Uso, a partir da raiz do projeto:
+#   python -m backend.benchmarks.classificacao_preventivas [linhas]
+
+import random
+import sys
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from backend.datas import para_iso
+from backend.Rotas.preventivas import classificar_realizadas, classificar_pendentes
+
+LINHAS_PADRAO = 200_000
+
+
+def gerar_os(linhas, semente=1):
+    """OS sintéticas com as colunas lidas pelas rotas (datas no formato da planilha e as `_iso`)."""
+    aleatorio = random.Random(semente)
+
+    def data_termino():
+        return None if aleatorio.random() < 0.1 else f"2024-{aleatorio.randint(1, 12):02d}-{aleatorio.randint(1, 28):02d}"
+
+    def data_vencimento():
+        sorteio = aleatorio.random()
+        if sorteio < 0.1:
+            return None
+        if sorteio < 0.15:
+            return ''
+        return f"{aleatorio.randint(13, 28):02d}/{aleatorio.randint(1, 12):02d}/2024"
+
+    def horimetro():
+        return None if aleatorio.random() < 0.2 else aleatorio.choice([aleatorio.uniform(0, 2000), float('nan')])
+
+    df = pd.DataFrame({
+        'tipo': [aleatorio.choice(['Tempo', 'MARCO', 'marco x', None, 'outro', float('nan')]) for _ in range(linhas)],
+        'datatermino': [data_termino() for _ in range(linhas)],
+        'datavencimento': [data_vencimento() for _ in range(linhas)],
+        'hor_termino': [horimetro() for _ in range(linhas)],
+        'hor_vencimento': [horimetro() for _ in range(linhas)],
+        'hor_atual': [horimetro() for _ in range(linhas)],
+    })
+    # Como a importação grava (ver datas.py).
+    df['datatermino_iso'] = df['datatermino'].map(para_iso)
+    df['datavencimento_iso'] = df['datavencimento'].map(para_iso)
+    return df
+
+
+def classificar_linha_a_linha(df, data_atual):
+    """Cálculo anterior das rotas: um df.apply por coluna."""
+    df['datatermino_dt'] = pd.to_datetime(df['datatermino'], errors='coerce')
+    df['datavencimento_dt'] = pd.to_datetime(df['datavencimento'], dayfirst=True, errors='coerce')
+    df['atrasada'] = df.apply(
+        lambda row: 1 if (
+            'tempo' in str(row['tipo']).lower() and pd.notna(row['datatermino_dt']) and pd.notna(row['datavencimento_dt']) and row['datatermino_dt'] > row['datavencimento_dt']
+        ) or (
+            'marco' in str(row['tipo']).lower() and pd.notna(row['hor_termino']) and pd.notna(row['hor_vencimento']) and row['hor_termino'] > row['hor_vencimento']
+        ) else 0,
+        axis=1
+    )
+    df['antecipada'] = df.apply(
+        lambda row: 1 if 'marco' in str(row['tipo']).lower() and pd.notna(row['hor_termino']) and pd.notna(row['hor_vencimento']) and (row['hor_vencimento'] - row['hor_termino']) > 90 else 0,
+        axis=1
+    )
+    df['status_pendente'] = df.apply(
+        lambda row: 'Em Atraso' if (
+            'tempo' in str(row['tipo']).lower() and pd.notna(row['datavencimento_dt']) and data_atual > row['datavencimento_dt']
+        ) or (
+            'marco' in str(row['tipo']).lower() and pd.notna(row['hor_atual']) and pd.notna(row['hor_vencimento']) and row['hor_atual'] > row['hor_vencimento']
+        ) else 'Em Dia',
+        axis=1
+    )
+    return df
+
+
+def verificar(linhas):
+    df = gerar_os(linhas)
+    data_atual = pd.to_datetime(datetime.now().date())
+
+    for horimetros_como_objeto in (False, True):
+        dados = df.copy()
+        if not horimetros_como_objeto:
+            for coluna in ('hor_termino', 'hor_vencimento', 'hor_atual'):
+                dados[coluna] = pd.to_numeric(dados[coluna])
+
+        anterior = dados.copy()
+        inicio = time.perf_counter()
+        classificar_linha_a_linha(anterior, data_atual)
+        tempo_anterior = time.perf_counter() - inicio
+
+        atual = dados.copy()
+        inicio = time.perf_counter()
+        classificar_realizadas(atual)
+        classificar_pendentes(atual, data_atual)
+        tempo_atual = time.perf_counter() - inicio
+
+        for coluna in ('atrasada', 'antecipada', 'status_pendente'):
+            divergentes = (anterior[coluna] != atual[coluna]).sum()
+            assert divergentes == 0, f"{coluna}: {divergentes} linha(s) divergente(s)"
+
+        print(
+            f"{linhas} OS, horímetros {'objeto' if horimetros_como_objeto else 'numéricos'}: iguais "
+            f"({int(atual['atrasada'].sum())} atrasadas, {int(atual['antecipada'].sum())} antecipadas, "
+            f"{int((atual['status_pendente'] == 'Em Atraso').sum())} em atraso). "
+            f"Linha a linha: {tempo_anterior:.2f}s, vetorizado: {tempo_atual:.3f}s"
+        )
+
+
+if __name__ == '__main__':
+    verificar(int(sys.argv[1]) if len(sys.argv) > 1 else LINHAS_PADRAO)
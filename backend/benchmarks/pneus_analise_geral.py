@@ -0,0 +1,188 @@
+# backend/benchmarks/pneus_analise_geral.py
+# Verificação de analisar_equipamentos (rota /api/pneus/analise-geral, Rotas/pneus.py).
+#
+# Compara status, ultima_inspecao, pneus_agregados e ultima_medicao de cada equipamento
+# com o cálculo anterior da rota, que filtrava as medições por equipamento quatro vezes
+# (status, última inspeção, pneus agregados e última medição) e classificava cada
+# medição percorrendo as faixas. A frota é sintética: POSICOES posições com LEITURAS
+# medições cada, incluindo equipamentos sem layout, sem medições, com medições vazias e
+# posições com os mesmos 2 primeiros dígitos. Falha (AssertionError) se algum
+# equipamento divergir e mostra o tempo de cada versão.
+#
+# Uso, a partir da raiz do projeto:
+#   python -m backend.benchmarks.pneus_analise_geral [equipamentos ...]
+
+import json
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from backend.classificacao_faixas import ClassificadorFaixas
+from backend.Rotas.pneus import analisar_equipamentos
+
+EQUIPAMENTOS_PADRAO = (500, 1000, 2000)
+POSICOES = 10
+LEITURAS = 3
+
+FAIXAS = [
+    {'nome_faixa': 'Crítico', 'valor_inicio': 0, 'valor_fim': 5, 'status': 'Crítico', 'cor': '#f00'},
+    {'nome_faixa': 'Atenção', 'valor_inicio': 5.01, 'valor_fim': 10, 'status': 'Atenção', 'cor': '#ff0'},
+    {'nome_faixa': 'Bom', 'valor_inicio': 10.01, 'valor_fim': 30, 'status': 'Bom', 'cor': '#0f0'},
+]
+LAYOUT = json.dumps([{'tipo': 'eixo', 'pneus_por_lado': 2}, {'tipo': 'eixo', 'pneus_por_lado': 2}, {'tipo': 'estepe', 'pneus_por_lado': 1}])
+
+
+def gerar_frota(equipamentos, semente=1):
+    """Retorna (equip_df, medicoes_df) no formato lido pela rota."""
+    aleatorio = random.Random(semente)
+    agora = datetime.now().replace(microsecond=0)
+
+    equip = pd.DataFrame({
+        'equipamento': [f'E{i}' for i in range(equipamentos)],
+        'nome_cc': [f'Contrato {i % 8}' for i in range(equipamentos)],
+        'tipo_obj': ['Caminhão'] * equipamentos,
+        'configuracao': [None if i % 17 == 0 else LAYOUT for i in range(equipamentos)],
+    })
+
+    medicoes = []
+    for i in range(equipamentos):
+        if i % 13 == 0:
+            continue # Sem medições
+        posicoes = aleatorio.randint(POSICOES - 4, POSICOES)
+        for p in range(posicoes):
+            # '01A' e '01B' (a cada 11 equipamentos) caem na mesma chave da última inspeção.
+            posicao = f'{p // 2:02d}{"AB"[p % 2]}' if i % 11 == 0 else f'{p:02d}-POS'
+            # Datas distintas por pneu: a ordem das medições não depende do algoritmo de ordenação.
+            dias = aleatorio.sample(range(1, 400), LEITURAS)
+            for k, dia in enumerate(dias):
+                data = agora - timedelta(days=dia if i % 5 else dia % 6, minutes=p * LEITURAS + k)
+                medicao = None if aleatorio.random() < 0.02 else round(aleatorio.uniform(0, 30), 2)
+                medicoes.append((f'E{i}', posicao, None if aleatorio.random() < 0.01 else data, medicao, f'F{i}_{p}'))
+
+    medicoes_df = pd.DataFrame(medicoes, columns=['equipamento', 'posicao_agregado', 'data_medicao', 'medicao', 'num_fogo'])
+    medicoes_df['data_medicao'] = pd.to_datetime(medicoes_df['data_medicao'])
+    return equip, medicoes_df
+
+
+def classificar_medicao(medicao, faixas):
+    if medicao is None or pd.isna(medicao):
+        return None
+    for faixa in faixas:
+        valor_inicio = pd.to_numeric(faixa['valor_inicio'], errors='coerce')
+        valor_fim = pd.to_numeric(faixa['valor_fim'], errors='coerce')
+        medicao_num = pd.to_numeric(medicao, errors='coerce')
+        if pd.notna(valor_inicio) and pd.notna(valor_fim) and pd.notna(medicao_num):
+            if valor_inicio <= medicao_num <= valor_fim:
+                return faixa
+    return None
+
+
+def analisar_por_equipamento(equip_df, medicoes_df, faixas):
+    """Cálculo anterior da rota: as medições são filtradas por equipamento em cada coluna."""
+    def analyze_status(row):
+        statuses = []
+        equip_nome = row['equipamento']
+
+        if not row['configuracao'] or pd.isna(row['configuracao']):
+            statuses.append("Sem layout cadastrado")
+            return " | ".join(statuses)
+
+        config = json.loads(row['configuracao'])
+        total_pneus_layout = sum(n['pneus_por_lado'] * 2 for n in config if n['tipo'] == 'eixo')
+
+        medicoes_equip = medicoes_df[medicoes_df['equipamento'] == equip_nome]
+
+        if medicoes_equip.empty:
+            statuses.append("Faltando agregação")
+            statuses.append("Faltando medição")
+            return " | ".join(statuses)
+
+        agregados_unicos = medicoes_equip['posicao_agregado'].nunique()
+        if agregados_unicos < total_pneus_layout:
+            statuses.append("Faltando agregação")
+
+        medicoes_validas = medicoes_equip.dropna(subset=['medicao', 'data_medicao'])
+
+        if medicoes_validas['posicao_agregado'].nunique() < agregados_unicos:
+            statuses.append("Faltando medição")
+
+        pneus_criticos = 0
+        sem_medicoes_recentes = False
+        sete_dias_atras = datetime.now() - timedelta(days=7)
+
+        ultima_medicao_por_pneu = medicoes_validas.sort_values('data_medicao', ascending=False).drop_duplicates('posicao_agregado')
+
+        for _, med in ultima_medicao_por_pneu.iterrows():
+            faixa = classificar_medicao(med['medicao'], faixas)
+            if faixa and faixa['status'] == 'Crítico':
+                pneus_criticos += 1
+            if med['data_medicao'] < sete_dias_atras:
+                sem_medicoes_recentes = True
+
+        if pneus_criticos > 0:
+            statuses.append("Pneus com alto desgaste")
+
+        if sem_medicoes_recentes and "Faltando medição" not in statuses:
+            statuses.append("Sem medições recentes")
+
+        if not statuses:
+            return "OK"
+
+        return " | ".join(statuses)
+
+    def get_ultima_inspecao(equip_nome):
+        medicoes_equip = medicoes_df[medicoes_df['equipamento'] == equip_nome]
+        if medicoes_equip.empty:
+            return {}
+
+        medicoes_equip = medicoes_equip.sort_values('data_medicao', ascending=False, na_position='last')
+        ultima_inspecao_df = medicoes_equip.drop_duplicates('posicao_agregado')
+
+        ultima_inspecao = {}
+        for _, row in ultima_inspecao_df.iterrows():
+            pos_num = row['posicao_agregado'][:2]
+            medicao_val = row['medicao'] if pd.notna(row['medicao']) else None
+            ultima_inspecao[pos_num] = {'faixa_info': classificar_medicao(medicao_val, faixas)}
+        return ultima_inspecao
+
+    def get_ultima_medicao_data(equip_nome):
+        data = medicoes_df[medicoes_df['equipamento'] == equip_nome]['data_medicao'].max()
+        return data.strftime('%d/%m/%Y') if pd.notna(data) else 'Sem medições'
+
+    equip_df['status'] = equip_df.apply(analyze_status, axis=1)
+    equip_df['ultima_inspecao'] = equip_df['equipamento'].apply(get_ultima_inspecao)
+    equip_df['pneus_agregados'] = equip_df['equipamento'].apply(lambda equip_nome: medicoes_df[medicoes_df['equipamento'] == equip_nome]['posicao_agregado'].nunique())
+    equip_df['ultima_medicao'] = equip_df['equipamento'].apply(get_ultima_medicao_data)
+    return equip_df
+
+
+def verificar(equipamentos):
+    equip_df, medicoes_df = gerar_frota(equipamentos)
+    colunas = ['equipamento', 'status', 'ultima_inspecao', 'pneus_agregados', 'ultima_medicao']
+
+    inicio = time.perf_counter()
+    anterior = analisar_por_equipamento(equip_df.copy(), medicoes_df, FAIXAS)
+    tempo_anterior = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    atual = analisar_equipamentos(equip_df.copy(), medicoes_df, ClassificadorFaixas(FAIXAS))
+    tempo_atual = time.perf_counter() - inicio
+
+    registros_anteriores = anterior[colunas].to_dict('records')
+    registros_atuais = atual[colunas].to_dict('records')
+    divergentes = [a['equipamento'] for a, b in zip(registros_anteriores, registros_atuais) if a != b]
+    assert not divergentes, f"{len(divergentes)} equipamento(s) divergente(s), ex: {divergentes[:5]}"
+
+    print(
+        f"{equipamentos} equipamentos, {len(medicoes_df)} medições: iguais "
+        f"({(atual['status'] != 'OK').sum()} com pendências). "
+        f"Por equipamento: {tempo_anterior:.2f}s, agrupado: {tempo_atual:.2f}s"
+    )
+
+
+if __name__ == '__main__':
+    for quantidade in ([int(valor) for valor in sys.argv[1:]] or EQUIPAMENTOS_PADRAO):
+        verificar(quantidade)
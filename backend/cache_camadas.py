@@ -0,0 +1,198 @@
+# backend/cache_camadas.py
+# Cache em duas camadas para o flask_caching: memória (LRU) na frente do FileSystemCache.
+#
+# Sem a camada de memória, todo acerto de cache abre, lê e desserializa o arquivo da
+# resposta (a análise geral de pneus tem vários MB). Aqui as respostas mais usadas ficam
+# também em memória, limitadas por tamanho total em bytes; a camada de arquivos continua
+# sendo gravada em todo `set`, então o cache sobrevive a reinicializações.
+#
+# A memória guarda a resposta serializada (bytes), e não o objeto: as rotas devolvem
+# objetos Response que o Flask altera depois (ex: cabeçalhos do CORS), então cada acerto
+# precisa receber uma cópia própria.
+#
+# Configuração (app.config):
+#   CACHE_TYPE = 'backend.cache_camadas.CacheEmCamadas'
+#   CACHE_MEMORIA_MAX_BYTES       -> tamanho máximo da camada de memória (padrão 256 MB)
+#   CACHE_MEMORIA_MAX_ITEM_BYTES  -> respostas maiores que isso ficam só no arquivo (padrão 1/4 do total)
+
+import io
+import struct
+import threading
+from collections import OrderedDict
+from time import time
+
+from flask import has_request_context, request
+from flask_caching.backends.filesystemcache import FileSystemCache
+
+MEMORIA_MAX_BYTES_PADRAO = 256 * 1024 * 1024
+
+# Endpoint usado nas estatísticas quando o cache é usado fora de uma requisição.
+SEM_ENDPOINT = '-'
+
+
+def _endpoint_atual():
+    if has_request_context() and request.endpoint:
+        return request.endpoint
+    return SEM_ENDPOINT
+
+
+class CacheEmCamadas(FileSystemCache):
+    """FileSystemCache com uma camada LRU em memória e contadores por endpoint."""
+
+    def __init__(self, cache_dir, memoria_max_bytes=MEMORIA_MAX_BYTES_PADRAO, memoria_max_item_bytes=None, **kwargs):
+        super().__init__(cache_dir, **kwargs)
+        self.memoria_max_bytes = memoria_max_bytes
+        self.memoria_max_item_bytes = memoria_max_item_bytes or memoria_max_bytes // 4
+        # chave -> (dados serializados, expira_em (0 = nunca), endpoint)
+        self._memoria = OrderedDict()
+        self._memoria_bytes = 0
+        self._lock = threading.Lock()
+        self._contadores = {}
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        args.insert(0, config["CACHE_DIR"])
+        kwargs.update(
+            threshold=config["CACHE_THRESHOLD"],
+            hash_method=config["CACHE_FILE_HASH_METHOD"],
+            memoria_max_bytes=config.get("CACHE_MEMORIA_MAX_BYTES", MEMORIA_MAX_BYTES_PADRAO),
+            memoria_max_item_bytes=config.get("CACHE_MEMORIA_MAX_ITEM_BYTES"),
+        )
+        return cls(*args, **kwargs)
+
+    # --- Contadores ---
+
+    def _contar(self, evento, endpoint=None):
+        endpoint = endpoint or _endpoint_atual()
+        contadores = self._contadores.setdefault(
+            endpoint, {'acertos_memoria': 0, 'acertos_arquivo': 0, 'faltas': 0, 'descartes_memoria': 0}
+        )
+        contadores[evento] += 1
+
+    def estatisticas(self):
+        """Contadores por endpoint e ocupação da camada de memória."""
+        with self._lock:
+            return {
+                'memoria': {
+                    'itens': len(self._memoria),
+                    'bytes': self._memoria_bytes,
+                    'max_bytes': self.memoria_max_bytes,
+                },
+                'endpoints': {endpoint: self._com_taxa_acerto(c) for endpoint, c in self._contadores.items()},
+            }
+
+    @staticmethod
+    def _com_taxa_acerto(contadores):
+        acertos = contadores['acertos_memoria'] + contadores['acertos_arquivo']
+        consultas = acertos + contadores['faltas']
+        return {**contadores, 'taxa_acerto': round(acertos / consultas, 3) if consultas else None}
+
+    # --- Camada de memória ---
+
+    def _serializar(self, value):
+        buffer = io.BytesIO()
+        self.serializer.dump(value, buffer)
+        return buffer.getvalue()
+
+    def _desserializar(self, dados):
+        return self.serializer.load(io.BytesIO(dados))
+
+    def _guardar_em_memoria(self, key, dados, expira_em):
+        """Guarda na memória (se couber), descartando as entradas usadas há mais tempo. Chamar com o lock."""
+        self._remover_da_memoria(key)
+        if len(dados) > self.memoria_max_item_bytes:
+            return
+        self._memoria[key] = (dados, expira_em, _endpoint_atual())
+        self._memoria_bytes += len(dados)
+        while self._memoria_bytes > self.memoria_max_bytes:
+            _, (descartado, _, endpoint) = self._memoria.popitem(last=False)
+            self._memoria_bytes -= len(descartado)
+            self._contar('descartes_memoria', endpoint)
+
+    def _remover_da_memoria(self, key):
+        item = self._memoria.pop(key, None)
+        if item is not None:
+            self._memoria_bytes -= len(item[0])
+
+    def _ler_da_memoria(self, key):
+        """Retorna os dados serializados da chave, ou None. Chamar com o lock."""
+        item = self._memoria.get(key)
+        if item is None:
+            return None
+        dados, expira_em, _ = item
+        if expira_em != 0 and expira_em < time():
+            self._remover_da_memoria(key)
+            return None
+        self._memoria.move_to_end(key)
+        return dados
+
+    def _ler_do_arquivo(self, key):
+        """Lê (expira_em, dados serializados) direto do arquivo, no formato do FileSystemCache."""
+        try:
+            with self._safe_stream_open(self._get_filename(key), "rb") as f:
+                expira_em = struct.unpack("I", f.read(4))[0]
+                if expira_em != 0 and expira_em < time():
+                    return None
+                return expira_em, f.read()
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, struct.error):
+            return None
+
+    # --- API do cache ---
+
+    def get(self, key):
+        if key == self._fs_count_file:
+            # Contador interno de itens do FileSystemCache: não passa pela memória nem pelas estatísticas.
+            return super().get(key)
+
+        with self._lock:
+            dados = self._ler_da_memoria(key)
+            if dados is not None:
+                self._contar('acertos_memoria')
+                return self._desserializar(dados)
+
+        lido = self._ler_do_arquivo(key)
+        if lido is None:
+            with self._lock:
+                self._contar('faltas')
+            return None
+
+        expira_em, dados = lido
+        with self._lock:
+            self._contar('acertos_arquivo')
+            self._guardar_em_memoria(key, dados, expira_em)
+        return self._desserializar(dados)
+
+    def set(self, key, value, timeout=None, mgmt_element=False):
+        gravado = super().set(key, value, timeout=timeout, mgmt_element=mgmt_element)
+        if mgmt_element:
+            return gravado
+        expira_em = self._normalize_timeout(timeout)
+        dados = self._serializar(value)
+        with self._lock:
+            self._guardar_em_memoria(key, dados, expira_em)
+        return gravado
+
+    def add(self, key, value, timeout=None):
+        with self._lock:
+            if self._ler_da_memoria(key) is not None:
+                return False
+        return super().add(key, value, timeout)
+
+    def has(self, key):
+        with self._lock:
+            if self._ler_da_memoria(key) is not None:
+                return True
+        return super().has(key)
+
+    def delete(self, key, mgmt_element=False):
+        with self._lock:
+            self._remover_da_memoria(key)
+        return super().delete(key, mgmt_element=mgmt_element)
+
+    def clear(self):
+        with self._lock:
+            self._memoria.clear()
+            self._memoria_bytes = 0
+        return super().clear()
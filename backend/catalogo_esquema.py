@@ -0,0 +1,59 @@
+# backend/catalogo_esquema.py
+# Catálogo do esquema do banco (tabelas, colunas e tipos) em memória.
+#
+# A validação das rotas do BI lia o sqlite_master e fazia um PRAGMA table_info por tabela
+# do banco a cada chamada (inclusive a cada tecla digitada na busca de um filtro). O
+# catálogo é lido uma vez e fica válido enquanto o PRAGMA schema_version não mudar; o
+# SQLite incrementa esse número em todo CREATE/ALTER/DROP, inclusive quando a alteração
+# vem de outro processo (importação, restauração). As rotas de criação, alteração e
+# exclusão de tabelas também chamam `invalidar_catalogo` logo após a alteração.
+
+import threading
+
+# (schema_version, {tabela: ({'name', 'type'}, ...)}, {tabela: frozenset(colunas)})
+_catalogo = None
+_lock = threading.Lock()
+
+
+def _versao_esquema(conn):
+    return conn.execute("PRAGMA schema_version").fetchone()[0]
+
+
+def _ler_catalogo(conn, versao):
+    colunas = {}
+    for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall():
+        tabela = row[0]
+        info = conn.execute(f"PRAGMA table_info('{tabela}')").fetchall()
+        colunas[tabela] = tuple({'name': col[1], 'type': col[2]} for col in info)
+    nomes = {tabela: frozenset(col['name'] for col in cols) for tabela, cols in colunas.items()}
+    return versao, colunas, nomes
+
+
+def _catalogo_atual(conn):
+    global _catalogo
+    versao = _versao_esquema(conn)
+    with _lock:
+        if _catalogo is not None and _catalogo[0] == versao:
+            return _catalogo
+    catalogo = _ler_catalogo(conn, versao)
+    with _lock:
+        _catalogo = catalogo
+    return catalogo
+
+
+def colunas_por_tabela(conn):
+    """Retorna {tabela: frozenset(nomes das colunas)} de todas as tabelas do banco."""
+    return _catalogo_atual(conn)[2]
+
+
+def colunas_da_tabela(conn, tabela):
+    """Retorna as colunas da tabela ({'name', 'type'}, na ordem do banco) ou None se ela não existir."""
+    colunas = _catalogo_atual(conn)[1].get(tabela)
+    return [dict(col) for col in colunas] if colunas is not None else None
+
+
+def invalidar_catalogo():
+    """Descarta o catálogo; a próxima consulta lê o esquema de novo."""
+    global _catalogo
+    with _lock:
+        _catalogo = None
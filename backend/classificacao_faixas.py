@@ -0,0 +1,109 @@
+# backend/classificacao_faixas.py
+# Classificação de medições nas faixas cadastradas (tabela faixas_definicoes).
+#
+# As faixas de um grupo são lidas e compiladas uma única vez em arrays ordenados do
+# NumPy; depois disso uma Series inteira de medições é classificada com searchsorted.
+# O classificador de cada grupo fica em memória enquanto a versão de faixas_definicoes
+# não mudar (ver versoes_dados.py), inclusive quando a alteração vem de outro processo.
+
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from .versoes_dados import versoes
+
+SEM_FAIXA = -1
+
+# grupo_id -> (versão de faixas_definicoes, ClassificadorFaixas)
+_classificadores = {}
+
+
+def _numericos(valores):
+    return pd.to_numeric(pd.Series(valores, dtype=object), errors='coerce').to_numpy(dtype=float)
+
+
+class ClassificadorFaixas:
+    """
+    Faixas de um grupo pré-processadas para classificação vetorizada.
+
+    Uma medição pertence à primeira faixa (na ordem do cadastro) com
+    valor_inicio <= medicao <= valor_fim. Como as faixas podem se tocar nos limites,
+    os limites de todas elas dividem a reta em pontos e intervalos abertos; a faixa de
+    cada ponto e de cada intervalo é calculada aqui, na compilação.
+    """
+
+    def __init__(self, faixas):
+        self.faixas = faixas
+
+        inicios = _numericos([f['valor_inicio'] for f in faixas])
+        fins = _numericos([f['valor_fim'] for f in faixas])
+        validas = ~np.isnan(inicios) & ~np.isnan(fins)
+
+        self._pontos = np.unique(np.concatenate([inicios[validas], fins[validas]]))
+        self._faixa_no_ponto = self._primeira_faixa(self._pontos, inicios, fins, validas)
+
+        # Intervalo i fica entre _pontos[i-1] e _pontos[i]; o primeiro e o último estão fora de qualquer faixa.
+        meios = (self._pontos[:-1] + self._pontos[1:]) / 2
+        self._faixa_no_intervalo = np.concatenate([
+            [SEM_FAIXA], self._primeira_faixa(meios, inicios, fins, validas), [SEM_FAIXA]
+        ]).astype(int)
+
+        # Posição SEM_FAIXA (-1) das tabelas abaixo corresponde a "nenhuma faixa".
+        self._opcoes = np.empty(len(faixas) + 1, dtype=object)
+        self._opcoes[:len(faixas)] = faixas
+        self._opcoes[SEM_FAIXA] = None
+
+    @staticmethod
+    def _primeira_faixa(valores, inicios, fins, validas):
+        if len(valores) == 0 or len(inicios) == 0:
+            return np.full(len(valores), SEM_FAIXA, dtype=int)
+        dentro = (inicios <= valores[:, None]) & (valores[:, None] <= fins) & validas
+        return np.where(dentro.any(axis=1), dentro.argmax(axis=1), SEM_FAIXA).astype(int)
+
+    def indices(self, medicoes):
+        """Posição em `self.faixas` da faixa de cada medição (SEM_FAIXA quando não há)."""
+        valores = _numericos(medicoes)
+        if len(self._pontos) == 0:
+            return np.full(len(valores), SEM_FAIXA, dtype=int)
+
+        posicoes = np.searchsorted(self._pontos, valores, side='left')
+        limitadas = np.minimum(posicoes, len(self._pontos) - 1)
+        no_ponto = self._pontos[limitadas] == valores
+
+        resultado = np.where(no_ponto, self._faixa_no_ponto[limitadas], self._faixa_no_intervalo[posicoes])
+        resultado[np.isnan(valores)] = SEM_FAIXA
+        return resultado
+
+    def classificar(self, medicoes):
+        """Retorna uma Series (mesmo índice de `medicoes`) com o dict da faixa de cada medição ou None."""
+        indice = medicoes.index if isinstance(medicoes, pd.Series) else None
+        return pd.Series(self._opcoes[self.indices(medicoes)], index=indice, dtype=object)
+
+    def campo(self, medicoes, nome):
+        """Como `classificar`, mas retorna apenas o campo `nome` da faixa (ex: 'status', 'cor')."""
+        valores = np.array([f[nome] for f in self.faixas] + [None], dtype=object)
+        indice = medicoes.index if isinstance(medicoes, pd.Series) else None
+        return pd.Series(valores[self.indices(medicoes)], index=indice, dtype=object)
+
+    def classificar_valor(self, medicao):
+        """Classifica uma única medição."""
+        return self._opcoes[self.indices([medicao])[0]]
+
+
+def obter_classificador(conn, grupo_id):
+    """Retorna o classificador do grupo, compilando-o de novo se as faixas mudaram."""
+    try:
+        versao = versoes(conn, ('faixas_definicoes',))
+    except sqlite3.Error:
+        versao = None # Sem registro de versões: compila a cada chamada
+
+    versao_em_cache, classificador = _classificadores.get(grupo_id, (None, None))
+    if classificador is None or versao is None or versao != versao_em_cache:
+        faixas_db = conn.execute(
+            "SELECT nome_faixa, valor_inicio, valor_fim, status, cor FROM faixas_definicoes WHERE grupo_id = ?",
+            (grupo_id,)
+        ).fetchall()
+        classificador = ClassificadorFaixas([dict(row) for row in faixas_db])
+        _classificadores[grupo_id] = (versao, classificador)
+    return classificador
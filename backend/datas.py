@@ -0,0 +1,110 @@
+# backend/datas.py
+# Normalização das datas das tabelas importadas.
+#
+# As planilhas de origem trazem datas em formatos misturados (ISO gravado pelo pandas,
+# dd/mm/aaaa digitado, com ou sem hora). Em vez de cada rota reinterpretar as strings
+# a cada requisição, cada coluna de data ganha uma coluna "sombra" `<coluna>_iso`
+# preenchida uma única vez, na importação, no formato 'AAAA-MM-DD HH:MM:SS'.
+# Strings nesse formato podem ser comparadas, ordenadas e indexadas diretamente no SQL.
+
+from datetime import datetime, date
+
+import pandas as pd
+
+# Tabela -> colunas de data que recebem a coluna sombra.
+COLUNAS_DATA = {
+    'preventivas': ('datatermino', 'datavencimento'),
+    'controle_pneus': ('data_medicao',),
+    'agregacao_pneus': ('data_entrada', 'data_saida'),
+}
+
+SUFIXO_ISO = '_iso'
+FORMATO_ISO = '%Y-%m-%d %H:%M:%S'
+
+# Formatos brasileiros aceitos quando a data não está em ISO (dia sempre antes do mês).
+_FORMATOS_DIA_PRIMEIRO = ('%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%d/%m/%Y')
+
+
+def coluna_iso(coluna):
+    return f"{coluna}{SUFIXO_ISO}"
+
+
+def coluna_sombra(tabela, coluna):
+    """True se a coluna é uma `_iso` gerada por este módulo (não é mostrada nas telas de edição nem no BI)."""
+    return any(coluna == coluna_iso(c) for c in COLUNAS_DATA.get(tabela, ()))
+
+
+def para_iso(valor):
+    """Converte uma data (string ISO, dd/mm/aaaa ou datetime) para 'AAAA-MM-DD HH:MM:SS'. Retorna None se inválida."""
+    if isinstance(valor, datetime):
+        return None if pd.isna(valor) else valor.strftime(FORMATO_ISO)
+    if isinstance(valor, date):
+        return valor.strftime(FORMATO_ISO)
+    if not isinstance(valor, str):
+        return None
+
+    texto = valor.strip()
+    if not texto:
+        return None
+    if '/' in texto:
+        for formato in _FORMATOS_DIA_PRIMEIRO:
+            try:
+                return datetime.strptime(texto, formato).strftime(FORMATO_ISO)
+            except ValueError:
+                continue
+        return None
+    try:
+        return datetime.fromisoformat(texto).strftime(FORMATO_ISO)
+    except ValueError:
+        return None
+
+
+def normalizar_dataframe(df, tabela):
+    """
+    Acrescenta ao DataFrame (antes do to_sql) as colunas `<coluna>_iso` da tabela.
+    Cada valor distinto é convertido uma única vez.
+    """
+    for coluna in COLUNAS_DATA.get(tabela, ()):
+        if coluna not in df.columns:
+            continue
+        valores = df[coluna].astype(object)
+        convertidos = {valor: para_iso(valor) for valor in valores.dropna().unique()}
+        iso = valores.map(convertidos).astype(object)
+        df[coluna_iso(coluna)] = iso.where(iso.notna(), None)
+    return df
+
+
+def _colunas_existentes(conn, tabela):
+    return {row[1] for row in conn.execute(f'PRAGMA table_info("{tabela}")').fetchall()}
+
+
+def tabela_normalizada(conn, tabela):
+    """True se a tabela não existe ou já possui todas as colunas `_iso` das suas colunas de data."""
+    existentes = _colunas_existentes(conn, tabela)
+    if not existentes:
+        return True
+    return all(coluna_iso(c) in existentes for c in COLUNAS_DATA.get(tabela, ()) if c in existentes)
+
+
+def normalizar_tabela(conn, tabela):
+    """
+    Cria (se preciso) e recalcula as colunas `_iso` de uma tabela já gravada no banco.
+    Usado quando os dados chegam por outro caminho que não a importação
+    (restauração de backup, edição pela tela de tabelas, bancos antigos).
+    """
+    from .indices import garantir_indices
+
+    existentes = _colunas_existentes(conn, tabela)
+    colunas = [c for c in COLUNAS_DATA.get(tabela, ()) if c in existentes]
+    if not colunas:
+        return
+
+    conn.create_function('para_iso', 1, para_iso, deterministic=True)
+    for coluna in colunas:
+        if coluna_iso(coluna) not in existentes:
+            conn.execute(f'ALTER TABLE "{tabela}" ADD COLUMN "{coluna_iso(coluna)}" TEXT')
+    atribuicoes = ', '.join(f'"{coluna_iso(c)}" = para_iso("{c}")' for c in colunas)
+    conn.execute(f'UPDATE "{tabela}" SET {atribuicoes}')
+    conn.commit()
+    # Os índices sobre as colunas _iso só podem ser criados depois que elas existem.
+    garantir_indices(conn, [tabela])
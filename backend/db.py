@@ -3,6 +3,11 @@
 
 import sqlite3
 import os
+import threading
+from contextlib import contextmanager
+from flask import g, has_app_context
+
+from .versoes_dados import registrar_alteracao, tabela_escrita
 
 # --- INÍCIO DA CORREÇÃO ---
 # Constrói um caminho absoluto para o arquivo do banco de dados.
@@ -18,15 +23,223 @@ _basedir = os.path.abspath(os.path.dirname(__file__))
 DATABASE_PATH = os.path.join(_basedir, 'database.db')
 # --- FIM DA CORREÇÃO ---
 
+# --- CONFIGURAÇÃO DE ARMAZENAMENTO ---
+# O banco opera em modo WAL: leitores não esperam escritores (ex: uma importação
+# longa em `atualizacaodb`) e escritores só disputam entre si.
+# O journal_mode é persistente no arquivo, então basta aplicá-lo uma vez por processo.
+JOURNAL_MODE = "WAL"
 
-def get_db_connection():
-    """Cria e retorna uma conexão com o banco de dados SQLite."""
-    # Usa o caminho absoluto que definimos acima.
-    conn = sqlite3.connect(DATABASE_PATH)
+# PRAGMAs de conexão. São aplicados uma única vez, quando a conexão é criada,
+# e não a cada requisição que a reutiliza.
+PRAGMAS_CONEXAO = (
+    "PRAGMA busy_timeout = 5000",
+    # Em WAL, NORMAL é seguro contra corrupção e evita um fsync por commit.
+    "PRAGMA synchronous = NORMAL",
+    # Valor negativo = tamanho em KiB (aprox. 64 MB de cache de páginas por conexão).
+    "PRAGMA cache_size = -65536",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA temp_store = MEMORY",
+)
+
+# Conexões de leitura recusam qualquer escrita.
+PRAGMAS_LEITURA = (
+    "PRAGMA query_only = 1",
+)
+
+# --- POOL DE CONEXÕES ---
+# Quantidade máxima de conexões ociosas mantidas abertas entre requisições, por papel.
+# Conexões além desse limite são fechadas ao final da requisição.
+POOL_MAX_CONEXOES = 16
+
+PAPEL_ESCRITA = 'escrita'
+PAPEL_LEITURA = 'leitura'
+
+_conexoes_ociosas = {PAPEL_ESCRITA: [], PAPEL_LEITURA: []}
+_pool_lock = threading.Lock()
+_journal_configurado = False
+
+
+class ConexaoPool(sqlite3.Connection):
+    """
+    Conexão SQLite que pode ser reaproveitada pelo pool.
+    Enquanto estiver emprestada a uma requisição, o close() chamado pelas rotas
+    não fecha a conexão: ela é devolvida ao pool pelo teardown do Flask.
+
+    As conexões de escrita anotam as tabelas em que escrevem e trocam a versão
+    delas quando a escrita é confirmada (ver versoes_dados.py).
+    """
+    emprestada = False
+    papel = PAPEL_ESCRITA
+    escritas = None # Tabelas escritas desde a última confirmação (só nas conexões de escrita)
+    removidas = None
+
+    def _autorizar(self, acao, arg1, arg2, banco, origem):
+        tabela = tabela_escrita(acao, arg1, arg2, banco)
+        if tabela is not None:
+            self.escritas.add(tabela)
+            if acao == sqlite3.SQLITE_DROP_TABLE:
+                self.removidas.add(tabela)
+        return sqlite3.SQLITE_OK
+
+    def commit(self):
+        super().commit()
+        self.confirmar_escritas()
+
+    def rollback(self):
+        super().rollback()
+        if self.escritas:
+            self.escritas.clear()
+            self.removidas.clear()
+
+    def confirmar_escritas(self):
+        """Troca a versão das tabelas escritas (fora de transação, ou seja, já confirmadas)."""
+        if not self.escritas or self.in_transaction:
+            return
+        escritas, removidas = self.escritas, self.removidas
+        self.escritas, self.removidas = set(), set()
+        # Tabelas auxiliares criadas e renomeadas (ex: a `<tabela>__nova` da importação) não
+        # ganham versão; as removidas sim, para o cache de quem as lia ser descartado.
+        existentes = {row[0] for row in self.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()}
+        tabelas = sorted(tabela for tabela in escritas if tabela in existentes or tabela in removidas)
+        if tabelas:
+            registrar_alteracao(self, tabelas)
+
+    def close(self):
+        if self.emprestada:
+            return
+        super().close()
+
+    def fechar_definitivamente(self):
+        self.emprestada = False
+        super().close()
+
+
+def _configurar_journal(conn):
+    """Coloca o banco em modo WAL na primeira conexão do processo."""
+    global _journal_configurado
+    if _journal_configurado:
+        return
+    try:
+        conn.execute(f"PRAGMA journal_mode = {JOURNAL_MODE}")
+        _journal_configurado = True
+    except sqlite3.OperationalError as e:
+        # Outra conexão pode estar segurando o banco; tenta de novo na próxima conexão.
+        print(f"Aviso: não foi possível ativar o journal_mode {JOURNAL_MODE}: {e}")
+
+
+def _criar_conexao(papel=PAPEL_ESCRITA):
+    """Abre uma nova conexão e aplica as configurações de conexão do papel informado."""
+    # Nas conexões de escrita cada comando é compilado a cada execução (sem cache de
+    # comandos): o autorizador só é chamado na compilação.
+    conn = sqlite3.connect(
+        DATABASE_PATH, factory=ConexaoPool, check_same_thread=False,
+        cached_statements=0 if papel == PAPEL_ESCRITA else 128
+    )
+    conn.papel = papel
+    if papel == PAPEL_ESCRITA:
+        conn.escritas, conn.removidas = set(), set()
+        conn.set_authorizer(conn._autorizar)
     # A configuração row_factory permite acessar as colunas pelo nome.
     conn.row_factory = sqlite3.Row
+    _configurar_journal(conn)
+    for pragma in PRAGMAS_CONEXAO:
+        conn.execute(pragma)
+    if papel == PAPEL_LEITURA:
+        for pragma in PRAGMAS_LEITURA:
+            conn.execute(pragma)
     return conn
 
+
+def _retirar_do_pool(papel):
+    with _pool_lock:
+        if _conexoes_ociosas[papel]:
+            return _conexoes_ociosas[papel].pop()
+    return _criar_conexao(papel)
+
+
+def _devolver_ao_pool(conn):
+    """Descarta transações pendentes e devolve a conexão ao pool (ou a fecha, se o pool estiver cheio)."""
+    conn.emprestada = False
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+        # Escritas confirmadas sem passar pelo commit() (ex: `with conn:`).
+        conn.confirmar_escritas()
+        conn.row_factory = sqlite3.Row
+    except sqlite3.Error:
+        # Conexão em estado inválido (ex: já fechada): não volta para o pool.
+        try:
+            conn.fechar_definitivamente()
+        except sqlite3.Error:
+            pass
+        return
+
+    with _pool_lock:
+        ociosas = _conexoes_ociosas[conn.papel]
+        if len(ociosas) < POOL_MAX_CONEXOES:
+            ociosas.append(conn)
+            return
+    conn.fechar_definitivamente()
+
+
+def _conexao_do_contexto(papel):
+    if not has_app_context():
+        return _criar_conexao(papel)
+
+    chave = f'db_conn_{papel}'
+    if chave not in g:
+        conn = _retirar_do_pool(papel)
+        conn.emprestada = True
+        setattr(g, chave, conn)
+    return getattr(g, chave)
+
+
+def get_db_connection():
+    """
+    Retorna uma conexão de escrita com o banco de dados SQLite.
+    Dentro de uma requisição, todas as chamadas compartilham a mesma conexão,
+    retirada do pool e devolvida automaticamente no teardown da aplicação.
+    Fora do contexto da aplicação (scripts), retorna uma conexão avulsa.
+    """
+    return _conexao_do_contexto(PAPEL_ESCRITA)
+
+
+def get_db_read_connection():
+    """
+    Retorna uma conexão somente leitura (PRAGMA query_only).
+    Deve ser usada pelas rotas de consulta e dashboards: em modo WAL ela nunca
+    espera por uma importação ou escrita em andamento.
+    """
+    return _conexao_do_contexto(PAPEL_LEITURA)
+
+
+@contextmanager
+def conexao_do_pool(papel=PAPEL_LEITURA):
+    """
+    Empresta uma conexão do pool fora do contexto da requisição (ex: threads de trabalho,
+    que não podem usar a conexão guardada no `g`). A conexão volta ao pool ao sair do bloco.
+    """
+    conn = _retirar_do_pool(papel)
+    conn.emprestada = True
+    try:
+        yield conn
+    finally:
+        _devolver_ao_pool(conn)
+
+
+def close_db_connection(exception=None):
+    """Devolve ao pool as conexões usadas pelo contexto atual da aplicação."""
+    for papel in (PAPEL_ESCRITA, PAPEL_LEITURA):
+        conn = g.pop(f'db_conn_{papel}', None)
+        if conn is not None:
+            _devolver_ao_pool(conn)
+
+
+def init_app(app):
+    """Registra o teardown que devolve as conexões ao pool ao final de cada requisição."""
+    app.teardown_appcontext(close_db_connection)
+
+
 def build_tree(rows, id_field, parent_field, root_parent_id=None):
     """
     Constrói uma estrutura de árvore (hierarquia) a partir de uma lista
@@ -0,0 +1,150 @@
+# backend/derivados.py
+# Registro das estruturas derivadas das tabelas de dados (resumos, hierarquias, etc.).
+#
+# Cada estrutura se registra informando de qual tabela depende. Quem altera uma
+# tabela com estruturas derivadas (importação, restauração, edição pela tela de
+# tabelas) chama `tabelas_alteradas(conn, [...])`, que reconstrói tudo o que depende dela.
+# Antes das estruturas, as colunas de data `_iso` das tabelas alteradas são
+# recalculadas (ver datas.py), já que resumos e rotas dependem delas. Depois delas,
+# a versão das tabelas é trocada, o que invalida o cache das rotas (ver versoes_dados.py),
+# e cada estrutura reconstruída guarda em VERSOES_ESTRUTURAS a versão das tabelas de
+# origem a partir da qual foi construída (ver `estrutura_atualizada`).
+#
+# Exemplo de registro (no módulo dono da estrutura):
+#
+#   @ao_alterar('centros_custo')
+#   def reconstruir_hierarquia(conn):
+#       ...
+
+import sqlite3
+
+from .datas import COLUNAS_DATA, normalizar_tabela, tabela_normalizada
+from .versoes_dados import registrar_alteracao, garantir_tabela_versoes, versoes_por_tabela
+
+# tabela de origem -> lista de (reconstruir, atualizado)
+_reconstrutores = {}
+
+VERSOES_ESTRUTURAS = 'derivados_versoes'
+
+
+def ao_alterar(*tabelas, atualizado=None):
+    """
+    Decorador que registra uma função `reconstruir(conn)` para as tabelas informadas.
+
+    Args:
+        atualizado (callable, optional): `atualizado(conn) -> bool`. Usado na
+            inicialização para reconstruir só o que estiver faltando ou desatualizado.
+            Sem ele, a estrutura é sempre reconstruída na inicialização.
+    """
+    def decorador(funcao):
+        for tabela in tabelas:
+            _reconstrutores.setdefault(tabela, []).append((funcao, atualizado))
+        return funcao
+    return decorador
+
+
+def _origens(funcao):
+    return [tabela for tabela, registros in _reconstrutores.items() if any(f is funcao for f, _ in registros)]
+
+
+def _executar(conn, funcao):
+    """Reconstrói a estrutura. Retorna False se a reconstrução falhou."""
+    try:
+        funcao(conn)
+        return True
+    except sqlite3.Error as e:
+        # A rota que chamou já concluiu a alteração; a estrutura derivada fica para a próxima vez.
+        print(f"Aviso: não foi possível reconstruir '{funcao.__name__}': {e}")
+        return False
+
+
+def _registrar_construcao(conn, funcao):
+    """Guarda a versão atual das tabelas de origem da estrutura recém-reconstruída."""
+    try:
+        garantir_tabela_versoes(conn)
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {VERSOES_ESTRUTURAS} "
+            "(estrutura TEXT NOT NULL, tabela TEXT NOT NULL, versao TEXT NOT NULL, PRIMARY KEY (estrutura, tabela))"
+        )
+        conn.executemany(
+            f"INSERT OR REPLACE INTO {VERSOES_ESTRUTURAS} (estrutura, tabela, versao) VALUES (?, ?, ?)",
+            [(funcao.__name__, tabela, versao) for tabela, versao in versoes_por_tabela(conn, _origens(funcao)).items()]
+        )
+        conn.commit()
+    except sqlite3.Error as e:
+        print(f"Aviso: não foi possível registrar a versão de '{funcao.__name__}': {e}")
+
+
+def estrutura_atualizada(conn, funcao):
+    """
+    True se a estrutura foi reconstruída a partir da versão atual de todas as suas
+    tabelas de origem. Lança sqlite3.Error se o registro ainda não existir.
+    """
+    construida = dict(conn.execute(
+        f"SELECT tabela, versao FROM {VERSOES_ESTRUTURAS} WHERE estrutura = ?", (funcao.__name__,)
+    ).fetchall())
+    atuais = versoes_por_tabela(conn, _origens(funcao))
+    return bool(atuais) and all(construida.get(tabela) == versao for tabela, versao in atuais.items())
+
+
+def _normalizar_datas(conn, tabela):
+    try:
+        normalizar_tabela(conn, tabela)
+    except sqlite3.Error as e:
+        print(f"Aviso: não foi possível normalizar as datas de '{tabela}': {e}")
+
+
+def tabelas_alteradas(conn, tabelas, normalizar_datas=True):
+    """
+    Reconstrói as estruturas derivadas das tabelas alteradas (cada uma no máximo uma vez).
+
+    Args:
+        normalizar_datas (bool): False quando quem chamou já gravou as colunas `_iso`
+            (ex: a importação, que normaliza o DataFrame antes do to_sql).
+    """
+    if normalizar_datas:
+        for tabela in dict.fromkeys(tabelas):
+            if tabela in COLUNAS_DATA:
+                _normalizar_datas(conn, tabela)
+
+    executadas, reconstruidas = [], []
+    for tabela in tabelas:
+        for funcao, _ in _reconstrutores.get(tabela, []):
+            if funcao not in executadas:
+                executadas.append(funcao)
+                if _executar(conn, funcao):
+                    reconstruidas.append(funcao)
+
+    # Por último: uma requisição entre a troca de versão e o fim das reconstruções
+    # guardaria no cache, com a versão nova, um resultado calculado pela metade.
+    registrar_alteracao(conn, tabelas)
+    for funcao in reconstruidas:
+        _registrar_construcao(conn, funcao)
+
+
+def init_app(app):
+    """Na inicialização, reconstrói as estruturas derivadas ausentes ou desatualizadas."""
+    from .db import get_db_connection
+
+    with app.app_context():
+        conn = get_db_connection()
+        try:
+            for tabela in COLUNAS_DATA:
+                if not tabela_normalizada(conn, tabela):
+                    _normalizar_datas(conn, tabela)
+
+            executadas = []
+            for registros in _reconstrutores.values():
+                for funcao, atualizado in registros:
+                    if funcao in executadas:
+                        continue
+                    executadas.append(funcao)
+                    try:
+                        if atualizado is not None and atualizado(conn):
+                            continue
+                    except sqlite3.Error:
+                        pass
+                    if _executar(conn, funcao):
+                        _registrar_construcao(conn, funcao)
+        finally:
+            conn.close()
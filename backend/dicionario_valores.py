@@ -0,0 +1,159 @@
+# backend/dicionario_valores.py
+# Dicionário dos valores distintos de uma coluna, para os seletores de filtro do BI.
+#
+# Cada dicionário guarda os valores distintos da coluna (na ordem do ORDER BY do SQLite),
+# quantas linhas têm cada valor e um índice de trigramas do texto dos valores. A busca
+# do seletor (equivalente a LIKE '%termo%') é respondida em memória, sem ler a tabela:
+# os trigramas do termo apontam para poucos candidatos, que são conferidos com `in`.
+#
+# Os dicionários ficam em memória enquanto a versão da tabela não mudar (ver
+# versoes_dados.py), inclusive quando a alteração vem de outro processo. A importação
+# e a restauração reconstroem na hora os dicionários das tabelas que atualizaram.
+
+import sqlite3
+import string
+import sys
+import threading
+from collections import OrderedDict
+
+from .versoes_dados import versoes_por_tabela
+
+LIMITE_RESULTADOS = 200
+
+# Colunas com mais valores distintos que isso não ganham dicionário (a rota consulta a tabela).
+MAX_VALORES = 50000
+
+# Quantidade de colunas com dicionário em memória.
+DICIONARIOS_MAX = 64
+
+# Memória total aproximada dos dicionários, em bytes. Acima dela os usados há mais tempo
+# são descartados (um dicionário de 50 mil valores longos passa de 40 MB).
+MEMORIA_MAX = 256 * 1024 * 1024
+
+# O LIKE do SQLite só ignora maiúsculas/minúsculas nas letras ASCII.
+_MINUSCULAS_ASCII = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+# (tabela, coluna) -> (versão da tabela, DicionarioValores ou None quando a coluna tem valores demais)
+_dicionarios = OrderedDict()
+_memoria = 0 # Soma do `tamanho` dos dicionários em memória
+_lock = threading.Lock()
+
+
+class DicionarioValores:
+    """Valores distintos de uma coluna, com contagens e índice de trigramas para a busca por trecho."""
+
+    def __init__(self, linhas):
+        # linhas: (valor, valor como texto no SQLite, contagem), na ordem do ORDER BY.
+        self.valores = [linha[0] for linha in linhas]
+        self.contagens = [linha[2] for linha in linhas]
+        self._textos = [linha[1].translate(_MINUSCULAS_ASCII) if linha[1] is not None else None for linha in linhas]
+
+        self._trigramas = {}
+        for indice, texto in enumerate(self._textos):
+            if texto is None:
+                continue
+            for trigrama in {texto[i:i + 3] for i in range(len(texto) - 2)}:
+                # Como os índices são percorridos em ordem, cada lista já fica ordenada.
+                self._trigramas.setdefault(trigrama, []).append(indice)
+
+        # Memória aproximada, em bytes: textos, listas de valores e índice de trigramas.
+        self.tamanho = (
+            sys.getsizeof(self._trigramas)
+            + sum(sys.getsizeof(trigrama) + sys.getsizeof(lista) for trigrama, lista in self._trigramas.items())
+            + sum(sys.getsizeof(texto) for texto in self._textos if texto is not None)
+            + sys.getsizeof(self.valores) + sys.getsizeof(self.contagens) + sys.getsizeof(self._textos)
+        )
+
+    def buscar(self, termo=None, limite=LIMITE_RESULTADOS):
+        """Posições dos valores que contêm o termo (como LIKE '%termo%'), na ordem do dicionário."""
+        if not termo:
+            return list(range(min(limite, len(self.valores))))
+
+        termo = termo.translate(_MINUSCULAS_ASCII)
+        if len(termo) < 3:
+            candidatos = range(len(self._textos))
+        else:
+            listas = [self._trigramas.get(termo[i:i + 3]) for i in range(len(termo) - 2)]
+            if any(lista is None for lista in listas):
+                return []
+            candidatos = min(listas, key=len)
+
+        encontrados = []
+        for indice in candidatos:
+            texto = self._textos[indice]
+            if texto is not None and termo in texto:
+                encontrados.append(indice)
+                if len(encontrados) >= limite:
+                    break
+        return encontrados
+
+
+def termo_suportado(termo):
+    """O dicionário não interpreta os curingas do LIKE (% e _); buscas com eles vão para o banco."""
+    return not termo or ('%' not in termo and '_' not in termo)
+
+
+def _construir(conn, tabela, coluna):
+    linhas = conn.execute(
+        f'SELECT "{coluna}", CAST("{coluna}" AS TEXT), COUNT(*) FROM "{tabela}" GROUP BY 1 ORDER BY 1 ASC LIMIT ?',
+        (MAX_VALORES + 1,)
+    ).fetchall()
+    if len(linhas) > MAX_VALORES:
+        return None
+    return DicionarioValores(linhas)
+
+
+def _tamanho(item):
+    return item[1].tamanho if item[1] is not None else 0
+
+
+def _descartar(chave):
+    """Chamar com o lock."""
+    global _memoria
+    item = _dicionarios.pop(chave, None)
+    if item is not None:
+        _memoria -= _tamanho(item)
+
+
+def _guardar(chave, versao, dicionario):
+    global _memoria
+    with _lock:
+        _descartar(chave)
+        _dicionarios[chave] = (versao, dicionario)
+        _memoria += _tamanho(_dicionarios[chave])
+        # O dicionário recém-guardado fica mesmo que sozinho passe do limite de memória.
+        while len(_dicionarios) > DICIONARIOS_MAX or (_memoria > MEMORIA_MAX and len(_dicionarios) > 1):
+            _descartar(next(iter(_dicionarios)))
+
+
+def obter_dicionario(conn, tabela, coluna):
+    """
+    Retorna o dicionário da coluna (construindo-o se a tabela mudou), ou None se a coluna
+    tiver valores distintos demais. Tabela e coluna já devem ter sido validadas.
+    """
+    chave = (tabela, coluna)
+    versao = versoes_por_tabela(conn, (tabela,))[tabela]
+    with _lock:
+        versao_em_cache, dicionario = _dicionarios.get(chave, (None, None))
+        if versao_em_cache == versao:
+            _dicionarios.move_to_end(chave)
+            return dicionario
+
+    dicionario = _construir(conn, tabela, coluna)
+    _guardar(chave, versao, dicionario)
+    return dicionario
+
+
+def atualizar_dicionarios(conn, tabelas):
+    """Reconstrói os dicionários já em memória das tabelas informadas (chamar depois de `tabelas_alteradas`)."""
+    with _lock:
+        chaves = [chave for chave in _dicionarios if chave[0] in tabelas]
+    for tabela, coluna in chaves:
+        try:
+            versao = versoes_por_tabela(conn, (tabela,))[tabela]
+            _guardar((tabela, coluna), versao, _construir(conn, tabela, coluna))
+        except sqlite3.Error as e:
+            # Ex: a coluna deixou de existir. O dicionário é descartado e, se preciso, refeito na busca.
+            with _lock:
+                _descartar((tabela, coluna))
+            print(f"Aviso: não foi possível reconstruir o dicionário de '{tabela}.{coluna}': {e}")
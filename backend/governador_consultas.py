@@ -0,0 +1,235 @@
+# backend/governador_consultas.py
+# Controle das consultas montadas pelo usuário (visuais do BI).
+#
+# Um visual pode juntar tabelas grandes por um caminho de relacionamentos ruim e prender
+# o processo por minutos. Antes de executar, o plano da consulta (EXPLAIN QUERY PLAN) é
+# analisado: cada SELECT é um laço aninhado sobre as suas tabelas, e as tabelas lidas por
+# varredura completa (SCAN) multiplicam o número de linhas lidas. Acima de um limite a
+# consulta gera um aviso; com mais de uma varredura completa (junção sem índice) e acima
+# de outro limite, ela é recusada. Durante a execução, um progress handler do sqlite3
+# interrompe a consulta que passar do orçamento de tempo.
+#
+# Consultas lentas, com aviso, recusadas ou interrompidas ficam registradas com o plano
+# na tabela bi_consultas_lentas (ver GET /api/bi/consultas-lentas), que guarda só as
+# últimas CONSULTAS_LENTAS_MAX.
+
+import json
+import re
+import sqlite3
+import time
+from datetime import datetime
+
+CONSULTAS_LENTAS_TABELA = 'bi_consultas_lentas'
+
+# Linhas estimadas (produto das varreduras completas de um SELECT).
+LINHAS_AVISO = 10_000_000
+LINHAS_REJEICAO = 1_000_000_000
+
+# Orçamento de tempo de SQLite por consulta, em segundos.
+TEMPO_MAX_CONSULTA = 30
+# Consultas que levam mais que isso são registradas.
+TEMPO_CONSULTA_LENTA = 1.0
+
+# A cada quantas instruções da VM do SQLite o orçamento é conferido.
+INSTRUCOES_POR_VERIFICACAO = 10000
+
+# Quantidade de consultas mantidas no registro (as mais antigas são apagadas).
+CONSULTAS_LENTAS_MAX = 5000
+
+_LACO = re.compile(r'^(SCAN|SEARCH) (\S+)')
+
+
+class ConsultaRejeitada(Exception):
+    """Consulta recusada pela análise do plano ou interrompida por exceder o orçamento de tempo."""
+
+    def __init__(self, mensagem, status=422, detalhes=None, estimativa=None):
+        super().__init__(mensagem)
+        self.status = status
+        self.detalhes = detalhes
+        self.estimativa = estimativa
+
+
+# --- Análise do plano ---
+
+def _linhas_aproximadas(conn, tabela, contagens):
+    """Quantidade aproximada de linhas da tabela (maior rowid: custa uma busca na árvore, não uma varredura)."""
+    if tabela not in contagens:
+        try:
+            contagens[tabela] = conn.execute(f'SELECT MAX(rowid) FROM "{tabela}"').fetchone()[0] or 0
+        except sqlite3.Error:
+            contagens[tabela] = 0 # Ex: nome de subconsulta ou tabela sem rowid
+    return contagens[tabela]
+
+
+def analisar_plano(conn, sql, params):
+    """
+    Roda o EXPLAIN QUERY PLAN e estima as linhas lidas.
+    Retorna (detalhes do plano, estimativa de linhas, aviso ou None).
+    Lança ConsultaRejeitada se a consulta for uma junção por varreduras completas grande demais.
+    """
+    plano = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    detalhes = [row[3] for row in plano]
+
+    # Laços de um mesmo SELECT são irmãos no plano (mesmo pai).
+    contagens, por_select = {}, {}
+    for row in plano:
+        laco = _LACO.match(row[3])
+        if not laco:
+            continue
+        grupo = por_select.setdefault(row[1], {'linhas': 1, 'varreduras': 0})
+        if laco.group(1) == 'SCAN' and not laco.group(2).startswith('('):
+            grupo['linhas'] *= max(_linhas_aproximadas(conn, laco.group(2), contagens), 1)
+            grupo['varreduras'] += 1
+
+    estimativa = max((grupo['linhas'] for grupo in por_select.values()), default=0)
+    juncao_sem_indice = any(grupo['varreduras'] > 1 for grupo in por_select.values())
+
+    if juncao_sem_indice and estimativa > LINHAS_REJEICAO:
+        raise ConsultaRejeitada(
+            f"Consulta recusada: a junção das tabelas leria cerca de {estimativa:,} linhas sem usar índices. "
+            "Revise os relacionamentos usados pelo visual.",
+            detalhes=detalhes, estimativa=estimativa
+        )
+    aviso = None
+    if estimativa > LINHAS_AVISO:
+        aviso = f"Consulta pesada: cerca de {estimativa:,} linhas lidas por varredura completa."
+    return detalhes, estimativa, aviso
+
+
+# --- Orçamento de tempo ---
+
+class OrcamentoTempo:
+    """
+    Limita o tempo gasto pelo SQLite numa consulta. Usado como `with`, em volta do execute e
+    de cada fetch: só o tempo dentro dos blocos conta (não o de quem consome as linhas).
+    """
+
+    def __init__(self, conn, segundos=None):
+        self.conn = conn
+        self.segundos = segundos if segundos is not None else TEMPO_MAX_CONSULTA
+        self.usado = 0.0
+        self.estourou = False
+        self._inicio = None
+
+    def _verificar(self):
+        if self.usado + (time.monotonic() - self._inicio) > self.segundos:
+            self.estourou = True
+            return 1 # Valor diferente de zero interrompe a consulta
+        return 0
+
+    def __enter__(self):
+        self._inicio = time.monotonic()
+        self.conn.set_progress_handler(self._verificar, INSTRUCOES_POR_VERIFICACAO)
+        return self
+
+    def __exit__(self, tipo, erro, tb):
+        # A conexão volta ao pool: o handler não pode ficar nela.
+        self.conn.set_progress_handler(None, 0)
+        self.usado += time.monotonic() - self._inicio
+        if self.estourou and isinstance(erro, sqlite3.OperationalError):
+            raise ConsultaRejeitada(
+                f"Consulta interrompida: excedeu o limite de {self.segundos} s. Aplique filtros ao visual.",
+                status=504
+            ) from erro
+        return False
+
+
+# --- Registro das consultas lentas ---
+
+def garantir_tabela_consultas_lentas(conn):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {CONSULTAS_LENTAS_TABELA} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            data TEXT NOT NULL,
+            origem TEXT,
+            situacao TEXT NOT NULL,
+            duracao_ms INTEGER,
+            linhas INTEGER,
+            linhas_estimadas INTEGER,
+            consulta TEXT NOT NULL,
+            parametros TEXT,
+            plano TEXT,
+            mensagem TEXT
+        )
+    """)
+    conn.commit()
+
+
+def registrar_consulta(origem, situacao, sql, params, duracao=None, linhas=None, estimativa=None, detalhes=None, mensagem=None):
+    """Grava a consulta no registro (numa conexão de escrita própria, para servir também às threads)."""
+    from .db import conexao_do_pool, PAPEL_ESCRITA
+
+    print(f"--- Consulta {situacao} ({origem}): {round(duracao * 1000) if duracao is not None else '-'} ms --- {mensagem or ''}")
+    try:
+        with conexao_do_pool(PAPEL_ESCRITA) as conn:
+            conn.execute(
+                f"""INSERT INTO {CONSULTAS_LENTAS_TABELA}
+                    (data, origem, situacao, duracao_ms, linhas, linhas_estimadas, consulta, parametros, plano, mensagem)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (datetime.now().isoformat(timespec='seconds'), origem, situacao,
+                 round(duracao * 1000) if duracao is not None else None, linhas, estimativa,
+                 sql, json.dumps(params, default=str, ensure_ascii=False), '\n'.join(detalhes or []), mensagem)
+            )
+            # Retenção: busca pela chave primária, sem varrer a tabela.
+            conn.execute(
+                f"DELETE FROM {CONSULTAS_LENTAS_TABELA} WHERE id <= (SELECT MAX(id) FROM {CONSULTAS_LENTAS_TABELA}) - ?",
+                (CONSULTAS_LENTAS_MAX,)
+            )
+            conn.commit()
+    except sqlite3.Error as e:
+        print(f"Aviso: não foi possível registrar a consulta lenta: {e}")
+
+
+def consultas_registradas(conn, limite=100, situacao=None):
+    """Últimas consultas registradas (mais recentes primeiro)."""
+    where, params = "", []
+    if situacao:
+        where, params = "WHERE situacao = ?", [situacao]
+    rows = conn.execute(
+        f"SELECT * FROM {CONSULTAS_LENTAS_TABELA} {where} ORDER BY id DESC LIMIT ?", params + [limite]
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+
+# --- Execução ---
+
+def verificar_plano(conn, sql, params, origem='bi'):
+    """Como `analisar_plano`, registrando a consulta quando ela é recusada."""
+    try:
+        return analisar_plano(conn, sql, params)
+    except ConsultaRejeitada as e:
+        registrar_consulta(origem, 'recusada', sql, params, estimativa=e.estimativa, detalhes=e.detalhes, mensagem=str(e))
+        raise
+
+def executar_consulta(conn, sql, params, origem='bi'):
+    """
+    Executa a consulta com a análise do plano, o orçamento de tempo e o registro das lentas.
+    Retorna as linhas (fetchall). Lança ConsultaRejeitada.
+    """
+    inicio = time.monotonic()
+    detalhes, estimativa, aviso = verificar_plano(conn, sql, params, origem)
+
+    try:
+        with OrcamentoTempo(conn):
+            linhas = conn.execute(sql, params).fetchall()
+    except ConsultaRejeitada as e:
+        registrar_consulta(origem, 'interrompida', sql, params, time.monotonic() - inicio,
+                           estimativa=estimativa, detalhes=detalhes, mensagem=str(e))
+        raise
+
+    duracao = time.monotonic() - inicio
+    if aviso or duracao >= TEMPO_CONSULTA_LENTA:
+        registrar_consulta(origem, 'aviso' if aviso else 'lenta', sql, params, duracao, len(linhas), estimativa, detalhes, aviso)
+    return linhas
+
+
+def init_app(app):
+    """Cria o registro de consultas lentas na inicialização."""
+    from .db import get_db_connection
+
+    with app.app_context():
+        conn = get_db_connection()
+        try:
+            garantir_tabela_consultas_lentas(conn)
+        finally:
+            conn.close()
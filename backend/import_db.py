@@ -1,6 +1,20 @@
 import sqlite3
 import pandas as pd
 import os
+import sys
+
+try:
+    from .indices import garantir_indices
+    from .datas import normalizar_dataframe
+    from .derivados import tabelas_alteradas
+    from .importacao import garantir_colunas_importacao, importar_incremental, colunas_da_chave, MODO_INCREMENTAL
+except ImportError:
+    # Execução direta (python import_db.py, a partir da pasta backend).
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from backend.indices import garantir_indices
+    from backend.datas import normalizar_dataframe
+    from backend.derivados import tabelas_alteradas
+    from backend.importacao import garantir_colunas_importacao, importar_incremental, colunas_da_chave, MODO_INCREMENTAL
 
 # Define o nome do arquivo do banco de dados
 DB_FILE = "database.db"
@@ -9,7 +23,8 @@ def importar_dados():
     """
     Busca arquivos CSV ou XLSX configurados na tabela 'importacoes_bd'
     e importa seus dados para as tabelas correspondentes no banco de dados.
-    Os dados existentes nas tabelas de destino são substituídos.
+    Os dados existentes nas tabelas de destino são substituídos, exceto nas configuradas
+    com modo 'incremental', que recebem só as linhas novas, alteradas ou removidas.
     """
     print("--- Iniciando processo de importação de dados ---")
     
@@ -23,7 +38,8 @@ def importar_dados():
         return
 
     # Busca as configurações de importação
-    cursor.execute("SELECT tabela, caminho, arquivo FROM importacoes_bd")
+    garantir_colunas_importacao(conn)
+    cursor.execute("SELECT tabela, caminho, arquivo, modo_importacao, chaves_naturais, coluna_marca FROM importacoes_bd")
     configuracoes = cursor.fetchall()
 
     if not configuracoes:
@@ -35,7 +51,7 @@ def importar_dados():
 
     # Itera sobre cada configuração e tenta importar o arquivo
     for config in configuracoes:
-        tabela_destino, caminho_pasta, nome_arquivo = config
+        tabela_destino, caminho_pasta, nome_arquivo, modo_importacao, chaves_naturais, coluna_marca = config
         caminho_completo = os.path.join(caminho_pasta, nome_arquivo)
         
         print(f"\nProcessando: Tabela '{tabela_destino}' <--- Arquivo '{caminho_completo}'")
@@ -45,6 +61,20 @@ def importar_dados():
             print(f"  -> ⚠️ Arquivo não encontrado. Pulando.")
             continue
 
+        # Importação incremental: compara o arquivo com a tabela pela chave natural.
+        if modo_importacao == MODO_INCREMENTAL:
+            try:
+                resultado = importar_incremental(conn, tabela_destino, caminho_completo, colunas_da_chave(chaves_naturais), coluna_marca)
+                garantir_indices(conn, [tabela_destino])
+                if resultado['modo'] != MODO_INCREMENTAL or resultado['inseridas'] + resultado['atualizadas'] + resultado['removidas']:
+                    tabelas_alteradas(conn, [tabela_destino], normalizar_datas=False)
+                print(f"  -> ✅ Importação {resultado['modo']}: {resultado['inseridas']} inseridas, "
+                      f"{resultado['atualizadas']} atualizadas, {resultado['removidas']} removidas"
+                      f"{' (' + resultado['motivo'] + ')' if resultado['motivo'] else ''}.")
+            except Exception as e:
+                print(f"  -> ❌ Erro na importação incremental: {e}.")
+            continue
+
         # 2. Tenta ler o arquivo com o Pandas, tratando XLSX e CSV de forma diferente
         try:
             # Pega a extensão do arquivo para decidir como lê-lo
@@ -73,7 +103,9 @@ def importar_dados():
 
             # Remove colunas que são inteiramente vazias (NaN)
             df.dropna(axis=1, how='all', inplace=True)
-            
+            # Grava junto as colunas de data `_iso` (ver datas.py); o 'replace' descartaria as atuais.
+            normalizar_dataframe(df, tabela_destino)
+
             print(f"  -> ✅ Arquivo lido com sucesso. {len(df)} linhas encontradas.")
         except Exception as e:
             print(f"  -> ❌ Erro ao ler o arquivo: {e}. Pulando.")
@@ -84,6 +116,11 @@ def importar_dados():
             # O método to_sql do Pandas facilita a importação.
             # if_exists='replace' apaga a tabela se ela existir e a recria com os novos dados.
             df.to_sql(tabela_destino, conn, if_exists='replace', index=False)
+            # O 'replace' descarta os índices da tabela; recria os definidos em indices.py.
+            garantir_indices(conn, [tabela_destino])
+            # Troca a versão da tabela (invalida o cache das rotas). As estruturas derivadas
+            # registradas pelas rotas são refeitas na próxima inicialização do servidor.
+            tabelas_alteradas(conn, [tabela_destino], normalizar_datas=False)
             print(f"  -> ✅ Dados importados com sucesso para a tabela '{tabela_destino}'.")
         except Exception as e:
             print(f"  -> ❌ Erro ao importar dados para o banco: {e}.")
@@ -0,0 +1,930 @@
+# backend/importacao.py
+# Importação dos arquivos de origem (XLSX/CSV) por streaming.
+#
+# Antes, cada arquivo era lido inteiro para um DataFrame (pd.read_excel/pd.read_csv) e
+# gravado com to_sql(if_exists='replace'): com as exportações de 1 milhão de linhas o
+# pico de memória passava de alguns GB, e durante a gravação a tabela ficava pela metade.
+#
+# Aqui o arquivo é lido em lotes (CSV com chunksize, XLSX pelo iterador de linhas do
+# openpyxl em modo somente leitura) e cada lote é gravado com executemany numa tabela de
+# carga, sem tipos declarados, num banco próprio (ver "Carga"). No fim, numa única
+# transação, a tabela definitiva é criada com os tipos que o to_sql teria escolhido,
+# preenchida a partir da carga e trocada pela antiga (DROP + RENAME). Em modo WAL os
+# leitores continuam vendo a tabela antiga até o COMMIT, e nunca veem uma carga pela metade.
+#
+# Cada lote passa pelo mesmo conversor de células e de tipos do pandas (TextParser), e as
+# colunas de data ganham a coluna `_iso` (ver datas.py), como na importação anterior.
+
+import datetime as dt
+import hashlib
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+from pandas.api import types as tipos_pandas
+from pandas.io.parsers import TextParser
+
+from .datas import COLUNAS_DATA, coluna_iso, normalizar_dataframe
+from .versoes_dados import versoes_por_tabela
+
+LOTE_LINHAS = 50000
+
+SUFIXO_CARGA = '__carga'
+SUFIXO_NOVA = '__nova'
+
+EXTENSOES_EXCEL = ('.xlsx', '.xls')
+
+
+def _nome_sql(nome):
+    return '"' + str(nome).replace('"', '""') + '"'
+
+
+# --- Leitura em lotes ---
+
+def _celula_excel(cell):
+    """Mesma conversão de células do leitor openpyxl do pandas."""
+    from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+
+    if cell.value is None:
+        return ""
+    if cell.data_type == TYPE_ERROR:
+        return float('nan')
+    if cell.data_type == TYPE_NUMERIC:
+        inteiro = int(cell.value)
+        return inteiro if inteiro == cell.value else float(cell.value)
+    return cell.value
+
+
+def _linhas_xlsx(caminho):
+    """Linhas da primeira planilha (sem as células vazias do fim); as linhas vazias do fim do arquivo são descartadas."""
+    from openpyxl import load_workbook
+
+    livro = load_workbook(caminho, read_only=True, data_only=True, keep_links=False)
+    try:
+        planilha = livro.worksheets[0]
+        planilha.reset_dimensions()
+        vazias = [] # Linhas vazias só são entregues se houver dados depois delas
+        for row in planilha.rows:
+            linha = [_celula_excel(cell) for cell in row]
+            while linha and linha[-1] == "":
+                linha.pop()
+            if not linha:
+                vazias.append(linha)
+                continue
+            yield from vazias
+            vazias = []
+            yield linha
+    finally:
+        livro.close()
+
+
+def _lotes_xlsx(caminho, tamanho):
+    linhas = _linhas_xlsx(caminho)
+    cabecalho = next(linhas, None)
+    if cabecalho is None:
+        return
+    colunas = None
+
+    def converter(lote):
+        nonlocal colunas
+        largura = max([len(cabecalho)] + [len(linha) for linha in lote])
+        completas = [linha + [""] * (largura - len(linha)) for linha in lote]
+        if colunas is None:
+            # O cabeçalho passa pelo TextParser junto com o primeiro lote (nomes repetidos, "Unnamed: n").
+            df = TextParser([cabecalho + [""] * (largura - len(cabecalho))] + completas, header=0, skip_blank_lines=False).read()
+            colunas = list(df.columns)
+            return df
+        if largura > len(colunas):
+            colunas += [f"Unnamed: {i}" for i in range(len(colunas), largura)]
+        return TextParser(completas, names=colunas[:largura], header=None, skip_blank_lines=False).read().reindex(columns=colunas)
+
+    lote = []
+    for linha in linhas:
+        lote.append(linha)
+        if len(lote) >= tamanho:
+            yield converter(lote)
+            lote = []
+    if lote or colunas is None:
+        yield converter(lote)
+
+
+def ler_em_lotes(caminho, tamanho=LOTE_LINHAS):
+    """Gera DataFrames de até `tamanho` linhas do arquivo de origem (XLSX, XLS ou CSV separado por ';')."""
+    ext = os.path.splitext(caminho)[1].lower()
+    if ext == '.xlsx':
+        yield from _lotes_xlsx(caminho, tamanho)
+    elif ext in EXTENSOES_EXCEL:
+        # O openpyxl não lê .xls: o arquivo é lido inteiro e só a gravação é feita em lotes.
+        df = pd.read_excel(caminho)
+        for inicio in range(0, max(len(df), 1), tamanho):
+            yield df.iloc[inicio:inicio + tamanho]
+    else:
+        yield from pd.read_csv(caminho, sep=';', encoding='utf-8', chunksize=tamanho)
+
+
+# --- Tipos das colunas ---
+
+def _tipo_do_lote(serie):
+    if tipos_pandas.is_bool_dtype(serie.dtype):
+        return 'b'
+    if tipos_pandas.is_integer_dtype(serie.dtype):
+        return 'i'
+    if tipos_pandas.is_float_dtype(serie.dtype):
+        return 'f'
+    if tipos_pandas.is_datetime64_any_dtype(serie.dtype):
+        return 'M'
+    return 'O'
+
+
+def _tipo_sql(tipos, tem_nulos):
+    """Tipo que o to_sql daria à coluna se o arquivo fosse lido inteiro (ver SQLiteTable._sql_type_name)."""
+    if tipos in ({'i'}, {'b'}) and not tem_nulos:
+        return 'INTEGER'
+    if tipos and tipos <= {'i', 'f', 'b'}:
+        return 'REAL' # Inteiros com valores vazios viram float64 no pandas
+    if tipos == {'M'}:
+        return 'TIMESTAMP'
+    return 'TEXT'
+
+
+def _valor_sql(valor):
+    if valor is None or valor is pd.NaT or valor is pd.NA:
+        return None
+    if isinstance(valor, float):
+        if valor != valor:
+            return None
+        # Como o leitor do pandas: numa coluna mista o 1.0 fica 1 (no REAL o SQLite volta para 1.0).
+        return int(valor) if valor.is_integer() else valor
+    if isinstance(valor, pd.Timestamp):
+        return valor.to_pydatetime().isoformat(' ')
+    if isinstance(valor, (dt.datetime, dt.date, dt.time)):
+        return valor.isoformat(' ') if isinstance(valor, dt.datetime) else valor.isoformat()
+    if isinstance(valor, bool):
+        return int(valor)
+    return valor
+
+
+def _colunas_do_lote(df):
+    """Valores do lote, coluna a coluna, já convertidos para o sqlite3."""
+    colunas = []
+    for nome in df.columns:
+        serie = df[nome]
+        tipo = _tipo_do_lote(serie)
+        if tipo == 'i':
+            colunas.append(serie.tolist())
+        elif tipo == 'b':
+            colunas.append(serie.astype('int64').tolist())
+        elif tipo == 'f':
+            valores = serie.to_numpy(dtype='float64')
+            nulos = np.isnan(valores)
+            inteiros = ~nulos & (valores == np.floor(valores)) & (np.abs(valores) < 2 ** 53)
+            convertidos = valores.astype(object)
+            convertidos[inteiros] = valores[inteiros].astype('int64').astype(object)
+            convertidos[nulos] = None
+            colunas.append(convertidos.tolist())
+        else:
+            colunas.append([valor if type(valor) is str else _valor_sql(valor) for valor in serie.astype(object).tolist()])
+    return colunas
+
+
+# --- Carga ---
+#
+# A carga fica num banco SQLite próprio (o do cache das cargas, ver abaixo), e não no banco
+# principal: assim ela pode ser preparada em outro processo, em paralelo com as outras, e a
+# escrita dos lotes não passa pelo WAL do banco principal. Depois ele é anexado (ATTACH)
+# para a troca da tabela ou a aplicação das diferenças.
+
+ESQUEMA_CARGA = 'carga_importacao'
+
+# Limite da leitura por mapeamento de memória (mmap) da carga anexada, em bytes.
+MMAP_CARGA = 268435456
+
+
+def _tipos_carga_incremental(existentes, chaves, decisao):
+    """`tipos_carga` da importação incremental; grava em decisao['motivo'] se ela precisar ser completa."""
+    tipos_existentes = dict(existentes)
+
+    def tipos_carga(cabecalho, colunas):
+        # Decidido pelo cabeçalho do arquivo: no modo incremental a carga é copiada com os
+        # tipos da tabela de destino; na importação completa, usada como está (sem tipos).
+        ausentes = [chave for chave in chaves if chave not in cabecalho]
+        if ausentes:
+            raise ValueError(f"coluna(s) da chave natural ausente(s) no arquivo: {', '.join(ausentes)}")
+        # Coluna vazia no arquivo não é nova: a importação completa também a descarta (ver _colunas_finais).
+        novas = [nome for nome in cabecalho if nome not in tipos_existentes and colunas[nome]['valores']]
+        if not existentes:
+            decisao['motivo'] = "a tabela ainda não existe"
+        elif any(chave not in tipos_existentes for chave in chaves):
+            decisao['motivo'] = "a tabela não tem as colunas da chave natural"
+        elif novas:
+            decisao['motivo'] = f"colunas novas no arquivo: {', '.join(novas)}"
+        return {} if decisao['motivo'] else tipos_existentes
+
+    return tipos_carga
+
+
+def _carregar(conn, tabela, caminho, tamanho_lote):
+    """
+    Grava o arquivo, em lotes, na tabela de carga (sem tipos declarados).
+    Retorna ({coluna: {'tipos', 'nulos', 'valores'}}, número de linhas, colunas do cabeçalho).
+    """
+    carga = _nome_sql(tabela + SUFIXO_CARGA)
+    colunas = None
+    cabecalho = None
+    total = 0
+    for df in ler_em_lotes(caminho, tamanho_lote):
+        df = df.rename(columns=str)
+        normalizar_dataframe(df, tabela)
+
+        if colunas is None:
+            colunas = {nome: {'tipos': set(), 'nulos': False, 'valores': False} for nome in df.columns}
+            cabecalho = list(colunas)
+            conn.execute(f"CREATE TABLE {carga} ({', '.join(_nome_sql(nome) for nome in colunas)})")
+        for nome in df.columns:
+            if nome not in colunas: # Coluna sem cabeçalho que só aparece depois do primeiro lote
+                colunas[nome] = {'tipos': set(), 'nulos': total > 0, 'valores': False}
+                conn.execute(f"ALTER TABLE {carga} ADD COLUMN {_nome_sql(nome)}")
+        if len(df) == 0:
+            continue
+
+        for nome in df.columns:
+            nulos = df[nome].isna()
+            estatistica = colunas[nome]
+            estatistica['nulos'] = estatistica['nulos'] or bool(nulos.any())
+            if not nulos.all():
+                estatistica['valores'] = True
+                estatistica['tipos'].add(_tipo_do_lote(df[nome]))
+        for nome in colunas:
+            if nome not in df.columns:
+                colunas[nome]['nulos'] = True
+
+        nomes = list(df.columns)
+        placeholders = ', '.join('?' for _ in nomes)
+        conn.executemany(
+            f"INSERT INTO {carga} ({', '.join(_nome_sql(nome) for nome in nomes)}) VALUES ({placeholders})",
+            zip(*_colunas_do_lote(df))
+        )
+        conn.commit()
+        total += len(df)
+
+    if colunas is None:
+        raise ValueError("arquivo sem cabeçalho")
+    return colunas, total, cabecalho
+
+
+# --- Cache das cargas ---
+#
+# A leitura do XLSX pelo openpyxl é a parte cara da importação (alguns segundos a cada 100
+# mil linhas). Por isso a carga completa de cada arquivo, já convertida e com as colunas
+# `_iso`, fica guardada num banco SQLite na pasta PASTA_CACHE_CARGAS, ao lado do banco
+# principal, identificada pela tabela, pelo hash do conteúdo do arquivo (ver hash_arquivo) e
+# pelo tamanho dos lotes (os tipos do pandas são decididos por lote).
+# Enquanto o arquivo não mudar, as importações (inclusive as forçadas e as do import_db.py)
+# e a leitura dos dados brutos (`ler_exportacao`) usam esse banco, lido por mmap, sem ler
+# o XLSX de novo. Ficam só os CACHE_CARGAS_MAX bancos usados mais recentemente.
+
+PASTA_CACHE_CARGAS = 'cache_importacao'
+CACHE_CARGAS_MAX = 20
+
+# Muda quando a leitura passa a gerar outra carga (conversões, colunas `_iso`): invalida o cache.
+VERSAO_CACHE_CARGAS = 1
+
+_META_CACHE = 'carga_meta'
+
+
+def _arquivo_principal(conn):
+    """Arquivo do banco principal da conexão ('' para banco em memória)."""
+    return next((row[2] for row in conn.execute("PRAGMA database_list").fetchall() if row[1] == 'main'), '')
+
+
+def pasta_cache_cargas(conn):
+    """Pasta do cache das cargas (a do banco principal; a temporária para banco em memória)."""
+    principal = _arquivo_principal(conn)
+    return os.path.join(os.path.dirname(principal) if principal else tempfile.gettempdir(), PASTA_CACHE_CARGAS)
+
+
+def _carga_em_cache(pasta_cache, tabela, caminho, tamanho_lote=LOTE_LINHAS, hash_conteudo=None):
+    """
+    Banco com a carga completa do arquivo: o do cache ou, se ainda não existir, um criado agora.
+    `hash_conteudo` é o `hash_arquivo` do arquivo, quando já calculado.
+    Retorna (caminho do banco, {'colunas', 'total', 'cabecalho'}, se veio do cache).
+    """
+    os.makedirs(pasta_cache, exist_ok=True)
+    hash_conteudo = hash_conteudo or hash_arquivo(caminho)
+    arquivo = os.path.join(pasta_cache, f"{tabela}__{hash_conteudo}_{tamanho_lote}_v{VERSAO_CACHE_CARGAS}.db")
+    if os.path.exists(arquivo):
+        try:
+            conn = sqlite3.connect(arquivo)
+            try:
+                meta = json.loads(conn.execute(f"SELECT dados FROM {_META_CACHE}").fetchone()[0])
+            finally:
+                conn.close()
+            meta['colunas'] = {nome: {**e, 'tipos': set(e['tipos'])} for nome, e in meta['colunas'].items()}
+            os.utime(arquivo) # Usado agora: é o último a ser descartado
+            return arquivo, meta, True
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            print(f"Aviso: cache da carga de '{tabela}' ilegível, o arquivo será lido de novo: {e}")
+            descartar_carga(arquivo)
+
+    descritor, temporario = tempfile.mkstemp(prefix=f"{tabela}{SUFIXO_CARGA}_", suffix='.tmp', dir=pasta_cache)
+    os.close(descritor)
+    try:
+        conn = sqlite3.connect(temporario)
+        try:
+            conn.execute("PRAGMA journal_mode = OFF") # Até o os.replace o banco é descartável: sem journal nem fsync
+            conn.execute("PRAGMA synchronous = OFF")
+            colunas, total, cabecalho = _carregar(conn, tabela, caminho, tamanho_lote)
+            meta = {
+                'colunas': {nome: {**e, 'tipos': sorted(e['tipos'])} for nome, e in colunas.items()},
+                'total': total, 'cabecalho': cabecalho,
+            }
+            conn.execute(f"CREATE TABLE {_META_CACHE} (dados TEXT NOT NULL)")
+            conn.execute(f"INSERT INTO {_META_CACHE} (dados) VALUES (?)", (json.dumps(meta),))
+            conn.commit()
+        finally:
+            conn.close()
+        try:
+            # Atômico: quem procura no cache nunca encontra uma carga pela metade.
+            os.replace(temporario, arquivo)
+        except OSError:
+            if not os.path.exists(arquivo): # Se existe, outro processo gravou a mesma carga
+                raise
+    finally:
+        descartar_carga(temporario)
+    return arquivo, {'colunas': colunas, 'total': total, 'cabecalho': cabecalho}, False
+
+
+def limitar_cache_cargas(pasta_cache, maximo=CACHE_CARGAS_MAX):
+    """Descarta os bancos do cache usados há mais tempo, deixando só `maximo`."""
+    try:
+        arquivos = [os.path.join(pasta_cache, nome) for nome in os.listdir(pasta_cache) if nome.endswith('.db')]
+    except OSError:
+        return
+    arquivos.sort(key=lambda arquivo: os.path.getmtime(arquivo), reverse=True)
+    for arquivo in arquivos[maximo:]:
+        descartar_carga(arquivo)
+
+
+def ler_exportacao(conn, tabela, caminho, colunas=None):
+    """
+    Dados brutos do arquivo de origem da tabela (como a importação os lê, com as colunas
+    `_iso`), num DataFrame. Lê do cache das cargas; o arquivo só é lido se tiver mudado.
+    """
+    arquivo, meta, _ = _carga_em_cache(pasta_cache_cargas(conn), tabela, caminho)
+    ausentes = [nome for nome in colunas or [] if nome not in meta['colunas']]
+    if ausentes:
+        raise ValueError(f"coluna(s) inexistente(s) no arquivo: {', '.join(ausentes)}")
+    nomes = [nome for nome in meta['colunas'] if colunas is None or nome in colunas]
+    leitura = sqlite3.connect(arquivo)
+    try:
+        leitura.execute(f"PRAGMA mmap_size = {MMAP_CARGA}")
+        return pd.read_sql_query(
+            f"SELECT {', '.join(_nome_sql(nome) for nome in nomes)} FROM {_nome_sql(tabela + SUFIXO_CARGA)}", leitura
+        )
+    finally:
+        leitura.close()
+
+
+# --- Preparação da carga ---
+
+def arquivo_de_carga(conn, tabela):
+    """Caminho de um banco de carga novo, na pasta do banco principal da conexão."""
+    descritor, caminho = tempfile.mkstemp(
+        prefix=f"{tabela}{SUFIXO_CARGA}_", suffix='.db', dir=os.path.dirname(_arquivo_principal(conn)) or None
+    )
+    os.close(descritor)
+    return caminho
+
+
+def descartar_carga(caminho_carga):
+    try:
+        os.remove(caminho_carga)
+    except OSError:
+        pass
+
+
+def _copiar_carga(origem, caminho_carga, tabela, nomes, tipos):
+    """Copia a carga do cache para o banco de carga, declarando os tipos informados."""
+    carga = _nome_sql(tabela + SUFIXO_CARGA)
+    definicao = ', '.join(f"{_nome_sql(nome)} {tipos.get(nome, '')}".strip() for nome in nomes)
+    lista = ', '.join(_nome_sql(nome) for nome in nomes)
+    conn = sqlite3.connect(caminho_carga)
+    try:
+        conn.execute("PRAGMA journal_mode = OFF") # Banco descartável: sem journal nem fsync
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("ATTACH DATABASE ? AS origem", (origem,))
+        conn.execute(f"CREATE TABLE main.{carga} ({definicao})")
+        conn.execute(f"INSERT INTO main.{carga} ({lista}) SELECT {lista} FROM origem.{carga}")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def preparar_carga(tabela, caminho, caminho_carga, existentes=None, chaves=None, tamanho_lote=LOTE_LINHAS, pasta_cache=None, hash_conteudo=None):
+    """
+    Obtém a carga do arquivo pelo cache (lendo o arquivo só se ele mudou). Não usa o banco
+    principal, então pode rodar em outro processo (ver `preparar_em_processo`).
+
+    Args:
+        existentes (list, optional): colunas (nome, tipo) da tabela de destino; com `chaves`,
+            prepara a carga da importação incremental, copiada para `caminho_carga`.
+        pasta_cache (str, optional): pasta do cache das cargas (ver `pasta_cache_cargas`).
+        hash_conteudo (str, optional): `hash_arquivo` do arquivo, se já calculado (ver
+            `arquivo_inalterado`); sem ele o arquivo é lido mais uma vez para o hash.
+
+    Returns:
+        dict: {'colunas', 'total', 'motivo', 'arquivo', 'cache', 'segundos'}; 'arquivo' é o
+        banco a anexar (o do cache ou `caminho_carga`) e 'motivo' diz por que uma carga
+        incremental precisa ser aplicada como importação completa.
+    """
+    inicio = time.perf_counter()
+    pasta_cache = pasta_cache or os.path.join(tempfile.gettempdir(), PASTA_CACHE_CARGAS)
+    arquivo, meta, em_cache = _carga_em_cache(pasta_cache, tabela, caminho, tamanho_lote, hash_conteudo)
+    decisao = {'motivo': None}
+    tipos = _tipos_carga_incremental(existentes or [], chaves, decisao)(meta['cabecalho'], meta['colunas']) if chaves else {}
+    if tipos:
+        # A carga incremental recebe os tipos da tabela de destino e ainda ganha um índice:
+        # vai para um banco próprio, e o do cache não é alterado.
+        _copiar_carga(arquivo, caminho_carga, tabela, list(meta['colunas']), tipos)
+        arquivo = caminho_carga
+    return {
+        'colunas': meta['colunas'], 'total': meta['total'], 'motivo': decisao['motivo'],
+        'arquivo': arquivo, 'cache': em_cache, 'segundos': time.perf_counter() - inicio,
+    }
+
+
+def preparar_em_processo(tabela, caminho, caminho_carga, existentes=None, chaves=None, tamanho_lote=LOTE_LINHAS, pasta_cache=None, hash_conteudo=None):
+    """
+    Como `preparar_carga`, num processo Python separado (`python -m backend.importacao preparar`).
+    O processo não importa o módulo principal da aplicação, ao contrário do multiprocessing.
+    """
+    entrada = json.dumps({
+        'tabela': tabela, 'caminho': caminho, 'caminho_carga': caminho_carga,
+        'existentes': existentes, 'chaves': chaves, 'tamanho_lote': tamanho_lote, 'pasta_cache': pasta_cache,
+        'hash_conteudo': hash_conteudo,
+    })
+    raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    processo = subprocess.run(
+        [sys.executable, '-m', f"{__package__}.importacao", 'preparar'],
+        input=entrada, capture_output=True, text=True, encoding='utf-8', cwd=raiz
+    )
+    linhas = processo.stdout.strip().splitlines()
+    if processo.returncode != 0 or not linhas:
+        erro = (processo.stderr.strip().splitlines() or ['processo de leitura encerrado sem resultado'])[-1]
+        raise RuntimeError(erro)
+    resultado = json.loads(linhas[-1])
+    if 'erro' in resultado:
+        raise RuntimeError(resultado['erro'])
+    resultado['colunas'] = {
+        nome: {**e, 'tipos': set(e['tipos'])} for nome, e in resultado['colunas'].items()
+    }
+    return resultado
+
+
+# --- Aplicação da carga ---
+
+def _limpar_tabela_nova(conn, tabela):
+    if conn.in_transaction:
+        conn.rollback()
+    conn.execute(f"DROP TABLE IF EXISTS {_nome_sql(tabela + SUFIXO_NOVA)}")
+    conn.commit()
+
+
+def _colunas_finais(tabela, colunas):
+    """Colunas (nome, tipo) que a importação completa cria."""
+    # Como o dropna(axis=1, how='all') da importação anterior: as colunas vazias são descartadas,
+    # e a coluna `_iso` fica sempre que a coluna de data de origem ficar.
+    mantidas = {nome for nome, e in colunas.items() if e['valores']}
+    mantidas |= {coluna_iso(coluna) for coluna in COLUNAS_DATA.get(tabela, ()) if coluna in mantidas}
+    finais = [(nome, _tipo_sql(e['tipos'], e['nulos'])) for nome, e in colunas.items() if nome in mantidas]
+    if not finais:
+        raise ValueError("nenhuma coluna com dados")
+    return finais
+
+
+def _trocar_tabela(conn, tabela, carga, finais):
+    """Cria a tabela definitiva a partir da carga e a troca pela antiga, numa única transação."""
+    nova = _nome_sql(tabela + SUFIXO_NOVA)
+    definicao = ",\n  ".join(f"{_nome_sql(nome)} {tipo}" for nome, tipo in finais)
+    lista = ', '.join(_nome_sql(nome) for nome, _ in finais)
+    conn.execute('BEGIN')
+    conn.execute(f"CREATE TABLE {nova} (\n{definicao}\n)")
+    conn.execute(f"INSERT INTO {nova} ({lista}) SELECT {lista} FROM {carga}")
+    conn.execute(f"DROP TABLE IF EXISTS main.{_nome_sql(tabela)}")
+    conn.execute(f"ALTER TABLE {nova} RENAME TO {_nome_sql(tabela)}")
+    conn.commit()
+
+
+def aplicar_carga(conn, tabela, caminho_carga, preparada, chaves=None, coluna_marca=None):
+    """
+    Aplica à tabela a carga preparada: troca a tabela inteira ou, com `chaves`, aplica só as
+    diferenças. Em caso de erro a tabela antiga permanece intacta.
+
+    Returns:
+        dict: {'modo', 'linhas', 'inseridas', 'atualizadas', 'removidas', 'motivo'}.
+    """
+    carga = f"{ESQUEMA_CARGA}.{_nome_sql(tabela + SUFIXO_CARGA)}"
+    _limpar_tabela_nova(conn, tabela)
+    conn.execute(f"ATTACH DATABASE ? AS {ESQUEMA_CARGA}", (preparada.get('arquivo') or caminho_carga,))
+    try:
+        conn.execute(f"PRAGMA {ESQUEMA_CARGA}.mmap_size = {MMAP_CARGA}")
+        finais = _colunas_finais(tabela, preparada['colunas'])
+        total = preparada['total']
+        if not chaves:
+            _trocar_tabela(conn, tabela, carga, finais)
+            return {'modo': MODO_COMPLETO, 'linhas': total, 'inseridas': total, 'atualizadas': 0, 'removidas': 0, 'motivo': None}
+
+        existentes = _colunas_da_tabela(conn, tabela)
+        motivo = preparada['motivo']
+        if not motivo:
+            novas = [nome for nome, _ in finais if nome not in dict(existentes)] # Colunas sem cabeçalho (finais já exclui as vazias)
+            if novas:
+                motivo = f"colunas novas no arquivo: {', '.join(novas)}"
+        if motivo:
+            _trocar_tabela(conn, tabela, carga, finais)
+            return {'modo': MODO_COMPLETO, 'linhas': total, 'inseridas': total, 'atualizadas': 0, 'removidas': 0, 'motivo': motivo}
+
+        for nome, tipo in existentes:
+            if nome not in preparada['colunas']: # Coluna da tabela ausente no arquivo: fica NULL
+                conn.execute(f"ALTER TABLE {carga} ADD COLUMN {_nome_sql(nome)} {tipo}")
+        contagens = _aplicar_diferencas(conn, tabela, carga, [nome for nome, _ in existentes], chaves, coluna_marca)
+        linhas = conn.execute(f"SELECT COUNT(*) FROM main.{_nome_sql(tabela)}").fetchone()[0]
+        return {'modo': MODO_INCREMENTAL, 'linhas': linhas, **contagens, 'motivo': None}
+    except BaseException:
+        _limpar_tabela_nova(conn, tabela)
+        raise
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        conn.execute(f"DETACH DATABASE {ESQUEMA_CARGA}")
+
+
+def _importar(conn, tabela, caminho, chaves, coluna_marca, tamanho_lote):
+    pasta_cache = pasta_cache_cargas(conn)
+    caminho_carga = arquivo_de_carga(conn, tabela)
+    try:
+        existentes = _colunas_da_tabela(conn, tabela) if chaves else None
+        preparada = preparar_carga(tabela, caminho, caminho_carga, existentes, chaves, tamanho_lote, pasta_cache)
+        return aplicar_carga(conn, tabela, caminho_carga, preparada, chaves, coluna_marca)
+    finally:
+        descartar_carga(caminho_carga)
+        limitar_cache_cargas(pasta_cache)
+
+
+def importar_arquivo(conn, tabela, caminho, tamanho_lote=LOTE_LINHAS):
+    """
+    Importa o arquivo para a tabela (substituindo-a) e retorna o número de linhas importadas.
+    Em caso de erro a tabela antiga permanece intacta.
+    """
+    return _importar(conn, tabela, caminho, None, None, tamanho_lote)['linhas']
+
+
+# --- Importação incremental ---
+#
+# Na importação incremental (modo 'incremental' em importacoes_bd) a tabela não é recriada:
+# o arquivo é comparado com ela pela chave natural (`chaves_naturais`) e só as diferenças
+# são aplicadas (INSERT/UPDATE/DELETE). A tabela de carga é criada com os mesmos tipos
+# declarados da tabela de destino, para que os dois lados passem pelas mesmas conversões
+# do SQLite; uma linha muda quando algum valor difere (IS NOT, que também compara os NULL).
+# A comparação é feita pelo próprio SQLite: um hash do conteúdo calculado em Python custava
+# duas chamadas de função por linha, mais de dez vezes o tempo da comparação direta.
+#
+# Com `coluna_marca` (ex: data da medição), o arquivo pode trazer só um período recente:
+# as linhas da tabela anteriores à menor marca do arquivo não são comparadas nem removidas.
+# Quando a coluna de marca é uma coluna de data com versão `_iso`, a comparação usa a `_iso`.
+#
+# Se a tabela ainda não existir ou o arquivo trouxer colunas novas, a importação é completa.
+
+MODO_COMPLETO = 'completa'
+MODO_INCREMENTAL = 'incremental'
+MODOS_IMPORTACAO = (MODO_COMPLETO, MODO_INCREMENTAL)
+
+
+def colunas_da_chave(texto):
+    """Lista das colunas da chave natural, configurada como texto separado por vírgulas."""
+    return [coluna.strip() for coluna in (texto or '').split(',') if coluna.strip()]
+
+
+def _colunas_da_tabela(conn, tabela):
+    return [(row[1], row[2]) for row in conn.execute(f"PRAGMA main.table_info({_nome_sql(tabela)})").fetchall()]
+
+
+def importar_incremental(conn, tabela, caminho, chaves, coluna_marca=None, tamanho_lote=LOTE_LINHAS):
+    """
+    Aplica à tabela só as diferenças em relação ao arquivo, comparando pela chave natural.
+
+    Returns:
+        dict: {'modo', 'linhas', 'inseridas', 'atualizadas', 'removidas', 'motivo'}. 'modo' é
+        MODO_COMPLETO (e 'motivo' diz por quê) quando a tabela precisou ser recriada.
+
+    Raises:
+        ValueError: se o arquivo tiver linhas sem a chave natural ou com a chave repetida.
+    """
+    if not chaves:
+        raise ValueError("a importação incremental precisa das colunas da chave natural")
+    return _importar(conn, tabela, caminho, chaves, coluna_marca, tamanho_lote)
+
+
+def _aplicar_diferencas(conn, tabela, carga, nomes, chaves, coluna_marca):
+    destino = f"main.{_nome_sql(tabela)}"
+    chave_sql = ', '.join(_nome_sql(chave) for chave in chaves)
+    # Uma linha sem chave nunca é igual a outra (NULL = NULL é falso): seria apagada e
+    # inserida de novo a cada importação, e o índice único aceitaria várias delas.
+    sem_chave = conn.execute(
+        f"SELECT COUNT(*) FROM {carga} WHERE {' OR '.join(f'{_nome_sql(chave)} IS NULL' for chave in chaves)}"
+    ).fetchone()[0]
+    if sem_chave:
+        raise ValueError(f"{sem_chave} linha(s) do arquivo sem a chave natural ({', '.join(chaves)})")
+    try:
+        conn.execute(
+            f"CREATE UNIQUE INDEX {ESQUEMA_CARGA}.{_nome_sql(tabela + SUFIXO_CARGA + '_chave')} "
+            f"ON {_nome_sql(tabela + SUFIXO_CARGA)} ({chave_sql})"
+        )
+    except sqlite3.IntegrityError:
+        raise ValueError(f"chave natural repetida no arquivo ({', '.join(chaves)})")
+    # Índice da chave natural na tabela de destino (a importação completa o descarta junto com a tabela).
+    conn.execute(f"CREATE INDEX IF NOT EXISTS main.{_nome_sql('idx_' + tabela + '_chave_natural')} ON {_nome_sql(tabela)} ({chave_sql})")
+    conn.commit()
+
+    alvo = _nome_sql(tabela) # Nas condições, a tabela de destino é referida pelo nome
+    mesma_chave = ' AND '.join(f"c.{_nome_sql(chave)} = {alvo}.{_nome_sql(chave)}" for chave in chaves)
+    diferente = ' OR '.join(f"c.{_nome_sql(nome)} IS NOT {alvo}.{_nome_sql(nome)}" for nome in nomes)
+    todas = ', '.join(_nome_sql(nome) for nome in nomes)
+
+    janela, params_janela = "", ()
+    if coluna_marca:
+        marca = coluna_iso(coluna_marca) if coluna_iso(coluna_marca) in nomes else coluna_marca
+        if marca not in nomes:
+            raise ValueError(f"coluna de marca '{coluna_marca}' não existe na tabela")
+        inicio = conn.execute(f"SELECT MIN({_nome_sql(marca)}) FROM {carga}").fetchone()[0]
+        if inicio is not None:
+            janela, params_janela = f"{alvo}.{_nome_sql(marca)} >= ? AND ", (inicio,)
+
+    conn.execute('BEGIN')
+    removidas = conn.execute(
+        f"DELETE FROM {destino} WHERE {janela}NOT EXISTS (SELECT 1 FROM {carga} AS c WHERE {mesma_chave})",
+        params_janela
+    ).rowcount
+    atualizadas = conn.execute(
+        f"UPDATE {destino} SET {', '.join(f'{_nome_sql(nome)} = c.{_nome_sql(nome)}' for nome in nomes)} "
+        f"FROM {carga} AS c WHERE {mesma_chave} AND ({diferente})"
+    ).rowcount
+    inseridas = conn.execute(
+        f"INSERT INTO {destino} ({todas}) SELECT {todas} FROM {carga} AS c "
+        f"WHERE NOT EXISTS (SELECT 1 FROM {destino} WHERE {mesma_chave})"
+    ).rowcount
+    conn.commit()
+    return {'inseridas': inseridas, 'atualizadas': atualizadas, 'removidas': removidas}
+
+
+# --- Várias importações ---
+#
+# Cada arquivo é lido (e gravado no seu banco de carga) num processo separado, até
+# PROCESSOS_IMPORTACAO ao mesmo tempo: a leitura do XLSX pelo openpyxl é Python puro e ocupa
+# um núcleo inteiro. As cargas são aplicadas ao banco principal por uma única thread (a que
+# chamou), uma de cada vez, assim que ficam prontas e respeitando DEPENDENCIAS_IMPORTACAO:
+# os cadastros são aplicados antes das tabelas que os referenciam.
+
+PROCESSOS_IMPORTACAO = 4
+
+# tabela -> tabelas que precisam ser aplicadas antes dela (quando importadas na mesma execução)
+DEPENDENCIAS_IMPORTACAO = {
+    'equipamentos': ('centros_custo', 'tipo_obj', 'fabricantes', 'modelo_submodelo', 'status_equip', 'localizacao'),
+    'horimetro': ('equipamentos',),
+    'preventivas': ('equipamentos', 'centros_custo'),
+    'controle_pneus': ('equipamentos',),
+    'agregacao_pneus': ('equipamentos', 'controle_pneus'),
+}
+
+
+def _dependencias_pendentes(tarefas, pendentes, indice):
+    tabela = tarefas[indice]['tabela']
+    dependencias = DEPENDENCIAS_IMPORTACAO.get(tabela, ())
+    return [
+        outro for outro in pendentes
+        if outro != indice and (tarefas[outro]['tabela'] in dependencias or (tarefas[outro]['tabela'] == tabela and outro < indice))
+    ]
+
+
+def importar_varios(conn, tarefas, processos=PROCESSOS_IMPORTACAO):
+    """
+    Importa vários arquivos: lê em paralelo, em processos separados, e aplica um de cada vez.
+
+    Args:
+        tarefas (list): dicts com 'tabela', 'caminho', 'chaves' (None na importação completa),
+            'coluna_marca' e, opcional, 'hash' (o `hash_arquivo` já calculado, que não é refeito).
+
+    Gera, na ordem em que as cargas são aplicadas, (tarefa, resultado de `aplicar_carga` ou a
+    exceção, tempos em segundos {'leitura', 'espera', 'gravacao'} e 'cache', se a carga veio
+    do cache das cargas).
+    """
+    processos = max(1, min(processos, len(tarefas), os.cpu_count() or 1))
+    pasta_cache = pasta_cache_cargas(conn)
+    cargas = [arquivo_de_carga(conn, tarefa['tabela']) for tarefa in tarefas]
+    existentes = [_colunas_da_tabela(conn, tarefa['tabela']) if tarefa.get('chaves') else None for tarefa in tarefas]
+    # Com um só processo, a leitura é feita aqui mesmo, antes de cada aplicação.
+    executor = ThreadPoolExecutor(max_workers=processos) if processos > 1 else None
+    try:
+        futuros = {}
+        if executor:
+            futuros = {
+                indice: executor.submit(
+                    preparar_em_processo, tarefa['tabela'], tarefa['caminho'], cargas[indice], existentes[indice],
+                    tarefa.get('chaves'), pasta_cache=pasta_cache, hash_conteudo=tarefa.get('hash')
+                )
+                for indice, tarefa in enumerate(tarefas)
+            }
+
+        pendentes = list(range(len(tarefas)))
+        while pendentes:
+            # Dependência circular: segue a ordem configurada.
+            prontas = [indice for indice in pendentes if not _dependencias_pendentes(tarefas, pendentes, indice)] or pendentes[:1]
+            inicio = time.perf_counter()
+            if executor:
+                wait([futuros[indice] for indice in prontas], return_when=FIRST_COMPLETED)
+                indice = next(indice for indice in prontas if futuros[indice].done())
+            else:
+                indice = prontas[0]
+            pendentes.remove(indice)
+
+            tarefa = tarefas[indice]
+            tempos = {'leitura': None, 'espera': 0.0, 'gravacao': 0.0, 'cache': False}
+            try:
+                if executor:
+                    preparada = futuros[indice].result()
+                    tempos['espera'] = time.perf_counter() - inicio
+                else:
+                    preparada = preparar_carga(
+                        tarefa['tabela'], tarefa['caminho'], cargas[indice], existentes[indice],
+                        tarefa.get('chaves'), pasta_cache=pasta_cache, hash_conteudo=tarefa.get('hash')
+                    )
+                tempos['leitura'], tempos['cache'] = preparada['segundos'], preparada['cache']
+                inicio = time.perf_counter()
+                resultado = aplicar_carga(conn, tarefa['tabela'], cargas[indice], preparada, tarefa.get('chaves'), tarefa.get('coluna_marca'))
+                tempos['gravacao'] = time.perf_counter() - inicio
+            except Exception as e:
+                resultado = e
+            finally:
+                descartar_carga(cargas[indice])
+            yield tarefa, resultado, tempos
+    finally:
+        if executor:
+            executor.shutdown(wait=True, cancel_futures=True)
+        for caminho_carga in cargas:
+            descartar_carga(caminho_carga)
+        # Só no fim: um banco do cache não pode sumir entre a preparação e a aplicação.
+        limitar_cache_cargas(pasta_cache)
+
+
+# --- Arquivos sem alteração ---
+#
+# Para cada arquivo importado fica registrado o tamanho, a data de modificação (mtime) e o
+# hash do conteúdo, junto com a versão da tabela logo após a importação (ver versoes_dados.py).
+# Na atualização seguinte o arquivo é ignorado se nada disso mudou: tamanho e mtime iguais
+# dispensam a leitura; com o mtime diferente (arquivo copiado de novo, sem alterações) o
+# hash decide. A versão da tabela garante que uma restauração de backup ou uma edição pela
+# tela de tabelas, feitas depois da importação, não sejam mantidas por engano, e a
+# configuração da importação (modo, chave natural e coluna de marca, ver
+# `configuracao_importacao`) faz o arquivo ser importado de novo quando ela muda.
+
+ARQUIVOS_TABELA = 'importacoes_arquivos'
+
+# Tamanho dos blocos lidos no cálculo do hash.
+HASH_BLOCO = 1024 * 1024
+
+
+def garantir_tabela_arquivos(conn):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {ARQUIVOS_TABELA} (
+            tabela TEXT NOT NULL,
+            caminho TEXT NOT NULL,
+            tamanho INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            hash TEXT NOT NULL,
+            versao_tabela TEXT NOT NULL,
+            data TEXT NOT NULL,
+            configuracao TEXT,
+            PRIMARY KEY (tabela, caminho)
+        )
+    """)
+    existentes = {row[1] for row in conn.execute(f"PRAGMA table_info({ARQUIVOS_TABELA})").fetchall()}
+    if 'configuracao' not in existentes:
+        conn.execute(f"ALTER TABLE {ARQUIVOS_TABELA} ADD COLUMN configuracao TEXT")
+    conn.commit()
+
+
+def configuracao_importacao(modo_importacao, chaves_naturais, coluna_marca):
+    """Texto que identifica a configuração da importação de uma tabela (em importacoes_bd)."""
+    return json.dumps([modo_importacao or MODO_COMPLETO, colunas_da_chave(chaves_naturais), coluna_marca or None])
+
+
+def hash_arquivo(caminho):
+    """Hash do conteúdo do arquivo, lido em blocos."""
+    resumo = hashlib.blake2b(digest_size=20)
+    with open(caminho, 'rb') as arquivo:
+        for bloco in iter(lambda: arquivo.read(HASH_BLOCO), b''):
+            resumo.update(bloco)
+    return resumo.hexdigest()
+
+
+def arquivo_inalterado(conn, tabela, caminho, configuracao=None):
+    """
+    Verifica se o arquivo, a tabela e a configuração da importação estão como na última importação.
+
+    Args:
+        configuracao (str): `configuracao_importacao` da tabela.
+
+    Retorna (inalterado, impressão do arquivo para `registrar_arquivo`).
+    """
+    info = os.stat(caminho)
+    impressao = {'tamanho': info.st_size, 'mtime_ns': info.st_mtime_ns, 'hash': None, 'configuracao': configuracao}
+    registro = conn.execute(
+        f"SELECT tamanho, mtime_ns, hash, versao_tabela, configuracao FROM {ARQUIVOS_TABELA} WHERE tabela = ? AND caminho = ?",
+        (tabela, caminho)
+    ).fetchone()
+    existe = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name = ?", (tabela,)).fetchone()
+    if (registro is None or not existe or registro[3] != versoes_por_tabela(conn, (tabela,))[tabela]
+            or registro[4] != configuracao):
+        impressao['hash'] = hash_arquivo(caminho)
+        return False, impressao
+
+    if registro[0] == impressao['tamanho'] and registro[1] == impressao['mtime_ns']:
+        impressao['hash'] = registro[2]
+        return True, impressao
+    impressao['hash'] = hash_arquivo(caminho)
+    inalterado = registro[0] == impressao['tamanho'] and registro[2] == impressao['hash']
+    if inalterado:
+        # Mesmo conteúdo com outro mtime: guarda o novo para as próximas verificações dispensarem o hash.
+        conn.execute(
+            f"UPDATE {ARQUIVOS_TABELA} SET mtime_ns = ? WHERE tabela = ? AND caminho = ?",
+            (impressao['mtime_ns'], tabela, caminho)
+        )
+        conn.commit()
+    return inalterado, impressao
+
+
+def registrar_arquivo(conn, tabela, caminho, impressao):
+    """Registra o arquivo importado (chamar depois de `tabelas_alteradas`, que troca a versão da tabela)."""
+    conn.execute(
+        f"""INSERT OR REPLACE INTO {ARQUIVOS_TABELA} (tabela, caminho, tamanho, mtime_ns, hash, versao_tabela, data, configuracao)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+        (tabela, caminho, impressao['tamanho'], impressao['mtime_ns'], impressao['hash'],
+         versoes_por_tabela(conn, (tabela,))[tabela], dt.datetime.now().isoformat(timespec='seconds'),
+         impressao.get('configuracao'))
+    )
+    conn.commit()
+
+
+def garantir_colunas_importacao(conn):
+    """Acrescenta a importacoes_bd as colunas de configuração da importação incremental."""
+    existentes = {row[1] for row in conn.execute("PRAGMA table_info(importacoes_bd)").fetchall()}
+    if not existentes:
+        return
+    for coluna, definicao in (
+        ('modo_importacao', f"TEXT NOT NULL DEFAULT '{MODO_COMPLETO}'"),
+        ('chaves_naturais', 'TEXT'),
+        ('coluna_marca', 'TEXT'),
+    ):
+        if coluna not in existentes:
+            conn.execute(f"ALTER TABLE importacoes_bd ADD COLUMN {coluna} {definicao}")
+    conn.commit()
+
+
+def init_app(app):
+    """Garante as colunas de configuração da importação em importacoes_bd e o registro dos arquivos importados."""
+    from .db import get_db_connection
+
+    with app.app_context():
+        conn = get_db_connection()
+        try:
+            garantir_colunas_importacao(conn)
+            garantir_tabela_arquivos(conn)
+        finally:
+            conn.close()
+
+
+def _preparar_pela_linha_de_comando():
+    """Processo de leitura de `preparar_em_processo`: parâmetros em JSON na entrada, resultado na saída."""
+    parametros = json.load(sys.stdin)
+    try:
+        preparada = preparar_carga(**parametros)
+        preparada['colunas'] = {nome: {**e, 'tipos': sorted(e['tipos'])} for nome, e in preparada['colunas'].items()}
+    except Exception as e:
+        preparada = {'erro': str(e)}
+    sys.stdout.write(json.dumps(preparada) + '\n')
+
+
+if __name__ == '__main__':
+    # python -m backend.importacao preparar < parametros.json
+    if sys.argv[1:] == ['preparar']:
+        _preparar_pela_linha_de_comando()
+    else:
+        print("Uso: python -m backend.importacao preparar")
+        sys.exit(1)
@@ -0,0 +1,289 @@
+# backend/indices.py
+# Migrações versionadas dos índices secundários do banco de dados.
+#
+# As tabelas importadas por `atualizacaodb` são recriadas com
+# `to_sql(if_exists='replace')`, o que descarta os índices delas. Por isso, além
+# de registrar as migrações aplicadas, este módulo expõe `garantir_indices`, que
+# deve ser chamado depois de toda importação/restauração para recriá-los.
+#
+# Uso pela linha de comando (a partir da raiz do projeto):
+#   python -m backend.indices aplicar    -> aplica as migrações pendentes
+#   python -m backend.indices explicar   -> mostra o EXPLAIN QUERY PLAN das consultas das rotas
+
+import sqlite3
+import sys
+from datetime import datetime
+
+# Cada migração cria (e opcionalmente remove) índices.
+# Um índice é descrito por (nome, tabela, colunas). Nunca altere uma migração já
+# publicada: para mudar um índice, crie uma nova versão que o remova e o recrie.
+MIGRACOES = [
+    {
+        "versao": 1,
+        "descricao": "Índices das consultas de pneus, preventivas, notificações e chats",
+        "criar": [
+            # pneus: inspeções/analise-geral filtram por equipamento e ordenam por data_medicao
+            ("idx_controle_pneus_equip_data", "controle_pneus", ("equipamento", "data_medicao")),
+            # pneus: histórico/detalhes por num_fogo ordenados por data (cobre a medição)
+            ("idx_controle_pneus_fogo_data", "controle_pneus", ("num_fogo", "data_medicao", "medicao")),
+            ("idx_agregacao_pneus_fogo", "agregacao_pneus", ("num_fogo",)),
+            # preventivas: filtro por centro de custo + datas, cobrindo as colunas usadas no cálculo de aderência
+            ("idx_preventivas_cc_termino", "preventivas",
+             ("cod_cc", "datatermino", "datavencimento", "tipo", "hor_termino", "hor_vencimento", "hor_atual")),
+            ("idx_preventivas_termino", "preventivas", ("datatermino",)),
+            ("idx_preventivas_vencimento", "preventivas", ("datavencimento",)),
+            # hierarquia de centros de custo (contrato -> núcleo -> superintendência)
+            ("idx_centros_custo_cod", "centros_custo", ("cod_cc",)),
+            ("idx_centros_custo_pai", "centros_custo", ("pai_id",)),
+            ("idx_equipamentos_cc", "equipamentos", ("cod_cc",)),
+            # notificações do usuário
+            ("idx_notif_status_usuario", "notificacoes_status_usuarios", ("usuario_id", "lida", "notificacao_id")),
+            # chats: listagem ordenada e MAX(ordem) por tarefa/plano/chamado
+            ("idx_ga_chat_tarefas_tarefa_ordem", "ga_chat_tarefas", ("tarefa_id", "ordem")),
+            ("idx_ga_chat_planos_plano_ordem", "ga_chat_planos", ("plano_id", "ordem")),
+            ("idx_chat_chamados_chamado_ordem", "chat_chamados", ("chamado_id", "ordem")),
+        ],
+        "remover": [],
+    },
+    {
+        "versao": 2,
+        "descricao": "Índices de data passam a usar as colunas normalizadas (_iso)",
+        "criar": [
+            ("idx_controle_pneus_equip_data_iso", "controle_pneus", ("equipamento", "data_medicao_iso")),
+            ("idx_controle_pneus_fogo_data_iso", "controle_pneus", ("num_fogo", "data_medicao_iso", "medicao")),
+            ("idx_agregacao_pneus_fogo_entrada_iso", "agregacao_pneus", ("num_fogo", "data_entrada_iso")),
+            ("idx_preventivas_cc_termino_iso", "preventivas",
+             ("cod_cc", "datatermino", "datatermino_iso", "datavencimento_iso", "tipo", "hor_termino", "hor_vencimento", "hor_atual")),
+            ("idx_preventivas_termino_iso", "preventivas", ("datatermino_iso",)),
+            ("idx_preventivas_vencimento_iso", "preventivas", ("datavencimento_iso",)),
+        ],
+        "remover": [
+            "idx_controle_pneus_equip_data",
+            "idx_controle_pneus_fogo_data",
+            "idx_agregacao_pneus_fogo",
+            "idx_preventivas_cc_termino",
+            "idx_preventivas_termino",
+            "idx_preventivas_vencimento",
+        ],
+    },
+]
+
+# Consultas representativas das rotas, usadas pelo comando `explicar`.
+CONSULTAS_MONITORADAS = {
+    "GET /api/pneus/inspecoes/<equipamento>": (
+        "SELECT posicao_agregado, data_medicao_iso AS data_medicao, medicao, num_fogo, estado_conservacao, modelo_pneu, medida_pneu "
+        "FROM controle_pneus WHERE equipamento = ? ORDER BY data_medicao_iso DESC",
+        ("X",),
+    ),
+    "GET /api/pneus/historico-medicoes-pneu/<num_fogo>": (
+        """SELECT data_medicao_iso AS data_medicao, medicao
+           FROM controle_pneus
+           WHERE num_fogo = ? AND medicao IS NOT NULL AND data_medicao_iso IS NOT NULL
+           ORDER BY data_medicao_iso DESC""",
+        ("X",),
+    ),
+    "GET /api/pneus/historico-agregacao/<num_fogo>": (
+        """SELECT equipamento, data_entrada, horim_entrada, data_saida, horim_saida, posicao, motivo_desag
+           FROM agregacao_pneus
+           WHERE num_fogo = ?
+           ORDER BY data_entrada_iso DESC, horim_entrada DESC""",
+        ("X",),
+    ),
+    "GET /api/preventivas/realizadas (filtro por contrato e período)": (
+        """SELECT p.datatermino_iso, p.datavencimento_iso, p.hor_termino, p.hor_vencimento, p.tipo
+           FROM preventivas p
+           LEFT JOIN centros_custo_hierarquia contrato ON p.cod_cc = contrato.cod_cc
+           WHERE p.datatermino IS NOT NULL AND p.datatermino != '' AND contrato.cod_cc IN (?)
+             AND p.datatermino_iso >= ? AND p.datatermino_iso < date(?, '+1 day')""",
+        ("X", "2024-01-01", "2024-12-31"),
+    ),
+    "GET /api/preventivas/pendentes-status (filtro por período)": (
+        """SELECT p.datavencimento_iso, p.hor_atual, p.hor_vencimento, p.tipo, contrato.nome_cc
+           FROM preventivas p
+           LEFT JOIN centros_custo_hierarquia contrato ON p.cod_cc = contrato.cod_cc
+           WHERE (p.datatermino IS NULL OR p.datatermino = '')
+             AND p.datavencimento_iso >= ? AND p.datavencimento_iso < date(?, '+1 day')""",
+        ("2024-01-01", "2024-12-31"),
+    ),
+    "GET /api/preventivas/* (núcleo -> contratos)": (
+        "SELECT cod_cc FROM centros_custo_hierarquia WHERE pai_id IN (?)",
+        ("X",),
+    ),
+    "GET /api/preventivas/* (superintendência -> contratos)": (
+        "SELECT cod_cc FROM centros_custo_hierarquia WHERE pai_nucleo IN (?)",
+        ("X",),
+    ),
+    "GET /api/notificacoes/<usuario_id>": (
+        """SELECT n.id, n.icone, n.texto, n.link, n.data_criacao, s.lida
+           FROM notificacoes n
+           JOIN notificacoes_status_usuarios s ON n.id = s.notificacao_id
+           WHERE s.usuario_id = ?
+           ORDER BY n.data_criacao DESC LIMIT 15""",
+        (0,),
+    ),
+    "POST /api/tarefas/<tarefa_id>/chat (MAX(ordem))": (
+        "SELECT MAX(ordem) FROM ga_chat_tarefas WHERE tarefa_id = ?",
+        (0,),
+    ),
+    "POST /api/planos-acao/<plano_id>/chat (MAX(ordem))": (
+        "SELECT MAX(ordem) FROM ga_chat_planos WHERE plano_id = ?",
+        (0,),
+    ),
+    "POST /api/chamados/<chamado_id>/chat (MAX(ordem))": (
+        "SELECT MAX(ordem) FROM chat_chamados WHERE chamado_id = ?",
+        (0,),
+    ),
+}
+
+
+def _garantir_tabela_migracoes(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migracoes (
+            versao INTEGER PRIMARY KEY,
+            descricao TEXT,
+            data_aplicacao TEXT NOT NULL
+        )
+    ''')
+
+
+def _colunas_da_tabela(conn, tabela):
+    return {row[1] for row in conn.execute(f'PRAGMA table_info("{tabela}")').fetchall()}
+
+
+def _indices_desejados(ate_versao=None):
+    """Resolve o conjunto final de índices somando as migrações em ordem de versão."""
+    desejados = {}
+    for migracao in sorted(MIGRACOES, key=lambda m: m["versao"]):
+        if ate_versao is not None and migracao["versao"] > ate_versao:
+            break
+        for nome in migracao.get("remover", []):
+            desejados.pop(nome, None)
+        for nome, tabela, colunas in migracao.get("criar", []):
+            desejados[nome] = (tabela, colunas)
+    return desejados
+
+
+def _criar_indice(conn, nome, tabela, colunas):
+    """Cria o índice se a tabela e todas as colunas existirem. Retorna True se o índice existe ao final."""
+    colunas_existentes = _colunas_da_tabela(conn, tabela)
+    if not colunas_existentes or not set(colunas).issubset(colunas_existentes):
+        return False
+    colunas_sql = ', '.join(f'"{c}"' for c in colunas)
+    conn.execute(f'CREATE INDEX IF NOT EXISTS "{nome}" ON "{tabela}" ({colunas_sql})')
+    return True
+
+
+def versao_atual(conn):
+    _garantir_tabela_migracoes(conn)
+    row = conn.execute("SELECT MAX(versao) FROM schema_migracoes").fetchone()
+    return row[0] or 0
+
+
+def aplicar_migracoes(conn):
+    """
+    Aplica as migrações ainda não registradas em `schema_migracoes` e garante
+    que todos os índices das versões aplicadas existam.
+    Retorna a lista de versões aplicadas nesta chamada.
+    """
+    atual = versao_atual(conn)
+    aplicadas = []
+    for migracao in sorted(MIGRACOES, key=lambda m: m["versao"]):
+        if migracao["versao"] <= atual:
+            continue
+        for nome in migracao.get("remover", []):
+            conn.execute(f'DROP INDEX IF EXISTS "{nome}"')
+        for nome, tabela, colunas in migracao.get("criar", []):
+            _criar_indice(conn, nome, tabela, colunas)
+        conn.execute(
+            "INSERT INTO schema_migracoes (versao, descricao, data_aplicacao) VALUES (?, ?, ?)",
+            (migracao["versao"], migracao["descricao"], datetime.now().strftime('%d/%m/%Y %H:%M:%S'))
+        )
+        aplicadas.append(migracao["versao"])
+    conn.commit()
+    garantir_indices(conn)
+    return aplicadas
+
+
+def garantir_indices(conn, tabelas=None):
+    """
+    Recria os índices das migrações aplicadas que estiverem faltando.
+    Deve ser chamado após qualquer importação que recrie tabelas (if_exists='replace').
+
+    Args:
+        tabelas (list, optional): restringe a verificação a estas tabelas.
+    Returns:
+        list: nomes dos índices presentes nas tabelas verificadas.
+    """
+    _garantir_tabela_migracoes(conn)
+    desejados = _indices_desejados(ate_versao=versao_atual(conn))
+    presentes = []
+    for nome, (tabela, colunas) in desejados.items():
+        if tabelas is not None and tabela not in tabelas:
+            continue
+        if _criar_indice(conn, nome, tabela, colunas):
+            presentes.append(nome)
+    conn.commit()
+    return presentes
+
+
+def init_app(app):
+    """Aplica as migrações pendentes na inicialização da aplicação."""
+    from .db import get_db_connection
+
+    with app.app_context():
+        conn = get_db_connection()
+        try:
+            aplicadas = aplicar_migracoes(conn)
+            if aplicadas:
+                print(f"Migrações de índices aplicadas: {aplicadas}")
+        except sqlite3.Error as e:
+            print(f"Aviso: não foi possível aplicar as migrações de índices: {e}")
+        finally:
+            conn.close()
+
+
+def explicar_consultas(conn):
+    """Executa EXPLAIN QUERY PLAN nas consultas monitoradas e retorna quais índices cada uma usa."""
+    relatorio = []
+    for rota, (sql, params) in CONSULTAS_MONITORADAS.items():
+        try:
+            plano = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+        except sqlite3.Error as e:
+            relatorio.append({"rota": rota, "indices": [], "plano": [f"Erro: {e}"]})
+            continue
+        detalhes = [row[3] for row in plano]
+        indices = []
+        for detalhe in detalhes:
+            if " INDEX " in detalhe:
+                nome = detalhe.split(" INDEX ", 1)[1].split(" ", 1)[0]
+                if nome not in indices:
+                    indices.append(nome)
+        relatorio.append({"rota": rota, "indices": indices, "plano": detalhes})
+    return relatorio
+
+
+def main(argv):
+    from .db import DATABASE_PATH
+
+    comando = argv[1] if len(argv) > 1 else "explicar"
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        if comando == "aplicar":
+            aplicadas = aplicar_migracoes(conn)
+            print(f"✅ Versão atual do schema de índices: {versao_atual(conn)} (aplicadas agora: {aplicadas or 'nenhuma'})")
+        elif comando == "explicar":
+            for item in explicar_consultas(conn):
+                usados = ', '.join(item["indices"]) if item["indices"] else "⚠️ nenhum índice (varredura completa)"
+                print(f"\n{item['rota']}\n  -> Índices: {usados}")
+                for linha in item["plano"]:
+                    print(f"     {linha}")
+        else:
+            print(f"Comando desconhecido: '{comando}'. Use 'aplicar' ou 'explicar'.")
+            return 1
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -370,7 +370,10 @@ cursor.execute('''
 CREATE TABLE IF NOT EXISTS importacoes_bd (
     tabela TEXT NOT NULL,
     caminho TEXT NOT NULL,
-    arquivo TEXT NOT NULL PRIMARY KEY
+    arquivo TEXT NOT NULL PRIMARY KEY,
+    modo_importacao TEXT NOT NULL DEFAULT 'completa',
+    chaves_naturais TEXT,
+    coluna_marca TEXT
 )
 ''')
 print("- Tabela 'importacoes_bd' para controle de importações criada.")
@@ -395,5 +398,11 @@ CREATE TABLE IF NOT EXISTS calendario (
 print("- Tabela 'calendario' criada.")
 
 connection.commit()
+
+# Cria os índices secundários (ver indices.py).
+from indices import aplicar_migracoes
+aplicar_migracoes(connection)
+print("- Índices secundários criados.")
+
 connection.close()
 print("\nEstrutura do banco de dados criada e populada com sucesso!")
@@ -0,0 +1,140 @@
+# backend/versoes_dados.py
+# Versão dos dados de cada tabela, usada nas chaves do cache das rotas.
+#
+# A versão de uma tabela é trocada em dois casos:
+#   - toda escrita confirmada (commit) por uma conexão de escrita do pool (ver db.py): o
+#     autorizador do SQLite informa em que tabelas cada comando escreve (`tabela_escrita`),
+#     então qualquer rota que grava (CRUD de chamados, usuários, etc.) invalida o cache;
+#   - as alterações que têm estruturas derivadas (importação, restauração, edição pela
+#     tela de tabelas) chamam `derivados.tabelas_alteradas`, que troca a versão de novo
+#     depois de reconstruir resumos e hierarquias.
+# Quem escreve por uma conexão fora do pool (ex: o script import_db.py) precisa chamar
+# `registrar_alteracao` ou `tabelas_alteradas` por conta própria.
+#
+# As rotas cacheadas incluem na chave a versão das tabelas que leem (ver
+# `prefixo_versionado`), então podem manter o cache infinito: depois de uma alteração a
+# chave muda e o resultado antigo simplesmente deixa de ser usado.
+#
+# Exemplo:
+#
+#   @bp.route('/analise-estados', methods=['GET'])
+#   @cache.cached(timeout=0, query_string=True, key_prefix=prefixo_versionado('controle_pneus', 'faixas_definicoes'))
+#   def get_analise_estados():
+#       ...
+
+import sqlite3
+import time
+import uuid
+
+from flask import request
+
+VERSOES_TABELA = 'versoes_dados'
+
+# Versão usada para tabelas sem registro (nunca alteradas desde a criação do registro).
+VERSAO_INICIAL = '0'
+
+
+def _nova_versao():
+    # A versão não é um contador: se o banco for substituído por uma cópia antiga,
+    # um contador voltaria a valores já usados e reaproveitaria entradas antigas do cache.
+    return f"{time.time_ns():x}"
+
+
+def garantir_tabela_versoes(conn):
+    """Cria o registro de versões (se preciso), já com uma versão nova para cada tabela existente."""
+    existe = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name = ?", (VERSOES_TABELA,)
+    ).fetchone()
+    if existe:
+        return
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {VERSOES_TABELA} (tabela TEXT PRIMARY KEY, versao TEXT NOT NULL)")
+    tabelas = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'").fetchall()
+    versao = _nova_versao()
+    conn.executemany(
+        f"INSERT OR IGNORE INTO {VERSOES_TABELA} (tabela, versao) VALUES (?, ?)",
+        [(row[0], versao) for row in tabelas]
+    )
+    conn.commit()
+
+
+def registrar_alteracao(conn, tabelas):
+    """Troca a versão das tabelas informadas."""
+    versao = _nova_versao()
+    try:
+        garantir_tabela_versoes(conn)
+        conn.executemany(
+            f"INSERT OR REPLACE INTO {VERSOES_TABELA} (tabela, versao) VALUES (?, ?)",
+            [(tabela, versao) for tabela in dict.fromkeys(tabelas)]
+        )
+        conn.commit()
+    except sqlite3.Error as e:
+        print(f"Aviso: não foi possível registrar a versão de {list(tabelas)}: {e}")
+
+
+# Ações do autorizador do SQLite que alteram a tabela.
+_ACOES_ESCRITA = {
+    sqlite3.SQLITE_INSERT, sqlite3.SQLITE_UPDATE, sqlite3.SQLITE_DELETE,
+    sqlite3.SQLITE_CREATE_TABLE, sqlite3.SQLITE_DROP_TABLE, sqlite3.SQLITE_ALTER_TABLE,
+}
+
+
+def tabela_escrita(acao, arg1, arg2, banco):
+    """
+    Tabela do banco principal alterada por um comando, a partir dos argumentos do
+    autorizador do SQLite (ver `ConexaoPool` em db.py); None se o comando não escreve.
+    """
+    if acao not in _ACOES_ESCRITA:
+        return None
+    if acao == sqlite3.SQLITE_ALTER_TABLE:
+        banco, tabela = arg1, arg2
+    else:
+        tabela = arg1
+    if banco != 'main' or not tabela or tabela == VERSOES_TABELA or tabela.startswith('sqlite_'):
+        return None
+    return tabela
+
+
+def versoes_por_tabela(conn, tabelas):
+    """Retorna um dict tabela -> versão atual."""
+    placeholders = ','.join('?' for _ in tabelas)
+    registros = dict(conn.execute(
+        f"SELECT tabela, versao FROM {VERSOES_TABELA} WHERE tabela IN ({placeholders})", tuple(tabelas)
+    ).fetchall())
+    return {tabela: registros.get(tabela, VERSAO_INICIAL) for tabela in tabelas}
+
+
+def versoes(conn, tabelas):
+    """Retorna um texto com a versão atual de cada tabela (na ordem informada)."""
+    return ','.join(f"{tabela}:{versao}" for tabela, versao in versoes_por_tabela(conn, tabelas).items())
+
+
+def prefixo_versionado(*tabelas):
+    """
+    Retorna um `key_prefix` para o `cache.cached` que inclui a versão das tabelas lidas pela rota.
+    Se o registro não puder ser lido, gera uma chave única (a resposta não vem do cache).
+    """
+    from .db import get_db_read_connection
+
+    def key_prefix():
+        conn = get_db_read_connection()
+        try:
+            versao = versoes(conn, tabelas)
+        except sqlite3.Error:
+            versao = uuid.uuid4().hex
+        finally:
+            conn.close()
+        return f"view/{request.path}|{versao}|"
+
+    return key_prefix
+
+
+def init_app(app):
+    """Cria o registro de versões na inicialização, antes das rotas lerem dele."""
+    from .db import get_db_connection
+
+    with app.app_context():
+        conn = get_db_connection()
+        try:
+            garantir_tabela_versoes(conn)
+        finally:
+            conn.close()
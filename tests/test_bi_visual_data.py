@@ -0,0 +1,97 @@
+# tests/test_bi_visual_data.py
+# Rota /api/bi/visual-data: visuais sem paginação por cursor (top N e cartão sem GROUP BY)
+# e limite de memória do cache de resultados.
+#
+# Uso, a partir da raiz do projeto:
+#   python -m pytest -q tests
+
+import sqlite3
+
+import pytest
+
+import backend.db as db
+import backend.Rotas.bi as bi
+from backend import create_app, cache
+
+VENDAS = [('a', 1.0), ('b', 5.0), ('a', 2.0), ('c', 4.0), ('d', 0.5)]
+
+
+@pytest.fixture(scope='module')
+def cliente(tmp_path_factory):
+    caminho = str(tmp_path_factory.mktemp('bi') / 'database.db')
+    conn = sqlite3.connect(caminho)
+    conn.execute("CREATE TABLE vendas (produto TEXT, valor REAL)")
+    conn.executemany("INSERT INTO vendas VALUES (?, ?)", VENDAS)
+    conn.execute("CREATE TABLE bi_tables (id INTEGER PRIMARY KEY AUTOINCREMENT, tabela TEXT)")
+    conn.execute(
+        "CREATE TABLE bi_relacionamentos (id INTEGER PRIMARY KEY AUTOINCREMENT, tabela_origem TEXT NOT NULL, "
+        "coluna_origem TEXT NOT NULL, tabela_destino TEXT NOT NULL, coluna_destino TEXT NOT NULL)"
+    )
+    conn.commit()
+    conn.close()
+
+    caminho_anterior = db.DATABASE_PATH
+    db.DATABASE_PATH = caminho
+    try:
+        app = create_app()
+        cache.init_app(app, config={'CACHE_TYPE': 'NullCache'})
+        yield app.test_client()
+    finally:
+        db.DATABASE_PATH = caminho_anterior
+
+
+def _campo(coluna, agregacao=None):
+    campo = {'tableName': 'vendas', 'columnName': coluna, 'originalColumn': coluna}
+    if agregacao:
+        campo['aggregation'] = agregacao
+    return campo
+
+
+def test_cartao_sem_group_by(cliente):
+    resposta = cliente.post('/api/bi/visual-data', json={'visual': {'value': _campo('valor', 'sum')}, 'pageFilters': []})
+
+    assert resposta.status_code == 200
+    corpo = resposta.get_json()
+    assert len(corpo['data']) == 1
+    assert list(corpo['data'][0].values()) == [sum(valor for _, valor in VENDAS)]
+    assert corpo['proximo_cursor'] is None
+
+
+def test_top_n(cliente):
+    visual = {
+        'xAxis': [_campo('produto')],
+        'yAxis': [_campo('valor', 'sum')],
+        'filters': [{
+            **_campo('valor', 'sum'), 'columnName': 'produto',
+            'filterConfig': {'type': 'top_n', 'topN': {'direction': 'superior', 'value': 2}},
+        }],
+    }
+    resposta = cliente.post('/api/bi/visual-data', json={'visual': visual, 'pageFilters': []})
+
+    assert resposta.status_code == 200
+    corpo = resposta.get_json()
+    assert [linha['produto'] for linha in corpo['data']] == ['b', 'c']
+    assert corpo['proximo_cursor'] is None
+
+
+def test_cache_de_resultados_limitado_por_memoria(monkeypatch):
+    monkeypatch.setattr(bi, '_resultados', bi.OrderedDict())
+    monkeypatch.setattr(bi, '_resultados_por_tabela', {})
+    monkeypatch.setattr(bi, '_versoes_vistas', {'vendas': 1})
+    monkeypatch.setattr(bi, '_memoria_resultados', 0)
+    linhas = [{'produto': 'x' * 1000, 'valor': 1.0} for _ in range(10)]
+    resultado = (linhas, None)
+    tamanho = bi._tamanho_resultado(('q0', ()), resultado)
+    monkeypatch.setattr(bi, 'MEMORIA_RESULTADOS_MAX', tamanho * 2)
+
+    for i in range(4):
+        bi.guardar_resultado((f'q{i}', ()), {'vendas': 1}, resultado)
+
+    # Só os dois usados mais recentemente cabem no limite.
+    assert list(bi._resultados) == [('q2', ()), ('q3', ())]
+    assert bi._memoria_resultados == sum(item[2] for item in bi._resultados.values())
+    assert bi._resultados_por_tabela['vendas'] == {('q2', ()), ('q3', ())}
+
+    # Um resultado maior que o limite fica sozinho.
+    bi.guardar_resultado(('grande', ()), {'vendas': 1}, (linhas * 3, None))
+    assert list(bi._resultados) == [('grande', ())]
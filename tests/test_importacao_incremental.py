@@ -0,0 +1,36 @@
+# tests/test_importacao_incremental.py
+# Importação incremental (backend/importacao.py) de arquivos com colunas vazias.
+#
+# Uso, a partir da raiz do projeto:
+#   python -m pytest -q tests
+
+import sqlite3
+
+from backend.importacao import MODO_INCREMENTAL, importar_arquivo, importar_incremental
+
+CABECALHO = ['numos', 'tipo', 'motivo_atraso']
+
+
+def _escrever(caminho, linhas):
+    with open(caminho, 'w', encoding='utf-8') as arquivo:
+        arquivo.write(';'.join(CABECALHO) + '\n')
+        for linha in linhas:
+            arquivo.write(';'.join('' if valor is None else str(valor) for valor in linha) + '\n')
+
+
+def test_coluna_vazia_nao_forca_importacao_completa(tmp_path):
+    # Como o PREVENTIVAS.xlsx: a coluna motivo_atraso vem sempre vazia e não é criada na tabela.
+    primeiro = tmp_path / 'v1.csv'
+    segundo = tmp_path / 'v2.csv'
+    _escrever(primeiro, [(1, 'Tempo', None), (2, 'Marco', None), (3, 'Tempo', None)])
+    _escrever(segundo, [(1, 'Tempo', None), (2, 'Tempo', None), (4, 'Marco', None)])
+
+    conn = sqlite3.connect(':memory:')
+    importar_arquivo(conn, 'preventivas', str(primeiro))
+    assert 'motivo_atraso' not in [linha[1] for linha in conn.execute('PRAGMA table_info("preventivas")')]
+
+    resultado = importar_incremental(conn, 'preventivas', str(segundo), ['numos'])
+
+    assert resultado['modo'] == MODO_INCREMENTAL, resultado['motivo']
+    assert (resultado['inseridas'], resultado['atualizadas'], resultado['removidas']) == (1, 1, 1)
+    assert conn.execute('SELECT numos, tipo FROM preventivas ORDER BY numos').fetchall() == [(1, 'Tempo'), (2, 'Tempo'), (4, 'Marco')]